@@ -1,9 +1,9 @@
-from fastapi import FastAPI, WebSocket
+from fastapi import FastAPI, WebSocket, Request, Response
 import grpc
 import sys
 import os
 import time
-import psycopg2  # Add this import for PostgreSQL
+import logging
 from dotenv import load_dotenv  # Add this for environment variables
 import asyncio
 
@@ -11,6 +11,7 @@ from fastapi import HTTPException, Body
 from pydantic import BaseModel
 from typing import List, Optional
 import sqlite3
+import struct
 import uuid
 import json
 from datetime import datetime, timedelta
@@ -20,29 +21,37 @@ sys.path.append("..")
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import control_pb2
 import control_pb2_grpc
+from metrics import REGISTRY, CONTENT_TYPE
+from psycopg_pool import PoolTimeout
+from db import Database
+from grpc_channels import GrpcChannels, GRPC_TIMEOUT, GRPC_HISTORY_TIMEOUT
+from ws_fanout import ConnectionManager
+from latest_window import LatestWindow
+from bulk_upload import BULK_BATCH_SIZE, BulkFormatError, body_format, parse_records
+import export
+import logs
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from starlette.websockets import WebSocketDisconnect
 
 # Load environment variables
 load_dotenv()
 
-# Database connection setup
-def get_db_connection():
-    """Create and return a database connection"""
-    return psycopg2.connect(
-            #host="sql",
-            host="172.90.0.40",
-            port="5432",
-            database="mydb",
-            user="user",
-            password="password"
-            )
-    
+logs.setup_logging()
+log = logging.getLogger("api")
+
+# Latest values sent with each real-time WebSocket update
+STREAM_WINDOW = int(os.getenv("STREAM_WINDOW", "10"))
 
-# Create a connection pool or global connection
-# For simplicity, we'll use a global connection, but in production
-# you might want to use a connection pool
-conn = get_db_connection()
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time to answer an HTTP request, by method, route and status",
+    ("method", "route", "status"))
+REGISTRY.gauges(logs.stats, prefix="log_")
+
+# Database connection pool; each query checks out its own connection
+db = Database()
+REGISTRY.gauges(db.stats, prefix="db_pool_")
+REGISTRY.gauges(db.stream_stats, prefix="db_stream_pool_")
 
 app = FastAPI()
 app.add_middleware(
@@ -53,12 +62,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# gRPC client setup
+
+@app.middleware("http")
+async def record_request_latency(request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # The route template, so /samples/{sample_id} is one series
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, request.method,
+                                     route.path if route else "unmatched", str(status))
+
+# gRPC channels shared by every request, opened at startup
+grpc_channels = GrpcChannels()
+REGISTRY.gauges(grpc_channels.stats, prefix="grpc_")
+
 def get_grpc_client():
-    """Create and return a gRPC client connection"""
-    #channel = grpc.insecure_channel(os.getenv("GRPC_SERVER", "localhost:50051"))
-    channel = grpc.insecure_channel(os.getenv("GRPC_SERVER", "172.90.0.33:50051"))
-    return control_pb2_grpc.ControlServiceStub(channel)
+    """ControlService stub on the next gRPC server's shared channel"""
+    return grpc_channels.stub()
 
 
 # Models for sample data
@@ -84,32 +109,12 @@ class SampleResponse(BaseModel):
     dataPoints: int
 
 
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        print(f"Client connected. Total connections: {len(self.active_connections)}")
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-        print(f"Client disconnected. Remaining connections: {len(self.active_connections)}")
-
-    async def broadcast(self, message: dict):
-        """Send a message to all connected clients"""
-        if not self.active_connections:
-            return
-        
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                print(f"Error sending to client: {e}")
-
+# WebSocket connection manager; each client has its own bounded send queue (see ws_fanout)
 manager = ConnectionManager()
+REGISTRY.gauges(manager.stats, prefix="websocket_")
+
+# Latest values for the WebSocket updates, fed by /send and the gRPC stream
+latest = LatestWindow(STREAM_WINDOW)
 
 
 
@@ -123,27 +128,16 @@ async def websocket_endpoint(websocket: WebSocket):
     
     # Send initial data to the client when they connect
     try:
-        # Fetch latest data from database
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT value FROM sensor_data
-            ORDER BY timestamp DESC
-            LIMIT 10
-        """)
-        results = cursor.fetchall()
-        cursor.close()
-        
-        # Extract values from results
-        values = [row[0] for row in results]
+        values = await latest.latest(db)
         
         # Send initial data
-        await websocket.send_json({
+        manager.send(websocket, {
             "type": "update",
             "valores": values,
             "status": "Connected to real-time feed"
         })
     except Exception as e:
-        print(f"Error sending initial data: {e}")
+        log.error("Error sending initial data: %s", e)
     
     try:
         # Keep the connection alive and handle client messages
@@ -154,70 +148,76 @@ async def websocket_endpoint(websocket: WebSocket):
             # Handle different message types
             if "command" in data:
                 if data["command"] == "fetch_latest":
-                    # Fetch latest data and send it
-                    cursor = conn.cursor()
-                    cursor.execute("""
-                        SELECT value FROM sensor_data
-                        ORDER BY timestamp DESC
-                        LIMIT 5
-                    """)
-                    results = cursor.fetchall()
-                    cursor.close()
-                    
-                    values = [row[0] for row in results]
-                    await websocket.send_json({
+                    # Send the latest values, the same window as the updates
+                    values = await latest.latest(db)
+                    manager.send(websocket, {
                         "type": "update",
                         "valores": values,
                         "requestId": data.get("requestId")
                     })
                 elif data["command"] == "ping":
                     # Simple ping-pong to keep connection alive
-                    await websocket.send_json({
+                    manager.send(websocket, {
                         "type": "pong",
                         "timestamp": time.time()
                     })
     except WebSocketDisconnect:
         manager.disconnect(websocket)
-        print("Client disconnected normally")
+        log.debug("Client disconnected normally")
     except Exception as e:
-        print(f"WebSocket error: {e}")
+        log.error("WebSocket error: %s", e)
         manager.disconnect(websocket)
 
-async def notify_clients_of_new_data(new_value):
-    """Notify all connected WebSocket clients about new data"""
+async def broadcast_window(message, timestamp=None):
+    """Send the latest window to every WebSocket client.
+
+    The one broadcast path: /send, /send/bulk and the gRPC stream call it
+    only when latest.add() (or refresh()) reports that their rows changed
+    the window, so a value that reaches the backend through more than one
+    of them is broadcast once, and every update has STREAM_WINDOW values.
+    """
+    values = await latest.latest(db)
+    await manager.broadcast({
+        "type": "update",
+        "valores": values,
+        "sequence": latest.sequence,
+        "timestamp": time.time() if timestamp is None else timestamp,
+        "message": message
+    })
+    log.debug("Notified %d clients of new data", len(manager.active_connections))
+
+async def notify_clients_of_new_data(sequence, new_value):
+    """Notify all connected WebSocket clients about new data
+
+    sequence is the stored row's id. It is 0 when the row is not committed
+    yet; the value then reaches the window, and the clients, through the
+    gRPC stream.
+    """
     try:
-        # Fetch a few recent values to provide context
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT value FROM sensor_data
-            ORDER BY timestamp DESC
-            LIMIT 5
-        """)
-        results = cursor.fetchall()
-        cursor.close()
-        
-        values = [row[0] for row in results]
-        
-        # Broadcast to all connected clients
-        await manager.broadcast({
-            "type": "update",
-            "valores": values,
-            "timestamp": time.time(),
-            "message": "New data received"
-        })
-        
-        print(f"Notified {len(manager.active_connections)} clients of new data")
+        if sequence and latest.add([(sequence, new_value)]):
+            await broadcast_window("New data received")
     except Exception as e:
-        print(f"Error notifying clients: {e}")
+        log.error("Error notifying clients: %s", e)
 
 @app.get("/history")
-async def get_historical_data(timeRange: str = "24h"):
-    """Get historical data from the database (maps to gRPC GetHistoricalData)"""
+async def get_historical_data(timeRange: str = "24h", max_points: int = 0, aggregation: str = "minmax",
+                              channel: str = ""):
+    """Get historical data from the database (maps to gRPC GetHistoricalData)
+
+    max_points > 0 asks the gRPC server to downsample the range to about that
+    many points using aggregation ("minmax", "avg" or "lttb"). channel
+    restricts the data to one channel; empty returns every channel.
+    """
     try:
         # Use gRPC client to get historical data
         grpc_client = get_grpc_client()
-        request = control_pb2.HistoricalDataRequest(timeRange=timeRange)
-        response = grpc_client.GetHistoricalData(request)
+        request = control_pb2.HistoricalDataRequest(
+            timeRange=timeRange,
+            max_points=max_points,
+            aggregation=aggregation,
+            channel=channel
+        )
+        response = await grpc_client.GetHistoricalData(request, timeout=GRPC_HISTORY_TIMEOUT)
         
         if response.success:
             # Format the data for the API response
@@ -233,7 +233,9 @@ async def get_historical_data(timeRange: str = "24h"):
                 "success": True,
                 "data": data,
                 "timeRange": timeRange,
-                "count": len(data)
+                "count": len(data),
+                "aggregation": response.aggregation,
+                "resolution": response.resolution
             }
         else:
             # If gRPC failed, fall back to direct database query
@@ -248,25 +250,22 @@ async def get_historical_data(timeRange: str = "24h"):
             elif timeRange == "30d":
                 time_filter = "30 days"
             
-            cursor = conn.cursor()
-            
             if timeRange == "all":
                 # Get all data (with reasonable limit)
-                cursor.execute("""
-                    SELECT value, timestamp FROM sensor_data
+                results = await db.fetchall("""
+                    SELECT value, timestamp, server FROM sensor_data
+                    WHERE %(channel)s = '' OR server = %(channel)s
                     ORDER BY timestamp DESC
                     LIMIT 1000
-                """)
+                """, {"channel": channel})
             else:
                 # Get data within time range
-                cursor.execute("""
-                    SELECT value, timestamp FROM sensor_data
-                    WHERE timestamp > NOW() - INTERVAL %s
+                results = await db.fetchall("""
+                    SELECT value, timestamp, server FROM sensor_data
+                    WHERE timestamp > NOW() - %(time_filter)s::interval
+                    AND (%(channel)s = '' OR server = %(channel)s)
                     ORDER BY timestamp DESC
-                """, (time_filter,))
-            
-            results = cursor.fetchall()
-            cursor.close()
+                """, {"time_filter": time_filter, "channel": channel})
             
             # Format the response data
             data = []
@@ -274,7 +273,7 @@ async def get_historical_data(timeRange: str = "24h"):
                 data.append({
                     "value": row[0],
                     "timestamp": row[1].isoformat() if hasattr(row[1], 'isoformat') else str(row[1]),
-                    "server": "main-server"  # You can add more metadata as needed
+                    "server": row[2] or "main-server"
                 })
             
             return {
@@ -284,50 +283,162 @@ async def get_historical_data(timeRange: str = "24h"):
                 "count": len(data)
             }
     except Exception as e:
-        print(f"Error retrieving historical data: {e}")
+        log.error("Error retrieving historical data: %s", e)
         return {
             "success": False,
             "error": str(e),
             "data": []
         }
 
+@app.get("/history/columns")
+async def get_historical_columns(timeRange: str = "24h", max_points: int = 0, aggregation: str = "minmax",
+                                 channel: str = "", format: str = "json"):
+    """Historical data as columns (maps to gRPC GetHistoricalColumns)
+
+    timestamps are epoch microseconds and server_index points into servers.
+    format="protobuf" returns the serialized HistoricalDataColumns message
+    (application/x-protobuf) untouched, for clients that decode it themselves:
+    its columns are packed little-endian arrays, read e.g. with a typed array.
+    """
+    if format not in ("json", "protobuf"):
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+    try:
+        grpc_client = get_grpc_client()
+        request = control_pb2.HistoricalDataRequest(
+            timeRange=timeRange,
+            max_points=max_points,
+            aggregation=aggregation,
+            channel=channel
+        )
+        response = await grpc_client.GetHistoricalColumns(request, timeout=GRPC_HISTORY_TIMEOUT)
+        if format == "protobuf":
+            return Response(content=response.SerializeToString(), media_type="application/x-protobuf")
+        return {
+            "success": response.success,
+            # Packed little-endian int64 and int32 arrays of response.count rows
+            "timestamps": list(struct.unpack(f"<{response.count}q", response.timestamps)),
+            "values": list(struct.unpack(f"<{response.count}i", response.values)),
+            "servers": list(response.servers),
+            "server_index": list(struct.unpack(f"<{response.count}i", response.server_index)),
+            "timeRange": timeRange,
+            "count": response.count,
+            "aggregation": response.aggregation,
+            "resolution": response.resolution
+        }
+    except Exception as e:
+        log.error("Error retrieving historical columns: %s", e)
+        return {
+            "success": False,
+            "error": str(e),
+            "timestamps": [],
+            "values": []
+        }
+
+@app.get("/history/export")
+async def export_historical_data(format: str = "csv", compression: str = "none", timeRange: str = "all",
+                                 start: str = "", end: str = "", channel: str = ""):
+    """Every row of a range as a file download, streamed from the database
+
+    format is "csv", "ndjson" or "parquet"; compression "none", "gzip" or
+    "zstd" wraps the CSV and NDJSON output and sets the Parquet page codec.
+    timeRange works as for /history, with "all" for no limit; start and end
+    (ISO 8601, end exclusive) and channel narrow the range further. Rows are
+    sent oldest first, EXPORT_CHUNK_ROWS at a time, so the whole range is
+    never held in memory. Exports read over their own DB_STREAM_POOL_MAX
+    connections; when those stay busy the request gets 503.
+    """
+    try:
+        if format not in export.FORMATS:
+            raise ValueError(f"Unsupported format '{format}', expected one of {', '.join(export.FORMATS)}")
+        if compression not in export.COMPRESSIONS:
+            raise ValueError(f"Unsupported compression '{compression}', expected one of {', '.join(export.COMPRESSIONS)}")
+        query, params = export.export_query(timeRange, export.parse_bound(start, "start"),
+                                            export.parse_bound(end, "end"), channel)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    content_type, extension = export.media_type(format, compression)
+    filename = f"sensor_data_{channel or 'all'}_{timeRange}.{extension}"
+
+    chunks = db.stream(query, params, export.EXPORT_CHUNK_ROWS)
+    try:
+        # Take a stream connection and run the query before the headers go
+        # out, so a busy stream pool or a failing query gets an error response
+        # instead of a download that is cut short
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = None  # Empty range; the connection is already back in the pool
+    except PoolTimeout:
+        raise HTTPException(status_code=503, detail="Too many exports in progress, try again later")
+    except Exception as e:
+        log.error("Export of %s failed: %s", filename, e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def body():
+        exported = 0
+
+        async def rows():
+            nonlocal exported
+            if first is None:
+                return
+            exported += len(first)
+            yield first
+            async for chunk in chunks:
+                exported += len(chunk)
+                yield chunk
+
+        try:
+            async for data in export.export_rows(rows(), format, compression):
+                yield data
+        except Exception as e:
+            # The headers are already sent; the client sees the download cut short
+            log.error("Export of %s failed after %d rows: %s", filename, exported, e)
+            raise
+        finally:
+            # Return the stream connection also when the client goes away mid-download
+            await chunks.aclose()
+        log.info("Exported %d rows as %s", exported, filename)
+
+    return StreamingResponse(body(), media_type=content_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
 @app.get("/data")
-async def get_data(interval: int = 5000):
-    """Get current data with dynamic limit based on interval (maps to gRPC GetData)"""
+async def get_data(interval: int = 5000, channel: str = ""):
+    """Get current data with dynamic limit based on interval (maps to gRPC GetData)
+
+    channel restricts the values to one channel; empty reads every channel.
+    """
     try:
         # Try to use gRPC service first
         try:
             grpc_client = get_grpc_client()
-            request = control_pb2.DataRequest(mensaje="get_current_data", interval=interval)
-            response = grpc_client.GetData(request)
+            request = control_pb2.DataRequest(mensaje="get_current_data", interval=interval, channel=channel)
+            response = await grpc_client.GetData(request, timeout=GRPC_TIMEOUT)
             
             # If we got a valid response, return it
             if response.estado == "OK":
-                print(f"api.py: get_data: estado: \"OK\" (via gRPC)")
-                for val in response.valores:
-                    print(f"valores: {val}")
+                log.debug("get_data: estado OK via gRPC, valores: %s", response.valores)
                 
                 return {
                     "estado": response.estado,
                     "valores": list(response.valores),
-                    "interval": interval
+                    "interval": interval,
+                    "channel": channel
                 }
         except Exception as grpc_error:
-            print(f"gRPC error, falling back to direct DB: {grpc_error}")
+            log.warning("gRPC error, falling back to direct DB: %s", grpc_error)
             # Proceed to direct DB query on error
         
         # Calculate a reasonable number of records based on the interval
         # Shorter intervals = fewer records, longer intervals = more records
         limit = max(5, min(20, int(30000 / interval)))
-        print(f"get_data: limit of elements: {limit}")
-        cursor = conn.cursor()
-        cursor.execute("""
+        log.debug("get_data: limit of elements: %d", limit)
+        results = await db.fetchall("""
             SELECT value FROM sensor_data
+            WHERE %(channel)s = '' OR server = %(channel)s
             ORDER BY timestamp DESC
-            LIMIT %s
-        """, (limit,))
-        results = cursor.fetchall()
-        cursor.close()
+            LIMIT %(limit)s
+        """, {"channel": channel, "limit": limit})
         
         # Extract values from results
         values = [row[0] for row in results]
@@ -336,30 +447,62 @@ async def get_data(interval: int = 5000):
         while len(values) < 5:
             values.append(0)
         
-        print(f"api.py: get_data: estado: \"OK\"")
-        for val in values:
-            print(f"valores: {val}")
+        log.debug("get_data: estado OK, valores: %s", values)
         
         return {
             "estado": "OK",
             "valores": values,
-            "interval": interval
+            "interval": interval,
+            "channel": channel
         }
     except Exception as e:
-        print(f"Error fetching data: {e}")
+        log.error("Error fetching data: %s", e)
         return {
             "estado": "ERROR",
             "valores": [0, 0, 0, 0, 0],
             "error": str(e)
         }
 
+@app.get("/channels/latest")
+async def get_latest_by_channel(channels: str = "", limit: int = 10):
+    """Latest values of several channels in one call (maps to gRPC GetLatestByChannel)
+
+    channels is a comma-separated list; empty returns every channel in use.
+    """
+    try:
+        grpc_client = get_grpc_client()
+        request = control_pb2.ChannelWindowRequest(
+            channels=[channel for channel in channels.split(",") if channel],
+            limit=limit
+        )
+        response = await grpc_client.GetLatestByChannel(request, timeout=GRPC_TIMEOUT)
+        return {
+            "success": response.success,
+            "channels": {
+                window.channel: {
+                    "valores": list(window.valores),
+                    "sequences": list(window.sequences)
+                }
+                for window in response.windows
+            }
+        }
+    except Exception as e:
+        log.error("Error retrieving channel windows: %s", e)
+        return {
+            "success": False,
+            "error": str(e),
+            "channels": {}
+        }
+
 @app.post("/send")
 async def send_data(data: dict):
     """Send data to the database and notify connected clients (maps to gRPC SendData)"""
     try:
         # Extract the value from the request
+        channel = ""
         if isinstance(data, dict):
             value = data.get("value", 0)
+            channel = data.get("channel", "")
         else:
             # Try to parse the data if it's not already a dict
             value = int(data)
@@ -367,12 +510,12 @@ async def send_data(data: dict):
         # Try to use gRPC service first
         try:
             grpc_client = get_grpc_client()
-            request = control_pb2.DataRequest(mensaje=str(value), interval=0)
-            response = grpc_client.SendData(request)
+            request = control_pb2.DataRequest(mensaje=str(value), interval=0, channel=channel)
+            response = await grpc_client.SendData(request, timeout=GRPC_TIMEOUT)
             
             if response.success:
                 # Notify all connected WebSocket clients
-                await notify_clients_of_new_data(value)
+                await notify_clients_of_new_data(response.sequence, int(request.mensaje))
                 
                 return {
                     "success": True,
@@ -380,22 +523,19 @@ async def send_data(data: dict):
                     "value": value
                 }
         except Exception as grpc_error:
-            print(f"gRPC error, falling back to direct DB: {grpc_error}")
+            log.warning("gRPC error, falling back to direct DB: %s", grpc_error)
             # Continue with direct DB insertion on error
         
         # Insert into database
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO sensor_data (value)
-            VALUES (%s)
-            RETURNING id
-        """, (value,))
-        record_id = cursor.fetchone()[0]
-        conn.commit()
-        cursor.close()
+        row = await db.fetchone("""
+            INSERT INTO sensor_data (value, server)
+            VALUES (%s, %s)
+            RETURNING id, value
+        """, (value, channel or "main-server"))
+        record_id = row[0]
         
         # Notify all connected WebSocket clients
-        await notify_clients_of_new_data(value)
+        await notify_clients_of_new_data(record_id, row[1])
         
         return {
             "success": True,
@@ -403,12 +543,118 @@ async def send_data(data: dict):
             "value": value
         }
     except Exception as e:
-        print(f"Error in send_data: {e}")
+        log.error("Error in send_data: %s", e)
         return {
             "success": False,
             "error": str(e)
         }
 
+@app.post("/send/bulk")
+async def send_bulk(request: Request, channel: str = ""):
+    """Store many values from one request body (maps to gRPC SendDataStream)
+
+    The body is a JSON array, NDJSON or CSV, as given by Content-Type. Each
+    record is a value or {"value": ..., "channel": ...} (a value,channel row
+    in CSV); channel applies to records without one. Records are forwarded
+    over one SendDataStream call as they are parsed, and every batch the
+    server commits reaches the WebSocket clients as one stream update. If no
+    gRPC server is reachable, rows are written with COPY in batches of
+    BULK_BATCH_SIZE instead, with one broadcast per batch.
+    """
+    content_type = request.headers.get("content-type")
+    body = body_format(content_type)
+    if body is None:
+        raise HTTPException(status_code=415, detail=f"Unsupported Content-Type: {content_type}; "
+                                                    "use application/json, application/x-ndjson or text/csv")
+    records = parse_records(request.stream(), body, channel)
+
+    grpc_client = await grpc_channels.ready_stub(GRPC_TIMEOUT)
+    if grpc_client is not None:
+        forwarded = 0
+        format_error = None
+
+        async def data_requests():
+            nonlocal forwarded, format_error
+            try:
+                async for value, record_channel in records:
+                    forwarded += 1
+                    yield control_pb2.DataRequest(mensaje=value, channel=record_channel)
+            except BulkFormatError as e:
+                # gRPC only sees the stream cancelled; keep the reason for the reply
+                format_error = e
+                raise
+
+        try:
+            # No deadline: the upload lasts as long as the client keeps sending
+            response = await grpc_client.SendDataStream(data_requests())
+        except asyncio.CancelledError:
+            # Also how the call ends when its request iterator raises
+            if format_error is None:
+                raise
+            raise HTTPException(status_code=400, detail=f"{format_error} (after {forwarded} records)")
+        except Exception as e:
+            if format_error is not None:
+                raise HTTPException(status_code=400, detail=f"{format_error} (after {forwarded} records)")
+            log.error("Error in send_bulk after %d records: %s", forwarded, e)
+            return {"success": False, "error": str(e), "forwarded": forwarded}
+        return {
+            "success": response.success,
+            "message": response.recibido,
+            "stored": response.stored,
+            "rejected": response.rejected,
+            "batches": len(response.batches),
+            "rows_per_second": response.rows_per_second
+        }
+
+    log.warning("No gRPC server reachable, storing bulk upload with COPY")
+    stored = 0
+    rejected = 0
+    batches = 0
+    start = time.perf_counter()
+    rows = []
+
+    async def copy_batch():
+        nonlocal stored, batches
+        await db.copy_rows("COPY sensor_data (value, server) FROM STDIN", rows)
+        stored += len(rows)
+        batches += 1
+        # One update for the whole batch; COPY returns no ids, so read back the window
+        if await latest.refresh(db):
+            await broadcast_window(f"{len(rows)} new values received")
+        rows.clear()
+
+    try:
+        async for value, record_channel in records:
+            try:
+                rows.append((int(value), record_channel or "main-server"))
+            except ValueError:
+                rejected += 1
+                continue
+            if len(rows) >= BULK_BATCH_SIZE:
+                await copy_batch()
+        if rows:
+            await copy_batch()
+    except BulkFormatError as e:
+        # Batches already copied stay stored
+        raise HTTPException(status_code=400, detail=f"{e} (after storing {stored} values)")
+    except Exception as e:
+        log.error("Error in send_bulk after storing %d values: %s", stored, e)
+        return {"success": False, "error": str(e), "stored": stored}
+    elapsed = time.perf_counter() - start
+    return {
+        "success": True,
+        "message": f"Stored {stored} values in {batches} batches",
+        "stored": stored,
+        "rejected": rejected,
+        "batches": batches,
+        "rows_per_second": stored / elapsed if elapsed > 0 else 0.0
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """Request latencies and WebSocket counters in the Prometheus text format"""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
 # Add an endpoint to handle connection errors or reconnection
 @app.get("/status")
 async def get_status():
@@ -421,34 +667,25 @@ async def get_status():
     }
     
     # Check database connection
+    # The pool replaces broken connections itself, so a failed check needs no reconnect
     try:
-        global conn
-        # If connection is closed, try to reconnect
-        if conn.closed:
-            conn = get_db_connection()
-        
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1")
-        cursor.close()
+        await db.fetchone("SELECT 1")
         status["database_connected"] = True
     except Exception as db_error:
         status["database_error"] = str(db_error)
-        # Try to reconnect
-        try:
-            conn = get_db_connection()
-            status["database_reconnected"] = True
-        except:
-            status["database_reconnected"] = False
+    status["database_pool"] = db.stats()
+    status["database_stream_pool"] = db.stream_stats()
     
     # Check gRPC connection
     try:
         grpc_client = get_grpc_client()
         # Simple ping (use an empty request if available, or a minimal one)
         request = control_pb2.DataRequest(mensaje="ping", interval=0)
-        response = grpc_client.GetData(request)
+        response = await grpc_client.GetData(request, timeout=GRPC_TIMEOUT)
         status["grpc_connected"] = True
     except Exception as grpc_error:
         status["grpc_error"] = str(grpc_error)
+    status["grpc_channels"] = grpc_channels.states()
     
     return status
 # Initialize sample database tables
@@ -472,39 +709,32 @@ def init_sample_db():
 @app.on_event("startup")
 async def startup_event():
     """Executed when the application starts"""
-    print("FastAPI application starting up")
+    log.info("FastAPI application starting up")
+    await grpc_channels.open()
     
-    # Verify database connection
+    # Open the pool; it keeps retrying in the background if the database is down
+    await db.open()
     try:
-        global conn
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1")
-        cursor.close()
-        print("Database connection established")
+        await db.fetchone("SELECT 1")
+        log.info("Database connection established")
     except Exception as e:
-        print(f"Failed to connect to database: {e}")
-        # Try to reconnect
-        try:
-            conn = get_db_connection()
-            print("Database reconnection successful")
-        except Exception as reconnect_error:
-            print(f"Database reconnection failed: {reconnect_error}")
+        log.error("Failed to connect to database: %s", e)
     init_sample_db()
-    print("Sample database initialized")
+    log.info("Sample database initialized")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Executed when the application shuts down"""
-    print("FastAPI application shutting down")
+    log.info("FastAPI application shutting down")
     
-    # Close database connection
+    await grpc_channels.close()
+
+    # Close the database connection pool
     try:
-        global conn
-        if not conn.closed:
-            conn.close()
-            print("Database connection closed")
+        await db.close()
+        log.info("Database connection pool closed")
     except Exception as e:
-        print(f"Error closing database connection: {e}")
+        log.error("Error closing database connection pool: %s", e)
 
 @app.on_event("startup")
 async def start_grpc_streaming():
@@ -516,7 +746,7 @@ async def start_grpc_streaming():
             # This will re-raise any exception that occurred in the task
             task.result()
         except Exception as e:
-            print(f"Background task error: {e}")
+            log.error("Background task error: %s", e)
             # Don't let this crash the application
     
     task.add_done_callback(handle_task_exception)
@@ -666,45 +896,55 @@ async def compare_samples(sample_ids: List[str] = Body(...)):
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 async def connect_to_grpc_stream():
-    """Connect to gRPC streaming service and handle updates"""
-    print("Starting gRPC streaming connection")
+    """Connect to gRPC streaming service and handle updates
+
+    The stream is incremental: only new samples arrive, each with its
+    sequence number. After a disconnect it resumes from the last sequence
+    received, so samples stored in the meantime are replayed, not lost.
+    """
+    log.info("Starting gRPC streaming connection")
     consecutive_errors = 0
+    last_sequence = 0
     
     while True:
         try:
-            # Create a non-blocking channel
-            channel = grpc.aio.insecure_channel(os.getenv("GRPC_SERVER", "localhost:50051"))
-            stub = control_pb2_grpc.ControlServiceStub(channel)
+            # Each reconnect may go to another server when several are configured
+            stub = get_grpc_client()
             
-            request = control_pb2.StreamRequest(interval=5000, clientId="api-server")
-            consecutive_errors = 0
+            request = control_pb2.StreamRequest(interval=5000, clientId="api-server",
+                                                incremental=True, resume_from=last_sequence)
             
-            print("Starting data stream from gRPC server")
+            log.info("Starting data stream from gRPC server after sequence %d", last_sequence)
+            consecutive_errors = 0
             async for response in stub.StreamData(request):
                 if response.estado == "OK":
-                    values = list(response.valores)
-                    print(f"Received streaming update with values: {values}")
+                    changed = latest.add(zip(response.sequences, response.valores))
+                    if response.sequences:
+                        last_sequence = response.sequences[-1]
+                    log.debug("Received %d new values up to sequence %d", len(response.valores), last_sequence)
                     
-                    # Broadcast to all connected WebSocket clients
-                    await manager.broadcast({
-                        "type": "update",
-                        "valores": values,
-                        "timestamp": response.timestamp,
-                        "message": "Real-time data update"
-                    })
+                    # Values /send already broadcast leave the window unchanged
+                    if changed:
+                        await broadcast_window("Real-time data update", response.timestamp)
                     
                     # Explicitly yield control back to the event loop
                     await asyncio.sleep(0)
                 else:
-                    print(f"Received error from stream: {response.estado}")
+                    log.warning("Received error from stream: %s", response.estado)
         
         except Exception as e:
+            if isinstance(e, grpc.aio.AioRpcError) and e.code() == grpc.StatusCode.OUT_OF_RANGE:
+                # The server's data was reset below our position; start over
+                log.warning("Stream position %d is no longer valid, restarting from the latest values", last_sequence)
+                last_sequence = 0
+                latest.clear()
+                continue
             consecutive_errors += 1
-            print(f"Error in gRPC streaming connection: {e}")
+            log.error("Error in gRPC streaming connection: %s", e)
             
             # Exponential backoff
             backoff_time = min(5 * (2 ** consecutive_errors), 300)
-            print(f"Waiting {backoff_time} seconds before reconnecting...")
+            log.info("Waiting %d seconds before reconnecting...", backoff_time)
             await asyncio.sleep(backoff_time)
 
 
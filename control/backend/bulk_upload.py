@@ -0,0 +1,170 @@
+import codecs
+import csv
+import json
+import os
+
+# Parsing of /send/bulk request bodies as they arrive, so an upload of any
+# size is forwarded without being held in memory. Each record becomes a
+# (value text, channel) pair; the value is parsed where it is stored, the same
+# way as for /send, and values that are not integers are counted as rejected.
+
+# Rows per COPY transaction when the gRPC server is down
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "1000"))
+
+# Longest JSON record accepted
+MAX_ITEM_SIZE = 65536
+
+# Characters that can follow a prefix of a JSON number within the number
+_NUMBER_CHARS = frozenset("0123456789.eE+-")
+
+FORMATS = {
+    "application/json": "json",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "text/csv": "csv"
+}
+
+
+class BulkFormatError(ValueError):
+    """The request body is not valid in its format"""
+
+
+def body_format(content_type):
+    """Format name of a Content-Type header, or None if it is not supported"""
+    return FORMATS.get((content_type or "").split(";", 1)[0].strip().lower())
+
+
+async def _text(chunks):
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    async for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+async def _lines(chunks):
+    """Lines of the body, without their line endings"""
+    pending = ""
+    async for text in _text(chunks):
+        pending += text
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    if pending:
+        yield pending.rstrip("\r")
+
+
+def _record(item, channel):
+    """(value text, channel) of a JSON item: a bare value or {"value": ..., "channel": ...}"""
+    if isinstance(item, dict):
+        return _value_text(item.get("value")), str(item.get("channel") or channel)
+    return _value_text(item), channel
+
+
+def _value_text(value):
+    # Booleans are ints to Python but not a reading; str() leaves them unparsable
+    if isinstance(value, bool):
+        return str(value)
+    return str(value) if value is not None else ""
+
+
+async def _json_array(chunks, channel):
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    state = "start"  # start, first (after "["), item, separator, end
+    final = False
+    texts = _text(chunks).__aiter__()
+    while True:
+        # Work through what is buffered; stop at anything that may be cut off
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n":
+                position += 1
+            if position == len(buffer):
+                break
+            char = buffer[position]
+            if state == "start":
+                if char != "[":
+                    raise BulkFormatError("JSON body must be an array")
+                state, position = "first", position + 1
+            elif state in ("first", "separator") and char == "]":
+                state, position = "end", position + 1
+            elif state == "separator":
+                if char != ",":
+                    raise BulkFormatError(f"Expected ',' or ']' in JSON array, got {char!r}")
+                state, position = "item", position + 1
+            elif state in ("first", "item"):
+                try:
+                    item, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError as e:
+                    # Either cut off by the chunk boundary or malformed; no
+                    # record is anywhere near MAX_ITEM_SIZE, so past it it is malformed
+                    if final or len(buffer) - position > MAX_ITEM_SIZE:
+                        raise BulkFormatError(f"Invalid JSON: {e}") from None
+                    break
+                if not final and (end == len(buffer) or buffer[end] in _NUMBER_CHARS):
+                    break  # A number may go on in the next chunk
+                yield _record(item, channel)
+                state, position = "separator", end
+            else:
+                raise BulkFormatError("Data after the end of the JSON array")
+        if final:
+            break
+        buffer = buffer[position:]
+        position = 0
+        try:
+            buffer += await texts.__anext__()
+        except StopAsyncIteration:
+            final = True
+    if state != "end":
+        raise BulkFormatError("JSON array is not closed")
+
+
+async def _ndjson(chunks, channel):
+    async for line in _lines(chunks):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise BulkFormatError(f"Invalid JSON line: {e}") from None
+        yield _record(item, channel)
+
+
+async def _csv(chunks, channel):
+    value_column, channel_column = 0, 1
+    first = True
+    async for line in _lines(chunks):
+        if not line.strip():
+            continue
+        row = next(csv.reader([line]))
+        if first:
+            first = False
+            names = [name.strip().lower() for name in row]
+            if "value" in names:
+                # Header row; a channel column may also be called server
+                value_column = names.index("value")
+                channel_column = next((names.index(name) for name in ("channel", "server") if name in names), None)
+                continue
+        value = row[value_column].strip() if value_column < len(row) else ""
+        row_channel = row[channel_column].strip() if channel_column is not None and channel_column < len(row) else ""
+        yield value, row_channel or channel
+
+
+def parse_records(chunks, body_format, channel=""):
+    """Async iterator of (value text, channel) from the body chunks in body_format
+
+    channel is used for records that do not name their own.
+    """
+    if body_format == "json":
+        return _json_array(chunks, channel)
+    if body_format == "ndjson":
+        return _ndjson(chunks, channel)
+    if body_format == "csv":
+        return _csv(chunks, channel)
+    raise ValueError(f"Unsupported format: {body_format}")
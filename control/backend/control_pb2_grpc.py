@@ -19,6 +19,11 @@ class ControlServiceStub(object):
                 request_serializer=control__pb2.DataRequest.SerializeToString,
                 response_deserializer=control__pb2.DataResponse.FromString,
                 )
+        self.GetLatestByChannel = channel.unary_unary(
+                '/ControlService/GetLatestByChannel',
+                request_serializer=control__pb2.ChannelWindowRequest.SerializeToString,
+                response_deserializer=control__pb2.ChannelWindowResponse.FromString,
+                )
         self.SendData = channel.unary_unary(
                 '/ControlService/SendData',
                 request_serializer=control__pb2.DataRequest.SerializeToString,
@@ -34,6 +39,31 @@ class ControlServiceStub(object):
                 request_serializer=control__pb2.StreamRequest.SerializeToString,
                 response_deserializer=control__pb2.DataResponse.FromString,
                 )
+        self.SendBatchData = channel.unary_unary(
+                '/ControlService/SendBatchData',
+                request_serializer=control__pb2.BatchDataRequest.SerializeToString,
+                response_deserializer=control__pb2.BatchAckResponse.FromString,
+                )
+        self.SendDataStream = channel.stream_unary(
+                '/ControlService/SendDataStream',
+                request_serializer=control__pb2.DataRequest.SerializeToString,
+                response_deserializer=control__pb2.BatchAckResponse.FromString,
+                )
+        self.StreamHistoricalData = channel.unary_stream(
+                '/ControlService/StreamHistoricalData',
+                request_serializer=control__pb2.HistoricalDataRequest.SerializeToString,
+                response_deserializer=control__pb2.HistoricalDataChunk.FromString,
+                )
+        self.GetHistoricalColumns = channel.unary_unary(
+                '/ControlService/GetHistoricalColumns',
+                request_serializer=control__pb2.HistoricalDataRequest.SerializeToString,
+                response_deserializer=control__pb2.HistoricalDataColumns.FromString,
+                )
+        self.GetStatus = channel.unary_unary(
+                '/ControlService/GetStatus',
+                request_serializer=control__pb2.StatusRequest.SerializeToString,
+                response_deserializer=control__pb2.StatusResponse.FromString,
+                )
 
 
 class ControlServiceServicer(object):
@@ -45,6 +75,13 @@ class ControlServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def GetLatestByChannel(self, request, context):
+        """Latest values of many channels in one call
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def SendData(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
@@ -64,6 +101,40 @@ class ControlServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def SendBatchData(self, request, context):
+        """Batched ingestion: one multi-row insert and one commit per batch
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def SendDataStream(self, request_iterator, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def StreamHistoricalData(self, request, context):
+        """Whole time range in fixed-size chunks, newest first, resumable
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetHistoricalColumns(self, request, context):
+        """GetHistoricalData as packed columns instead of one message per row
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetStatus(self, request, context):
+        """Health and internal counters of the server
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_ControlServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -72,6 +143,11 @@ def add_ControlServiceServicer_to_server(servicer, server):
                     request_deserializer=control__pb2.DataRequest.FromString,
                     response_serializer=control__pb2.DataResponse.SerializeToString,
             ),
+            'GetLatestByChannel': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetLatestByChannel,
+                    request_deserializer=control__pb2.ChannelWindowRequest.FromString,
+                    response_serializer=control__pb2.ChannelWindowResponse.SerializeToString,
+            ),
             'SendData': grpc.unary_unary_rpc_method_handler(
                     servicer.SendData,
                     request_deserializer=control__pb2.DataRequest.FromString,
@@ -87,6 +163,31 @@ def add_ControlServiceServicer_to_server(servicer, server):
                     request_deserializer=control__pb2.StreamRequest.FromString,
                     response_serializer=control__pb2.DataResponse.SerializeToString,
             ),
+            'SendBatchData': grpc.unary_unary_rpc_method_handler(
+                    servicer.SendBatchData,
+                    request_deserializer=control__pb2.BatchDataRequest.FromString,
+                    response_serializer=control__pb2.BatchAckResponse.SerializeToString,
+            ),
+            'SendDataStream': grpc.stream_unary_rpc_method_handler(
+                    servicer.SendDataStream,
+                    request_deserializer=control__pb2.DataRequest.FromString,
+                    response_serializer=control__pb2.BatchAckResponse.SerializeToString,
+            ),
+            'StreamHistoricalData': grpc.unary_stream_rpc_method_handler(
+                    servicer.StreamHistoricalData,
+                    request_deserializer=control__pb2.HistoricalDataRequest.FromString,
+                    response_serializer=control__pb2.HistoricalDataChunk.SerializeToString,
+            ),
+            'GetHistoricalColumns': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetHistoricalColumns,
+                    request_deserializer=control__pb2.HistoricalDataRequest.FromString,
+                    response_serializer=control__pb2.HistoricalDataColumns.SerializeToString,
+            ),
+            'GetStatus': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetStatus,
+                    request_deserializer=control__pb2.StatusRequest.FromString,
+                    response_serializer=control__pb2.StatusResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'ControlService', rpc_method_handlers)
@@ -114,6 +215,23 @@ class ControlService(object):
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
 
+    @staticmethod
+    def GetLatestByChannel(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/ControlService/GetLatestByChannel',
+            control__pb2.ChannelWindowRequest.SerializeToString,
+            control__pb2.ChannelWindowResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
     @staticmethod
     def SendData(request,
             target,
@@ -164,3 +282,88 @@ class ControlService(object):
             control__pb2.DataResponse.FromString,
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def SendBatchData(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/ControlService/SendBatchData',
+            control__pb2.BatchDataRequest.SerializeToString,
+            control__pb2.BatchAckResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def SendDataStream(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(request_iterator, target, '/ControlService/SendDataStream',
+            control__pb2.DataRequest.SerializeToString,
+            control__pb2.BatchAckResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def StreamHistoricalData(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(request, target, '/ControlService/StreamHistoricalData',
+            control__pb2.HistoricalDataRequest.SerializeToString,
+            control__pb2.HistoricalDataChunk.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def GetHistoricalColumns(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/ControlService/GetHistoricalColumns',
+            control__pb2.HistoricalDataRequest.SerializeToString,
+            control__pb2.HistoricalDataColumns.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def GetStatus(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/ControlService/GetStatus',
+            control__pb2.StatusRequest.SerializeToString,
+            control__pb2.StatusResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
@@ -0,0 +1,142 @@
+import logging
+import os
+import time
+
+import psycopg
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+
+from metrics import REGISTRY, statement_name
+
+log = logging.getLogger(__name__)
+
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "db_query_seconds", "Time to execute a SQL statement, by verb and first table", ("statement",))
+DB_POOL_WAIT_SECONDS = REGISTRY.histogram(
+    "db_pool_wait_seconds", "Time to check a connection out of the pool")
+
+
+def db_settings_from_env():
+    """Connection parameters from the DB_* environment variables"""
+    return {
+        "host": os.getenv("DB_HOST", "172.90.0.40"),
+        "port": os.getenv("DB_PORT", "5432"),
+        "dbname": os.getenv("DB_NAME", "mydb"),
+        "user": os.getenv("DB_USER", "user"),
+        "password": os.getenv("DB_PASSWORD", "password")
+    }
+
+
+class TimedAsyncCursor(psycopg.AsyncCursor):
+    """Cursor that records the duration of each execute in DB_QUERY_SECONDS"""
+
+    async def execute(self, query, params=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - start, statement_name(query))
+
+
+class Database:
+    """Pool of PostgreSQL connections for the request handlers.
+
+    Every query checks a connection out for its own duration, so handlers
+    never share one and a slow query only holds up the request that made it.
+    The pool connects in the background: the API starts while the database
+    is still down, and queries wait up to DB_POOL_TIMEOUT seconds for it.
+
+    stream() reads, which last as long as a download, use a second pool of
+    at most DB_STREAM_POOL_MAX connections, so they never take connections
+    from the requests; one that finds them all busy for
+    DB_STREAM_POOL_TIMEOUT seconds fails with PoolTimeout.
+    """
+
+    def __init__(self, settings=None):
+        settings = settings or db_settings_from_env()
+        self.address = f"{settings['host']}:{settings['port']}"
+        self.pool = AsyncConnectionPool(
+            make_conninfo(**settings),
+            min_size=int(os.getenv("DB_POOL_MIN", "1")),
+            max_size=int(os.getenv("DB_POOL_MAX", "10")),
+            timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+            kwargs={"cursor_factory": TimedAsyncCursor},
+            open=False
+        )
+        self.stream_pool = AsyncConnectionPool(
+            make_conninfo(**settings),
+            min_size=0,
+            max_size=int(os.getenv("DB_STREAM_POOL_MAX", "2")),
+            timeout=float(os.getenv("DB_STREAM_POOL_TIMEOUT", "5")),
+            kwargs={"cursor_factory": TimedAsyncCursor},
+            open=False
+        )
+
+    async def open(self):
+        log.info("Starting SQL connection pool to %s", self.address)
+        await self.pool.open()
+        await self.stream_pool.open()
+
+    async def close(self):
+        await self.stream_pool.close()
+        await self.pool.close()
+
+    async def fetchall(self, query, params=None):
+        start = time.perf_counter()
+        async with self.pool.connection() as conn:
+            DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - start)
+            cursor = await conn.execute(query, params)
+            return await cursor.fetchall()
+
+    async def fetchone(self, query, params=None):
+        """First row of a query; also commits, for INSERT ... RETURNING"""
+        start = time.perf_counter()
+        async with self.pool.connection() as conn:
+            DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - start)
+            cursor = await conn.execute(query, params)
+            return await cursor.fetchone()
+
+    async def stream(self, query, params=None, size=1000):
+        """Rows of a query in lists of up to size, read through a server-side cursor.
+
+        Holds one stream pool connection until the iteration ends or is closed.
+        """
+        async with self.stream_pool.connection() as conn:
+            async with conn.cursor(name="stream") as cursor:
+                start = time.perf_counter()
+                await cursor.execute(query, params)
+                DB_QUERY_SECONDS.observe(time.perf_counter() - start, statement_name(query))
+                while True:
+                    rows = await cursor.fetchmany(size)
+                    if not rows:
+                        break
+                    yield rows
+
+    async def copy_rows(self, statement, rows):
+        """Load rows with a COPY ... FROM STDIN statement, in one transaction"""
+        start = time.perf_counter()
+        async with self.pool.connection() as conn:
+            DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - start)
+            start = time.perf_counter()
+            async with conn.cursor() as cursor:
+                async with cursor.copy(statement) as copy:
+                    for row in rows:
+                        await copy.write_row(row)
+            DB_QUERY_SECONDS.observe(time.perf_counter() - start, statement_name(statement))
+
+    def stats(self):
+        return _pool_stats(self.pool)
+
+    def stream_stats(self):
+        return _pool_stats(self.stream_pool)
+
+
+def _pool_stats(pool):
+    stats = pool.get_stats()
+    return {
+        "size": stats["pool_size"],
+        "idle": stats["pool_available"],
+        "in_use": stats["pool_size"] - stats["pool_available"],
+        "max": stats["pool_max"],
+        "waiting": stats.get("requests_waiting", 0)
+    }
@@ -0,0 +1,219 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import zstandard
+
+# Full-range exports of sensor_data, streamed from a server-side cursor: rows
+# are fetched, encoded and sent a chunk at a time, so memory stays flat
+# whatever the size of the range.
+
+# Rows fetched and encoded per chunk; also the Parquet row group size
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "10000"))
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet")
+}
+
+# Streamed formats are wrapped in the compressor; Parquet compresses its pages instead
+COMPRESSIONS = {
+    "none": None,
+    "gzip": ("application/gzip", "gz"),
+    "zstd": ("application/zstd", "zst")
+}
+
+# timeRange values, as for /history; "all" has no lower bound
+TIME_RANGES = {
+    "1h": "1 hour",
+    "6h": "6 hours",
+    "24h": "1 day",
+    "7d": "7 days",
+    "30d": "30 days"
+}
+
+COLUMNS = ("id", "timestamp", "value", "channel")
+
+PARQUET_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("timestamp", pa.timestamp("us")),
+    ("value", pa.int32()),
+    ("channel", pa.string())
+])
+
+
+def parse_bound(value, name):
+    """datetime of an ISO 8601 start or end parameter; None when empty"""
+    if not value:
+        return None
+    try:
+        # fromisoformat() only takes the Z suffix from Python 3.11
+        return datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith("Z") else value)
+    except ValueError:
+        raise ValueError(f"Invalid {name} '{value}', expected an ISO 8601 timestamp") from None
+
+
+def export_query(time_range="all", start=None, end=None, channel=""):
+    """SELECT of the rows to export, oldest first, and its parameters"""
+    if time_range != "all" and time_range not in TIME_RANGES:
+        raise ValueError(f"Invalid timeRange '{time_range}', expected all or one of {', '.join(TIME_RANGES)}")
+    conditions = []
+    params = {}
+    if time_range != "all":
+        conditions.append("timestamp > NOW() - %(time_filter)s::interval")
+        params["time_filter"] = TIME_RANGES[time_range]
+    if start is not None:
+        conditions.append("timestamp >= %(start)s")
+        params["start"] = start
+    if end is not None:
+        conditions.append("timestamp < %(end)s")
+        params["end"] = end
+    if channel:
+        conditions.append("server = %(channel)s")
+        params["channel"] = channel
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"""
+        SELECT id, timestamp, value, COALESCE(server, 'main-server') FROM sensor_data
+        {where}
+        ORDER BY timestamp, id
+    """
+    return query, params
+
+
+def media_type(export_format, compression="none"):
+    """Content-Type and file name extension of an export"""
+    content_type, extension = FORMATS[export_format]
+    if export_format != "parquet" and COMPRESSIONS[compression]:
+        content_type, suffix = COMPRESSIONS[compression]
+        extension = f"{extension}.{suffix}"
+    return content_type, extension
+
+
+class CsvEncoder:
+    def __init__(self):
+        self._header = True
+
+    def encode(self, rows):
+        text = io.StringIO()
+        writer = csv.writer(text, lineterminator="\n")
+        if self._header:
+            writer.writerow(COLUMNS)
+            self._header = False
+        writer.writerows((row_id, timestamp.isoformat(), value, channel)
+                         for row_id, timestamp, value, channel in rows)
+        return text.getvalue().encode()
+
+    def finish(self):
+        # Just the header for an empty range
+        return self.encode([])
+
+
+class NdjsonEncoder:
+    def encode(self, rows):
+        return "".join(
+            json.dumps({"id": row_id, "timestamp": timestamp.isoformat(), "value": value, "channel": channel}) + "\n"
+            for row_id, timestamp, value, channel in rows
+        ).encode()
+
+    def finish(self):
+        return b""
+
+
+class _Sink:
+    """Write-only file that hands over what was written since the last take()"""
+
+    closed = False
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+class ParquetEncoder:
+    """One row group per chunk, each sent as soon as it is written"""
+
+    def __init__(self, compression):
+        self._sink = _Sink()
+        self._writer = pq.ParquetWriter(self._sink, PARQUET_SCHEMA, compression=compression)
+
+    def encode(self, rows):
+        ids, timestamps, values, channels = zip(*rows)
+        self._writer.write_table(pa.Table.from_arrays(
+            [pa.array(ids, pa.int64()), pa.array(timestamps, pa.timestamp("us")),
+             pa.array(values, pa.int32()), pa.array(channels, pa.string())],
+            schema=PARQUET_SCHEMA
+        ))
+        return self._sink.take()
+
+    def finish(self):
+        # The footer, also for an empty range
+        self._writer.close()
+        return self._sink.take()
+
+
+def _compressor(compression):
+    if compression == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip header and trailer
+    return zstandard.ZstdCompressor().compressobj()
+
+
+def _encode(encoder, compressor, rows):
+    data = encoder.encode(rows)
+    return compressor.compress(data) if compressor else data
+
+
+def _finish(encoder, compressor):
+    data = encoder.finish()
+    return compressor.compress(data) + compressor.flush() if compressor else data
+
+
+async def export_rows(chunks, export_format, compression="none"):
+    """Bytes of the export file, encoded from an async iterator of row lists.
+
+    Encoding and compression run in a worker thread, a chunk at a time, so
+    a large export does not hold up the event loop; zlib, zstd and Arrow
+    release the GIL while they work.
+    """
+    if export_format == "csv":
+        encoder = CsvEncoder()
+    elif export_format == "ndjson":
+        encoder = NdjsonEncoder()
+    else:
+        encoder = ParquetEncoder(compression)
+    compressor = None
+    if export_format != "parquet" and COMPRESSIONS[compression]:
+        compressor = _compressor(compression)
+
+    async for rows in chunks:
+        data = await asyncio.to_thread(_encode, encoder, compressor, rows)
+        if data:
+            yield data
+    data = await asyncio.to_thread(_finish, encoder, compressor)
+    if data:
+        yield data
@@ -0,0 +1,128 @@
+import asyncio
+import itertools
+import logging
+import os
+
+import grpc
+
+import control_pb2_grpc
+
+log = logging.getLogger(__name__)
+
+# One grpc.aio channel per gRPC server, opened at startup and shared by every
+# request: calls are multiplexed as HTTP/2 streams instead of each request
+# paying for its own connection.
+#   GRPC_SERVER        address, or a comma-separated list of addresses that
+#                      calls are spread over round-robin
+#   GRPC_TIMEOUT       deadline in seconds of ordinary unary calls
+#   GRPC_HISTORY_TIMEOUT  deadline of history reads, which may scan a long range
+#   GRPC_KEEPALIVE_MS  interval of HTTP/2 keepalive pings, which notice a dead
+#                      server between calls; the server must allow it
+#                      (GRPC_MIN_PING_INTERVAL_MS there)
+GRPC_SERVER = os.getenv("GRPC_SERVER", "172.90.0.33:50051")
+GRPC_TIMEOUT = float(os.getenv("GRPC_TIMEOUT", "5"))
+GRPC_HISTORY_TIMEOUT = float(os.getenv("GRPC_HISTORY_TIMEOUT", "30"))
+GRPC_KEEPALIVE_MS = int(os.getenv("GRPC_KEEPALIVE_MS", "30000"))
+
+_UNUSABLE = (grpc.ChannelConnectivity.TRANSIENT_FAILURE, grpc.ChannelConnectivity.SHUTDOWN)
+
+
+def parse_addresses(value):
+    """List of the addresses in a comma-separated GRPC_SERVER value"""
+    addresses = [address.strip() for address in value.split(",") if address.strip()]
+    if not addresses:
+        raise ValueError("GRPC_SERVER names no address")
+    return addresses
+
+
+class GrpcChannels:
+    """Long-lived channels to the gRPC servers, handed out round-robin.
+
+    stub() skips servers whose channel is in TRANSIENT_FAILURE, so one server
+    being down only costs the calls already on their way to it. A task per
+    channel follows its connectivity state and logs every change.
+    """
+
+    def __init__(self, addresses=None):
+        self.addresses = addresses or parse_addresses(GRPC_SERVER)
+        self.options = [
+            ("grpc.keepalive_time_ms", GRPC_KEEPALIVE_MS),
+            ("grpc.keepalive_timeout_ms", 10000),
+            ("grpc.keepalive_permit_without_calls", 1),
+            ("grpc.http2.max_pings_without_data", 0),
+        ]
+        self._channels = []  # (address, channel, stub)
+        self._watchers = []
+        self._next = itertools.count()
+
+    async def open(self):
+        """Create the channels; must run on the event loop that will use them"""
+        for address in self.addresses:
+            channel = grpc.aio.insecure_channel(address, options=self.options)
+            self._channels.append((address, channel, control_pb2_grpc.ControlServiceStub(channel)))
+            self._watchers.append(asyncio.create_task(self._watch(address, channel)))
+        log.info("gRPC channels to %s", ", ".join(self.addresses))
+
+    async def close(self):
+        for watcher in self._watchers:
+            watcher.cancel()
+        for _, channel, _ in self._channels:
+            await channel.close()
+        self._watchers = []
+        self._channels = []
+
+    async def _watch(self, address, channel):
+        # Connect now rather than on the first call
+        state = channel.get_state(try_to_connect=True)
+        while True:
+            await channel.wait_for_state_change(state)
+            previous, state = state, channel.get_state(try_to_connect=True)
+            if state in _UNUSABLE:
+                log.warning("gRPC channel to %s: %s -> %s", address, previous.name, state.name)
+            else:
+                log.info("gRPC channel to %s: %s -> %s", address, previous.name, state.name)
+
+    def stub(self):
+        """ControlService stub of the next usable channel, or just the next one if none is"""
+        if not self._channels:
+            raise RuntimeError("gRPC channels are not open")
+        start = next(self._next)
+        count = len(self._channels)
+        for offset in range(count):
+            _, channel, stub = self._channels[(start + offset) % count]
+            if channel.get_state() not in _UNUSABLE:
+                return stub
+        return self._channels[start % count][2]
+
+    async def ready_stub(self, timeout):
+        """Like stub(), but waits up to timeout seconds for the channel to connect; None if none does
+
+        For calls that cannot be retried elsewhere once they have started,
+        such as client streams fed from a request body.
+        """
+        if not self._channels:
+            raise RuntimeError("gRPC channels are not open")
+        start = next(self._next)
+        count = len(self._channels)
+        for offset in range(count):
+            _, channel, stub = self._channels[(start + offset) % count]
+            if channel.get_state() in _UNUSABLE:
+                continue
+            try:
+                await asyncio.wait_for(channel.channel_ready(), timeout)
+                return stub
+            except asyncio.TimeoutError:
+                continue
+        return None
+
+    def states(self):
+        """Connectivity state name of each channel, by address"""
+        return {address: channel.get_state().name for address, channel, _ in self._channels}
+
+    def stats(self):
+        states = [channel.get_state() for _, channel, _ in self._channels]
+        return {
+            "channels": len(states),
+            "ready": sum(1 for state in states if state == grpc.ChannelConnectivity.READY),
+            "failing": sum(1 for state in states if state in _UNUSABLE)
+        }
@@ -0,0 +1,71 @@
+import bisect
+
+
+class LatestWindow:
+    """The latest values of every channel, kept in step with the writes.
+
+    /send and the gRPC stream add each value with its sequence (the
+    sensor_data id), so a value that arrives from both is kept once and
+    values arriving out of order still end up in order. The WebSocket paths
+    read from here instead of querying PostgreSQL; the database is only read
+    to fill the window the first time it is used.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = []  # (sequence, value), oldest first
+        self._loaded = False
+
+    def add(self, rows):
+        """Add rows of (sequence, value); ones already held or older than the window are ignored.
+
+        Returns True if the window changed, i.e. there is something new to broadcast.
+        """
+        entries = self._entries
+        changed = False
+        for sequence, value in rows:
+            if len(entries) >= self.size and sequence <= entries[0][0]:
+                continue
+            index = bisect.bisect_left(entries, (sequence,))
+            if index < len(entries) and entries[index][0] == sequence:
+                continue
+            entries.insert(index, (sequence, value))
+            if len(entries) > self.size:
+                del entries[0]
+            changed = True
+        return changed
+
+    def clear(self):
+        """Forget every value, e.g. after the server's data was reset; the next read refills from the database"""
+        self._entries = []
+        self._loaded = False
+
+    @property
+    def sequence(self):
+        """Sequence of the newest value, 0 when empty"""
+        return self._entries[-1][0] if self._entries else 0
+
+    def values(self, count=None):
+        """Up to count of the latest values, newest first"""
+        count = self.size if count is None else count
+        return [value for _, value in reversed(self._entries[-count:])] if count > 0 else []
+
+    async def latest(self, db, count=None):
+        """values(count), filling the window from the database on first use.
+
+        Readers that race on the first fill each run the query; add() keeps
+        the rows once, so that costs nothing worse than an extra query.
+        """
+        if not self._loaded:
+            await self.refresh(db)
+        return self.values(count)
+
+    async def refresh(self, db):
+        """Merge in the newest rows of the database, for writes that bypassed add(); True if the window changed"""
+        rows = await db.fetchall("""
+            SELECT id, value FROM sensor_data
+            ORDER BY id DESC
+            LIMIT %s
+        """, (self.size,))
+        self._loaded = True
+        return self.add(rows)
@@ -0,0 +1,138 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+# Records are formatted and written by a listener thread; the logging call
+# itself only filters the record and puts it on a bounded queue, so a slow
+# stdout never holds up an RPC. Below LOG_LEVEL a call costs one level check.
+#   LOG_LEVEL       DEBUG, INFO, WARNING or ERROR
+#   LOG_FORMAT      "text", or "json" for one object per line
+#   LOG_RATE_LIMIT  records per second from one call site; the rest are
+#                   counted and reported with the next record let through.
+#                   0 lets everything through
+#   LOG_QUEUE_SIZE  records waiting for the writer; newer ones are dropped
+#                   rather than block when it is full
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_RATE_LIMIT = float(os.getenv("LOG_RATE_LIMIT", "20"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+_listener = None
+
+
+class RateLimitFilter(logging.Filter):
+    """Pass at most rate records per second from each call site (logger and message template)"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        self._windows = {}  # (logger, template) -> [window start, passed, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.rate <= 0:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                if len(self._windows) >= 10000:
+                    self._windows.clear()
+                window = self._windows[key] = [now, 0, 0]
+            elif now - window[0] >= 1.0:
+                window[0] = now
+                window[1] = 0
+            if window[1] >= self.rate:
+                window[2] += 1
+                return False
+            window[1] += 1
+            suppressed, window[2] = window[2], 0
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    def __init__(self, record_queue):
+        super().__init__(record_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        text = super().format(record).rstrip()
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            text += f" ({suppressed} similar messages suppressed)"
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; fields passed in extra= are included"""
+
+    # Attributes every LogRecord has, so anything else came from extra=
+    _standard = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for name, value in vars(record).items():
+            if name not in self._standard:
+                entry[name] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def setup_logging():
+    """Route the root logger through the queue; safe to call more than once"""
+    global _listener
+    if _listener is not None:
+        return
+    level = logging.getLevelName(LOG_LEVEL)
+    known = isinstance(level, int)
+    if not known:
+        level = logging.INFO
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+
+    handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    handler.addFilter(RateLimitFilter(LOG_RATE_LIMIT))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(handler.queue, stream)
+    _listener.start()
+    # Write out what is still queued at exit
+    atexit.register(_listener.stop)
+    if not known:
+        logging.getLogger(__name__).warning("Unknown LOG_LEVEL '%s', using INFO", LOG_LEVEL)
+
+
+def stats():
+    """Records lost to a full queue since startup"""
+    handlers = [h for h in logging.getLogger().handlers if isinstance(h, DroppingQueueHandler)]
+    return {"records_dropped": sum(h.dropped for h in handlers)}
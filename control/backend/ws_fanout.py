@@ -0,0 +1,197 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+
+from metrics import REGISTRY
+
+log = logging.getLogger(__name__)
+
+# Every WebSocket client has its own send queue, drained by its own task, so
+# a broadcast only encodes the message once and appends it to each queue: a
+# slow or dead browser holds up nobody but itself.
+#   WS_QUEUE_SIZE    messages queued per client
+#   WS_OVERFLOW      what a client whose queue is full does with the next message
+#                    "drop_oldest": discard the oldest queued message
+#                    "coalesce":    discard every queued message; updates carry the
+#                                   whole window, so the newest supersedes them
+#                    "disconnect":  evict the client
+#   WS_SEND_TIMEOUT  seconds one send may take before the client is evicted
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "32"))
+WS_OVERFLOW = os.getenv("WS_OVERFLOW", "coalesce")
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+
+OVERFLOW_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+# Close code of evicted clients: "Try Again Later"
+CLOSE_EVICTED = 1013
+
+BROADCAST_SECONDS = REGISTRY.histogram(
+    "websocket_broadcast_seconds", "Time to encode one update and queue it for every WebSocket client")
+SEND_SECONDS = REGISTRY.histogram(
+    "websocket_send_seconds", "Time to write one message to one WebSocket client")
+QUEUE_SECONDS = REGISTRY.histogram(
+    "websocket_queue_seconds", "Time a message waited in a client's send queue")
+
+
+def encode(message):
+    """Message as the text frame send_json would produce"""
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+class Client:
+    """One connected WebSocket and its bounded send queue.
+
+    A None entry tells the sender task to close the socket and stop.
+    """
+
+    def __init__(self, websocket, max_queued, overflow):
+        self.websocket = websocket
+        self.max_queued = max_queued
+        self.overflow = overflow
+        self.active = True
+        self.evicted = None  # Reason the client was evicted
+        self.task = None
+        self._messages = deque()  # (queued at, text)
+        self._ready = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+    def put(self, text):
+        """Queue an encoded message; returns False if the client overflowed"""
+        if not self.active:
+            return True
+        if len(self._messages) >= self.max_queued:
+            if self.overflow == "disconnect":
+                return False
+            if self.overflow == "coalesce":
+                self.coalesced += len(self._messages)
+                self._messages.clear()
+            else:
+                self._messages.popleft()
+                self.dropped += 1
+        self._messages.append((time.perf_counter(), text))
+        self._ready.set()
+        return True
+
+    def queued(self):
+        return len(self._messages)
+
+    def stop(self, reason=None):
+        """Drop what is queued and end the sender task, which closes the socket if reason is given"""
+        if not self.active:
+            return
+        self.active = False
+        self.evicted = reason
+        self._messages.clear()
+        self._messages.append((time.perf_counter(), None))
+        self._ready.set()
+
+    async def run(self, send_timeout):
+        """Sender task: write queued messages until stopped or a send fails"""
+        while True:
+            if not self._messages:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            queued_at, text = self._messages.popleft()
+            if text is None:
+                break
+            QUEUE_SECONDS.observe(time.perf_counter() - queued_at)
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(self.websocket.send_text(text), send_timeout)
+            except asyncio.TimeoutError:
+                self.evicted = f"send took over {send_timeout:g}s"
+                break
+            except Exception as e:
+                # Gone without a close frame; the receive loop notices too
+                self.evicted = self.evicted or f"send failed: {e}"
+                self.active = False
+                return
+            SEND_SECONDS.observe(time.perf_counter() - start)
+            self.sent += 1
+        self.active = False
+        if self.evicted:
+            try:
+                await asyncio.wait_for(self.websocket.close(code=CLOSE_EVICTED), 1.0)
+            except Exception:
+                pass  # Already gone, or too stuck to take the close frame
+
+
+class ConnectionManager:
+    """The connected WebSocket clients and the broadcasts to them"""
+
+    def __init__(self, max_queued=WS_QUEUE_SIZE, overflow=WS_OVERFLOW, send_timeout=WS_SEND_TIMEOUT):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Invalid overflow policy '{overflow}', expected one of {', '.join(OVERFLOW_POLICIES)}")
+        self.max_queued = max_queued
+        self.overflow = overflow
+        self.send_timeout = send_timeout
+        self.active_connections = {}  # WebSocket -> Client
+        self.evictions = 0
+        # Counters of clients already gone, so totals do not go backwards
+        self._finished = {"sent": 0, "dropped": 0, "coalesced": 0}
+
+    async def connect(self, websocket):
+        await websocket.accept()
+        client = Client(websocket, self.max_queued, self.overflow)
+        client.task = asyncio.create_task(client.run(self.send_timeout))
+        client.task.add_done_callback(lambda task: self._sender_done(client))
+        self.active_connections[websocket] = client
+        log.info("Client connected. Total connections: %d", len(self.active_connections))
+
+    def _sender_done(self, client):
+        if client.evicted and self.active_connections.get(client.websocket) is client:
+            self.evictions += 1
+            log.warning("Evicted WebSocket client: %s", client.evicted)
+            self._remove(client)
+
+    def _remove(self, client):
+        del self.active_connections[client.websocket]
+        for key in self._finished:
+            self._finished[key] += getattr(client, key)
+        log.info("Client disconnected. Remaining connections: %d", len(self.active_connections))
+
+    def disconnect(self, websocket):
+        """Forget a client whose connection closed; safe to call more than once"""
+        client = self.active_connections.get(websocket)
+        if client is None:
+            return
+        client.stop()
+        self._remove(client)
+
+    def send(self, websocket, message):
+        """Queue a message for one client"""
+        client = self.active_connections.get(websocket)
+        if client is not None and not client.put(encode(message)):
+            client.stop(f"more than {client.max_queued} messages queued")
+
+    async def broadcast(self, message: dict):
+        """Queue a message for every connected client"""
+        if not self.active_connections:
+            return
+        with BROADCAST_SECONDS.time():
+            text = encode(message)
+            for client in list(self.active_connections.values()):
+                if not client.put(text):
+                    client.stop(f"more than {client.max_queued} messages queued")
+
+    def stats(self):
+        totals = dict(self._finished)
+        queued = 0
+        for client in self.active_connections.values():
+            for key in totals:
+                totals[key] += getattr(client, key)
+            queued += client.queued()
+        return {
+            "connections": len(self.active_connections),
+            "queued": queued,
+            "messages_sent": totals["sent"],
+            "messages_dropped": totals["dropped"],
+            "messages_coalesced": totals["coalesced"],
+            "evictions": self.evictions
+        }
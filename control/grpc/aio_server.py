@@ -0,0 +1,841 @@
+import asyncio
+import logging
+import os
+import signal
+import time
+import uuid
+from concurrent.futures import CancelledError
+from contextlib import asynccontextmanager, contextmanager
+
+import grpc
+import psycopg
+import psycopg2
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+
+import control_pb2
+import control_pb2_grpc
+from db_pool import ConnectionPool, DB_QUERY_SECONDS, DB_POOL_WAIT_SECONDS, db_settings_from_env
+from downsampling import downsample_async, window_query, AGGREGATIONS, DEFAULT_AGGREGATION
+from latest_buffer import LatestValuesBuffer
+from watermark import CommitWatermark, ROWS_WITH_SNAPSHOT, split_snapshot_rows
+from metrics import REGISTRY, serve_metrics, statement_name
+from migrations import ensure_partitions
+from notify_listener import NotifyListener
+from rpc_metrics import AsyncMetricsInterceptor
+from stream_fanout import (
+    StreamFanout, Subscriber, MAX_INCREMENT, OVERFLOW_POLICIES, increment_response, window_size, subscriber_status
+)
+from ingest_buffer import IngestBuffer, IngestBufferFull
+from columnar import columns_query, decode_columns, encode_columns, rows_to_columns
+from channels import (
+    DEFAULT_CHANNEL, DEFAULT_CHANNEL_WINDOW, MAX_CHANNEL_WINDOW, CHANNEL_NAMES, LATEST_BY_CHANNEL,
+    rows_query, channel_windows
+)
+from server_common import (
+    GRPC_MAX_WORKERS, GRPC_MAX_STREAMS, METRICS_PORT, STREAM_MODE, STREAM_QUEUE_SIZE, DB_PARTITION_BY, DB_PARTITION_PREMAKE,
+    DB_MAINTENANCE_INTERVAL, HISTORY_CHUNK_SIZE, HISTORY_MAX_CHUNK_SIZE, HISTORY_MAX_STREAMS, LATEST_BUFFER_DEPTH, LATEST_BUFFER_SYNC_MS,
+    WATERMARK_TIMEOUT, INGEST_FLUSH_ROWS, INGEST_FLUSH_INTERVAL_MS, INGEST_BUFFER_CAPACITY, ingest_durability,
+    stream_overflow,
+    prepare_database, server_options,
+    retention_engine, rollup_aggregator, parse_values, parse_time_range, encode_resume_token, decode_resume_token
+)
+import logs
+
+log = logging.getLogger(__name__)
+
+
+class TimedAsyncCursor(psycopg.AsyncCursor):
+    """Cursor that records the duration of each execute in DB_QUERY_SECONDS"""
+
+    async def execute(self, query, params=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - start, statement_name(query))
+
+
+class AsyncSubscriber(Subscriber):
+    """Subscriber whose RPC waits for updates on the server's event loop"""
+
+    def __init__(self, client_id, interval_ms, max_queued=100, overflow="drop_oldest"):
+        super().__init__(client_id, interval_ms, max_queued, overflow)
+        # Created by StreamFanout.subscribe, which runs on the event loop
+        self.loop = asyncio.get_running_loop()
+        self.ready = asyncio.Event()
+
+    def _notify(self):
+        self.loop.call_soon_threadsafe(self.ready.set)
+
+    async def get(self):
+        """Wait for the next update without blocking the event loop"""
+        while True:
+            with self._lock:
+                if self._updates:
+                    return self._take()
+                # Cleared under the lock, so a put after this sets it again
+                self.ready.clear()
+            await self.ready.wait()
+
+
+class AsyncControlServiceServicer(control_pb2_grpc.ControlServiceServicer):
+    """ControlService on grpc.aio, with psycopg 3 and an asyncio connection pool.
+
+    The RPCs behave as in ControlServiceServicer. Only the request path is
+    async: schema setup, partition maintenance and the LISTEN connection
+    keep using psycopg2 in their own threads, and stream updates come from
+    the same StreamFanout scheduler thread, delivered into asyncio queues.
+    """
+
+    def __init__(self, db_pool, db_settings):
+        super().__init__()
+        log.info("Initializing AsyncControlServiceServicer")
+        self.started_at = time.time()
+        self.db_pool = db_pool
+        self.db_settings = db_settings
+        self.loop = None
+        self.stream_fanout = StreamFanout(
+            self.fetch_latest_values,
+            self.fetch_rows_since,
+            min_push_interval_ms=int(os.getenv("STREAM_PUSH_MIN_INTERVAL_MS", "20")),
+            subscriber_class=AsyncSubscriber,
+            max_queued=STREAM_QUEUE_SIZE,
+            overflow=stream_overflow()
+        )
+        # Only touched from the event loop, so no lock is needed
+        self.active_streams = 0
+        self.active_history_streams = 0
+        self.ingest_batch_size = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+        self.latest_buffer = LatestValuesBuffer(LATEST_BUFFER_DEPTH)
+        # Incremental streams stop here: every row up to it is in the buffer or the table
+        self.watermark = CommitWatermark(WATERMARK_TIMEOUT)
+        # Rate limit of poll_latest_buffer()
+        self.sync_lock = asyncio.Lock()
+        self.next_sync = 0.0
+        self.durability = ingest_durability()
+        self.ingest_buffer = None
+        self.notify_connected = False
+        self.background_tasks = set()
+        self.retention = retention_engine(self.admin_connection)
+        # The aggregator runs every second, so it keeps its psycopg2 connection
+        self.rollups = rollup_aggregator(ConnectionPool(0, 1, **db_settings).connection)
+
+    async def start(self):
+        """Prepare the database and start the background work; call before serving"""
+        self.loop = asyncio.get_running_loop()
+        await asyncio.to_thread(self.setup_db)
+        await self.load_latest_buffer()
+        if self.durability != "sync":
+            # The flusher thread commits each group through the async pool
+            self.ingest_buffer = IngestBuffer(
+                lambda rows: asyncio.run_coroutine_threadsafe(self.insert_batch(rows), self.loop).result()[0],
+                max_rows=INGEST_FLUSH_ROWS,
+                max_delay_ms=INGEST_FLUSH_INTERVAL_MS,
+                capacity=INGEST_BUFFER_CAPACITY
+            )
+            log.info("SendData uses write-behind with durability '%s'", self.durability)
+        if DB_PARTITION_BY:
+            self.spawn(self.maintain_partitions())
+        self.retention.start()
+        self.rollups.start()
+        if STREAM_MODE == "notify":
+            self.notify_listener = NotifyListener(
+                self.db_settings,
+                on_notify=lambda: self.run_in_loop(self.on_rows_inserted()),
+                on_state=self.on_notify_state
+            )
+            self.notify_listener.start()
+        else:
+            log.info("Stream updates use polling (STREAM_MODE=poll)")
+        # The GetStatus counters double as gauges on the metrics endpoint
+        REGISTRY.gauges(self.status_metrics)
+
+    def spawn(self, coro):
+        """Run a coroutine in the background, keeping a reference until it is done"""
+        task = self.loop.create_task(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+
+    def run_in_loop(self, coro):
+        """Run a coroutine on the event loop from another thread and wait for it"""
+        try:
+            asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+        except CancelledError:
+            # The loop is shutting down
+            pass
+        except Exception as e:
+            log.error("Error running %s on the event loop: %s", coro.__qualname__, e)
+
+    @contextmanager
+    def admin_connection(self):
+        """Short-lived psycopg2 connection for schema and maintenance work in threads"""
+        conn = psycopg2.connect(**self.db_settings)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def setup_db(self):
+        """Bring the schema up to date; runs in a worker thread"""
+        while True:
+            try:
+                with self.admin_connection() as conn:
+                    prepare_database(conn)
+                log.info("Database setup complete")
+                return
+            except psycopg2.OperationalError as e:
+                log.error("Failed to setup database: %s", e)
+                log.info("Attempting to reconnect to database...")
+                time.sleep(5)
+
+    async def maintain_partitions(self):
+        """Keep DB_PARTITION_PREMAKE future partitions of sensor_data in place"""
+        def ensure():
+            with self.admin_connection() as conn:
+                return ensure_partitions(conn, DB_PARTITION_BY, DB_PARTITION_PREMAKE)
+
+        while True:
+            try:
+                created = await asyncio.to_thread(ensure)
+                if created:
+                    log.info("Created partitions: %s", ", ".join(created))
+            except Exception as e:
+                log.error("Error maintaining partitions: %s", e)
+            await asyncio.sleep(DB_MAINTENANCE_INTERVAL)
+
+    @asynccontextmanager
+    async def connection(self):
+        """Pooled connection, committed on success and rolled back on error"""
+        start = time.perf_counter()
+        try:
+            async with self.db_pool.connection() as conn:
+                DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - start)
+                yield conn
+        except psycopg.OperationalError:
+            # Check the idle connections as well in case the server restarted
+            self.spawn(self.db_pool.check())
+            raise
+
+    async def load_latest_buffer(self):
+        """Fill the latest-values buffer with the newest rows of sensor_data"""
+        depth = self.latest_buffer.depth
+        async with self.connection() as conn:
+            cursor = await conn.execute(ROWS_WITH_SNAPSHOT, (0, depth))
+            xmin, xmax, rows = split_snapshot_rows(await cursor.fetchall())
+        rows.reverse()
+        self.latest_buffer.load(rows, complete=len(rows) < depth)
+        self.watermark.observe(xmin, xmax, rows[0][0] if rows else None)
+        log.info("Loaded %d values into the latest-values buffer (depth %d)", len(rows), depth)
+
+    async def sync_latest_buffer(self):
+        """Add rows committed by other writers since the commit watermark, then move the watermark.
+
+        Reading from the watermark rather than the newest buffered id also
+        picks up rows that committed behind newer ones; extend() skips the
+        rows already held.
+        """
+        async with self.connection() as conn:
+            cursor = await conn.execute(ROWS_WITH_SNAPSHOT, (self.watermark.value, self.latest_buffer.depth))
+            xmin, xmax, rows = split_snapshot_rows(await cursor.fetchall())
+        self.latest_buffer.extend(rows)
+        self.watermark.observe(xmin, xmax, rows[-1][0] if rows else None)
+
+    async def poll_latest_buffer(self):
+        """sync_latest_buffer() at most once per LATEST_BUFFER_SYNC_MS.
+
+        Callers that find a sync due but already running read the buffer as it is.
+        """
+        if time.monotonic() < self.next_sync or self.sync_lock.locked():
+            return
+        async with self.sync_lock:
+            self.next_sync = time.monotonic() + LATEST_BUFFER_SYNC_MS / 1000
+            await self.sync_latest_buffer()
+
+    async def on_rows_inserted(self):
+        """Notification from the insert trigger: catch up the buffer, then push to streams"""
+        try:
+            await self.sync_latest_buffer()
+        except Exception as e:
+            log.error("Error syncing latest-values buffer: %s", e)
+        self.stream_fanout.wake()
+
+    def on_notify_state(self, connected):
+        """Called from the listener thread"""
+        self.notify_connected = connected
+        if connected:
+            # Rows may have been written while the listener was down
+            self.run_in_loop(self.on_rows_inserted())
+        self.stream_fanout.set_push_mode(connected)
+
+    async def latest_values(self, limit, channel=""):
+        """Newest values of a channel (every channel if empty), newest first, from the buffer when it can answer"""
+        if not self.notify_connected:
+            # Nothing reports other writers' rows, so look for them first
+            await self.poll_latest_buffer()
+        values = self.latest_buffer.latest(limit, channel or None)
+        if values is None:
+            values = await self.query_latest_values(limit, channel)
+        return values
+
+    def fetch_latest_values(self, limit, channel):
+        """Latest values for the stream fan-out thread"""
+        return asyncio.run_coroutine_threadsafe(self.latest_values(limit, channel), self.loop).result()
+
+    async def newest_sequence(self):
+        """Sequence (id) of the newest stored sample, 0 for an empty table"""
+        if not self.notify_connected:
+            await self.poll_latest_buffer()
+        return self.latest_buffer.last_id()
+
+    async def rows_since(self, sequence, limit, channel=""):
+        """Up to limit rows of (id, value) stored after sequence, oldest first.
+
+        Stops at the commit watermark, so no stream moves past a row that may still commit.
+        """
+        if not self.notify_connected or self.watermark.pending:
+            # Also moves the watermark on when no new insert will notify
+            await self.poll_latest_buffer()
+        until = self.watermark.value
+        rows = self.latest_buffer.since(sequence, limit, channel or None, until)
+        if rows is None:
+            rows = await self.query_rows(sequence, limit, channel, until)
+        return rows
+
+    def fetch_rows_since(self, sequence, limit, channel):
+        """Incremental stream rows for the stream fan-out thread"""
+        return asyncio.run_coroutine_threadsafe(self.rows_since(sequence, limit, channel), self.loop).result()
+
+    async def query_rows(self, sequence, limit, channel="", until=None):
+        """Rows of (id, value) after sequence, oldest first, or the newest limit rows for None"""
+        async with self.connection() as conn:
+            cursor = await conn.execute(*rows_query(sequence, limit, channel, until))
+            rows = await cursor.fetchall()
+        if sequence is None:
+            rows.reverse()
+        return rows
+
+    async def catch_up(self, resume_from, window, channel=""):
+        """Incremental updates an incremental stream starts with, oldest first.
+
+        With resume_from every row stored after it, MAX_INCREMENT rows per
+        update; otherwise the latest window up to the commit watermark.
+        """
+        if resume_from <= 0:
+            until = self.watermark.value
+            rows = self.latest_buffer.latest_rows(window, channel or None, until)
+            if rows is None:
+                rows = await self.query_rows(None, window, channel, until)
+            if rows:
+                yield increment_response(rows, channel=channel)
+            return
+        sequence = resume_from
+        while True:
+            rows = await self.rows_since(sequence, MAX_INCREMENT, channel)
+            if rows:
+                yield increment_response(rows, channel=channel)
+                sequence = rows[-1][0]
+            if len(rows) < MAX_INCREMENT:
+                return
+
+    async def query_latest_values(self, limit, channel=""):
+        """Latest values, newest first, read from the database"""
+        async with self.connection() as conn:
+            if channel:
+                cursor = await conn.execute("""
+                    SELECT value FROM sensor_data
+                    WHERE server = %s
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT %s
+                """, (channel, limit))
+            else:
+                cursor = await conn.execute("""
+                    SELECT value FROM sensor_data
+                    ORDER BY timestamp DESC
+                    LIMIT %s
+                """, (limit,))
+            results = await cursor.fetchall()
+        return [row[0] for row in results]
+
+    async def GetData(self, request, context):
+        """Retrieve the latest values"""
+        log.debug("GetData request received: %s", request)
+        try:
+            values = await self.latest_values(50, request.channel)
+            # If there are fewer than 5 entries, pad with zeros
+            while len(values) < 5:
+                values.append(0)
+            log.debug("Returning %d values", len(values))
+            return control_pb2.DataResponse(estado="OK", valores=values, channel=request.channel)
+        except Exception as e:
+            log.error("Error retrieving data: %s", e)
+            return control_pb2.DataResponse(estado="ERROR", valores=[0, 0, 0, 0, 0])
+
+    async def GetLatestByChannel(self, request, context):
+        """Latest values of several channels with a single query"""
+        log.debug("GetLatestByChannel request received: %s", request)
+        try:
+            limit = min(request.limit or DEFAULT_CHANNEL_WINDOW, MAX_CHANNEL_WINDOW)
+            async with self.connection() as conn:
+                channels = list(request.channels)
+                if not channels:
+                    cursor = await conn.execute(CHANNEL_NAMES)
+                    channels = [row[0] for row in await cursor.fetchall()]
+                cursor = await conn.execute(LATEST_BY_CHANNEL, (channels, limit))
+                rows = await cursor.fetchall()
+            return control_pb2.ChannelWindowResponse(success=True, windows=channel_windows(channels, rows))
+        except Exception as e:
+            log.error("Error retrieving channel windows: %s", e)
+            return control_pb2.ChannelWindowResponse(success=False)
+
+    async def SendData(self, request, context):
+        """Store data in PostgreSQL database"""
+        log.debug("SendData request received: %s", request)
+        try:
+            try:
+                value = int(request.mensaje)
+            except ValueError:
+                log.warning("Invalid value format: %s", request.mensaje)
+                return control_pb2.Response(success=False, recibido=f"Invalid value: {request.mensaje}")
+            channel = request.channel or DEFAULT_CHANNEL
+
+            if self.ingest_buffer is not None:
+                wait_for_commit = self.durability == "group"
+                try:
+                    future = self.ingest_buffer.submit((value, channel), wait_for_commit, timeout=0)
+                except IngestBufferFull:
+                    # Wait for room without blocking the event loop
+                    future = await asyncio.to_thread(self.ingest_buffer.submit, (value, channel), wait_for_commit)
+                if future is None:
+                    return control_pb2.Response(success=True, recibido=f"Queued value {value}")
+                record_id = await asyncio.wrap_future(future)
+                log.debug("Stored value %d with ID %d", value, record_id)
+                return control_pb2.Response(success=True, recibido=f"Stored value {value} with ID {record_id}",
+                                            sequence=record_id)
+
+            async with self.connection() as conn:
+                cursor = await conn.execute("""
+                    INSERT INTO sensor_data (value, server)
+                    VALUES (%s, %s) RETURNING id, timestamp
+                """, (value, channel))
+                record_id, timestamp = await cursor.fetchone()
+            # Committed when the connection block exits
+            self.latest_buffer.extend([(record_id, value, channel)])
+            log.debug("Stored value %d with ID %d at %s", value, record_id, timestamp)
+            return control_pb2.Response(success=True, recibido=f"Stored value {value} with ID {record_id}",
+                                        sequence=record_id)
+        except Exception as e:
+            log.error("Error storing data: %s", e)
+            return control_pb2.Response(success=False, recibido=f"Error: {str(e)}")
+
+    async def insert_batch(self, rows):
+        """Insert rows of (value, channel) with one statement and a single commit"""
+        start_time = time.perf_counter()
+        async with self.connection() as conn:
+            # One array parameter per column instead of a statement per row
+            cursor = await conn.execute("""
+                INSERT INTO sensor_data (value, server)
+                SELECT * FROM unnest(%s::int[], %s::text[])
+                RETURNING id, value, server
+            """, ([value for value, _ in rows], [channel for _, channel in rows]))
+            inserted = await cursor.fetchall()
+        elapsed = time.perf_counter() - start_time
+        inserted.sort()
+        self.latest_buffer.extend(inserted)
+        return [row[0] for row in inserted], elapsed
+
+    async def _store_batches(self, batches):
+        """Store an async iterable of row lists, one commit per list, and build the ack response"""
+        acks = []
+        stored = 0
+        rejected = 0
+        total_elapsed = 0.0
+        error = None
+        try:
+            async for rows, batch_rejected in batches:
+                rejected += batch_rejected
+                if not rows:
+                    continue
+                ids, elapsed = await self.insert_batch(rows)
+                stored += len(ids)
+                total_elapsed += elapsed
+                acks.append(control_pb2.BatchAck(
+                    batch=len(acks) + 1,
+                    stored=len(ids),
+                    first_id=ids[0],
+                    last_id=ids[-1],
+                    elapsed_ms=elapsed * 1000,
+                    rows_per_second=len(ids) / elapsed if elapsed > 0 else 0.0
+                ))
+                log.debug("Stored batch %d of %d values in %.1fms", len(acks), len(ids), elapsed * 1000)
+        except Exception as e:
+            # Batches committed before the failure stay acknowledged
+            log.error("Error storing batch: %s", e)
+            error = e
+
+        if error is not None:
+            recibido = f"Error after {len(acks)} batches: {str(error)}"
+        else:
+            recibido = f"Stored {stored} values in {len(acks)} batches"
+        return control_pb2.BatchAckResponse(
+            success=error is None,
+            recibido=recibido,
+            stored=stored,
+            rejected=rejected,
+            rows_per_second=stored / total_elapsed if total_elapsed > 0 else 0.0,
+            batches=acks
+        )
+
+    async def SendBatchData(self, request, context):
+        """Store every DataRequest of a BatchDataRequest with a single insert and commit"""
+        log.debug("SendBatchData request received with %d values", len(request.requests))
+
+        async def batches():
+            yield parse_values(request.requests)
+
+        return await self._store_batches(batches())
+
+    async def SendDataStream(self, request_iterator, context):
+        """Store a client stream of DataRequest messages in batches of ingest_batch_size"""
+        log.debug("SendDataStream started")
+
+        async def batches():
+            pending = []
+            async for data_request in request_iterator:
+                pending.append(data_request)
+                if len(pending) >= self.ingest_batch_size:
+                    yield parse_values(pending)
+                    pending = []
+            if pending:
+                yield parse_values(pending)
+
+        response = await self._store_batches(batches())
+        log.debug("SendDataStream finished: %s", response.recibido)
+        return response
+
+    async def history_window(self, conn, time_range, time_filter, channel=""):
+        """Start and end timestamps covered by a timeRange; (None, None) if there is no data"""
+        cursor = await conn.execute(*window_query(time_range, time_filter, channel))
+        return await cursor.fetchone()
+
+    async def GetHistoricalData(self, request, context):
+        """Retrieve historical data from PostgreSQL database"""
+        log.debug("GetHistoricalData request received: %s", request)
+        try:
+            aggregation = request.aggregation or DEFAULT_AGGREGATION
+            if aggregation not in AGGREGATIONS:
+                log.warning("Invalid aggregation: %s", request.aggregation)
+                return control_pb2.HistoricalDataResponse(success=False, data=[])
+
+            results, aggregation, resolution = await self.query_history(request, aggregation)
+            data_items = [
+                control_pb2.HistoricalDataItem(
+                    value=row[0],
+                    timestamp=row[1].isoformat(),
+                    server=row[2] if row[2] else "main-server"
+                )
+                for row in results
+            ]
+            log.debug("Returning %d historical data points", len(data_items))
+            return control_pb2.HistoricalDataResponse(
+                success=True, data=data_items, aggregation=aggregation, resolution=resolution
+            )
+        except Exception as e:
+            log.error("Error retrieving historical data: %s", e)
+            return control_pb2.HistoricalDataResponse(success=False, data=[])
+
+    async def GetHistoricalColumns(self, request, context):
+        """GetHistoricalData as packed columns, without per-row timestamp formatting"""
+        log.debug("GetHistoricalColumns request received: %s", request)
+        try:
+            aggregation = request.aggregation or DEFAULT_AGGREGATION
+            if aggregation not in AGGREGATIONS:
+                log.warning("Invalid aggregation: %s", request.aggregation)
+                return control_pb2.HistoricalDataColumns(success=False)
+
+            columns, aggregation, resolution = await self.query_history(request, aggregation, columns=True)
+            log.debug("Returning %d historical data points as columns", len(columns.values))
+            return await asyncio.to_thread(encode_columns, columns, aggregation, resolution)
+        except Exception as e:
+            log.error("Error retrieving historical data: %s", e)
+            return control_pb2.HistoricalDataColumns(success=False)
+
+    async def query_history(self, request, aggregation, columns=False):
+        """Rows (value, timestamp, server) for a HistoricalDataRequest, with the aggregation and resolution used.
+
+        With columns, the rows come as Columns instead, raw ones packed into
+        arrays by the database (see columns_query).
+        """
+        time_filter = parse_time_range(request.timeRange)
+        channel = request.channel
+        async with self.connection() as conn:
+            if request.max_points > 0:
+                start, end = await self.history_window(conn, request.timeRange, time_filter, channel)
+                if start is not None:
+                    reduced = await downsample_async(conn.cursor(), start, end, request.max_points,
+                                                     aggregation, channel)
+                    if reduced is not None:
+                        rows = rows_to_columns(reduced[0]) if columns else reduced[0]
+                        return rows, aggregation, reduced[1]
+
+            # Columns also take the id, as the tie-breaker of their order
+            select = "timestamp, id, value, server" if columns else "value, timestamp, server"
+            conditions = []
+            params = []
+            if request.timeRange != "all":
+                conditions.append("timestamp > NOW() - %s::interval")
+                params.append(time_filter)
+            if channel:
+                conditions.append("server = %s")
+                params.append(channel)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            limit = ""
+            if request.timeRange == "all":
+                limit = "LIMIT %s"
+                params.append(request.max_points or 1000)
+            query = f"""
+                SELECT {select} FROM sensor_data
+                {where}
+                ORDER BY timestamp DESC
+                {limit}
+            """
+            if columns:
+                servers = "SELECT %s::text" if channel else CHANNEL_NAMES
+                cursor = await conn.execute(columns_query(query, servers), ([channel] if channel else []) + params)
+                return decode_columns(await cursor.fetchone()), "", "raw"
+            cursor = await conn.execute(query, params)
+            return await cursor.fetchall(), "", "raw"
+
+    async def StreamHistoricalData(self, request, context):
+        """Stream a whole time range in chunks, newest first, from a server-side cursor"""
+        log.debug("StreamHistoricalData request received: %s", request)
+        chunk_size = min(request.chunk_size or HISTORY_CHUNK_SIZE, HISTORY_MAX_CHUNK_SIZE)
+        after = None
+        if request.resume_token:
+            try:
+                since, after_ts, after_id = decode_resume_token(request.resume_token)
+                after = (after_ts, after_id)
+            except (ValueError, KeyError, TypeError) as e:
+                await context.abort(grpc.StatusCode.INVALID_ARGUMENT, f"Invalid resume_token: {e}")
+
+        # Each download holds a connection until it ends; leave the rest of the pool to other RPCs
+        if self.active_history_streams >= HISTORY_MAX_STREAMS:
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED,
+                                f"Too many concurrent history downloads (limit {HISTORY_MAX_STREAMS})")
+        self.active_history_streams += 1
+
+        sent = 0
+        try:
+            async with self.connection() as conn:
+                if after is None:
+                    # Fix the range start now so a resumed download covers the same window
+                    since = None
+                    if request.timeRange != "all":
+                        since = (await self.history_window(conn, request.timeRange,
+                                                           parse_time_range(request.timeRange)))[0]
+
+                conditions = []
+                params = []
+                if request.channel:
+                    conditions.append("server = %s")
+                    params.append(request.channel)
+                if since is not None:
+                    conditions.append("timestamp >= %s")
+                    params.append(since)
+                if after is not None:
+                    conditions.append("(timestamp, id) < (%s, %s)")
+                    params.extend(after)
+                where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+                # Server-side cursor: rows stay on the server and arrive chunk by chunk
+                async with conn.cursor(name=f"history_{uuid.uuid4().hex}") as cursor:
+                    cursor.itersize = chunk_size
+                    await cursor.execute(f"""
+                        SELECT id, value, timestamp, server FROM sensor_data
+                        {where}
+                        ORDER BY timestamp DESC, id DESC
+                    """, params)
+
+                    while True:
+                        rows = await cursor.fetchmany(chunk_size)
+                        last = len(rows) < chunk_size
+                        token = ""
+                        if rows:
+                            token = encode_resume_token(since, rows[-1][2], rows[-1][0])
+                        yield control_pb2.HistoricalDataChunk(
+                            data=[
+                                control_pb2.HistoricalDataItem(
+                                    value=row[1],
+                                    timestamp=row[2].isoformat(),
+                                    server=row[3] if row[3] else "main-server"
+                                )
+                                for row in rows
+                            ],
+                            resume_token=token,
+                            last=last
+                        )
+                        sent += len(rows)
+                        if last:
+                            break
+        except Exception as e:
+            log.error("Error streaming historical data: %s", e)
+            await context.abort(grpc.StatusCode.INTERNAL, f"Error after {sent} rows: {e}")
+        finally:
+            self.active_history_streams -= 1
+        log.debug("StreamHistoricalData sent %d rows", sent)
+
+    async def StreamData(self, request, context):
+        """Stream data updates to the client"""
+        client_id = context.peer()
+        interval_ms = request.interval if request.interval > 0 else 5000  # Default 5 seconds
+        incremental = request.incremental or request.resume_from > 0
+        log.info("New streaming client connected: %s, interval: %dms%s", client_id, interval_ms,
+                 f", incremental from {request.resume_from}" if incremental else "")
+        if request.overflow and request.overflow not in OVERFLOW_POLICIES:
+            await context.abort(grpc.StatusCode.INVALID_ARGUMENT, f"Invalid overflow policy '{request.overflow}'")
+        if request.resume_from > await self.newest_sequence():
+            await context.abort(grpc.StatusCode.OUT_OF_RANGE,
+                                f"resume_from {request.resume_from} is ahead of the newest sample")
+
+        if self.active_streams >= GRPC_MAX_STREAMS:
+            await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED,
+                                f"Too many concurrent streams (limit {GRPC_MAX_STREAMS})")
+        self.active_streams += 1
+
+        subscriber = None
+        try:
+            if incremental:
+                # Replay the missed rows, then let the fan-out continue after the last one sent.
+                # A new stream starts at the commit watermark, which its first window stops at
+                sequence = request.resume_from if request.resume_from > 0 else self.watermark.value
+                async for update in self.catch_up(request.resume_from, window_size(interval_ms), request.channel):
+                    sequence = update.sequences[-1]
+                    yield update
+                subscriber = self.stream_fanout.subscribe(client_id, interval_ms, sequence=sequence,
+                                                          channel=request.channel, overflow=request.overflow)
+            else:
+                subscriber = self.stream_fanout.subscribe(client_id, interval_ms, channel=request.channel,
+                                                          overflow=request.overflow)
+                yield await self.GetData(control_pb2.DataRequest(mensaje="initial", interval=interval_ms,
+                                                                 channel=request.channel), context)
+
+            # A client disconnect cancels this coroutine while it waits here
+            while True:
+                update = await subscriber.get()
+                if update is None:
+                    if subscriber.overflowed:
+                        context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+                        context.set_details(f"Client fell {subscriber.max_queued} updates behind")
+                    break
+                yield update
+        except Exception as e:
+            log.error("Error in StreamData for client %s: %s", client_id, e)
+        finally:
+            if subscriber is not None:
+                self.stream_fanout.unsubscribe(subscriber)
+            self.active_streams -= 1
+            log.info("StreamData for client %s has ended", client_id)
+
+    async def GetStatus(self, request, context):
+        """Report database health, uptime and internal counters"""
+        status = control_pb2.StatusResponse.HEALTHY
+        message = "OK"
+        try:
+            async with self.connection() as conn:
+                await conn.execute("SELECT 1")
+        except Exception as e:
+            status = control_pb2.StatusResponse.DEGRADED
+            message = f"Database unavailable: {e}"
+
+        subscribers = []
+        if request.include_subscribers:
+            newest = self.latest_buffer.last_id()
+            subscribers = [subscriber_status(subscriber, newest) for subscriber in self.stream_fanout.subscribers()]
+
+        return control_pb2.StatusResponse(
+            status=status,
+            message=message,
+            uptime=(time.time() - self.started_at) / 3600,
+            activeConnections=self.active_streams,
+            metrics=self.status_metrics(),
+            subscribers=subscribers
+        )
+
+    def status_metrics(self):
+        """Internal counters by name, as reported by GetStatus"""
+        metrics = {}
+        for name, value in self.latest_buffer.stats().items():
+            metrics[f"latest_buffer_{name}"] = value
+        for name, value in self.watermark.stats().items():
+            metrics[f"commit_watermark_{name}"] = value
+        pool_stats = self.db_pool.get_stats()
+        metrics["db_pool_size"] = pool_stats["pool_size"]
+        metrics["db_pool_idle"] = pool_stats["pool_available"]
+        metrics["db_pool_in_use"] = pool_stats["pool_size"] - pool_stats["pool_available"]
+        metrics["db_pool_max"] = pool_stats["pool_max"]
+        metrics["stream_subscribers"] = self.stream_fanout.subscriber_count()
+        for name, value in self.stream_fanout.stats().items():
+            metrics[f"stream_{name}"] = value
+        if self.ingest_buffer is not None:
+            for name, value in self.ingest_buffer.stats().items():
+                metrics[f"ingest_{name}"] = value
+        for name, value in self.retention.stats().items():
+            metrics[f"retention_{name}"] = value
+        for name, value in self.rollups.stats().items():
+            metrics[f"rollup_{name}"] = value
+        metrics["stream_active"] = self.active_streams
+        metrics["history_stream_active"] = self.active_history_streams
+        for name, value in logs.stats().items():
+            metrics[f"log_{name}"] = value
+        return metrics
+
+
+async def open_pool(db_settings):
+    """Open the asyncio connection pool, retrying until the database is reachable"""
+    log.info("Starting async SQL connection pool to %s:%s", db_settings["host"], db_settings["port"])
+    while True:
+        pool = AsyncConnectionPool(
+            make_conninfo(**db_settings),
+            min_size=int(os.getenv("DB_POOL_MIN", "2")),
+            max_size=int(os.getenv("DB_POOL_MAX", str(GRPC_MAX_WORKERS))),
+            timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+            kwargs={"cursor_factory": TimedAsyncCursor},
+            open=False
+        )
+        try:
+            await pool.open(wait=True, timeout=10)
+            log.info("Connected to PostgreSQL database at %s:%s (pool min=%d, max=%d)",
+                     db_settings["host"], db_settings["port"], pool.min_size, pool.max_size)
+            return pool
+        except Exception as e:
+            log.error("Failed to connect to database: %s", e)
+            await pool.close()
+            # Wait and try again instead of raising
+            await asyncio.sleep(5)
+
+
+async def serve():
+    """Start the grpc.aio server"""
+    db_settings = db_settings_from_env()
+    db_pool = await open_pool(db_settings)
+    servicer = AsyncControlServiceServicer(db_pool, db_settings)
+    await servicer.start()
+
+    server = grpc.aio.server(interceptors=[AsyncMetricsInterceptor()], options=server_options())
+    if METRICS_PORT:
+        serve_metrics(METRICS_PORT)
+    control_pb2_grpc.add_ControlServiceServicer_to_server(servicer, server)
+    server_address = '[::]:50051'
+    server.add_insecure_port(server_address)
+    await server.start()
+    log.info("gRPC asyncio server running on %s", server_address)
+    # Container stop sends SIGTERM: stop serving, then run the cleanup below
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: servicer.spawn(server.stop(5)))
+    try:
+        await server.wait_for_termination()
+    finally:
+        await server.stop(0)
+        if servicer.ingest_buffer is not None:
+            # Commit the rows that were already acknowledged; the flusher needs the loop
+            await asyncio.to_thread(servicer.ingest_buffer.close)
+        await db_pool.close()
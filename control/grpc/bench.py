@@ -0,0 +1,375 @@
+"""Load generator and benchmark for the gRPC service.
+
+Runs the server once per mode (GRPC_SERVER_MODE) against the PostgreSQL
+database of the DB_* settings, and drives it from a grpc.aio client:
+
+  --streams      StreamData subscriptions held open for the whole run
+                 (--incremental-streams for incremental ones)
+  --concurrency  workers issuing unary calls back to back for --duration seconds
+  --mix          share of each unary call in the load, e.g.
+                 get=0.7,send=0.2,history=0.1 (GetData, SendData, GetHistoricalData)
+
+The server runs as a separate server.py process, or with --in-process as a
+ControlServiceServicer inside this process on a free port (no process
+start-up, but client and server share one interpreter, so only one mode
+per run). With --target the already running server at that address is
+measured instead.
+
+Reports calls/s and p50/p95/p99 latency per call type, stream updates received,
+and the server's resident memory and thread count sampled near the end of the
+run (read from /proc, so Linux only, and not for --target). --json writes the
+results as JSON; --baseline compares them with an earlier --json file and
+exits with status 1 if a rate fell or a latency grew by more than --tolerance.
+
+    python bench.py --modes thread,asyncio --streams 200 --concurrency 64 --duration 10
+    python bench.py --modes thread --in-process --mix get=0.5,send=0.5 --json run.json --baseline main.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent import futures
+
+import grpc
+
+import control_pb2
+import control_pb2_grpc
+
+SERVER_ADDRESS = "localhost:50051"
+
+# --mix names of the unary calls
+OPERATIONS = ("get", "send", "history")
+
+# Results compared with the baseline: higher is better for rates, lower for latencies
+HIGHER_IS_BETTER = ("calls_per_second", "updates_per_second")
+LOWER_IS_BETTER = ("p50_ms", "p95_ms", "p99_ms")
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def parse_mix(text):
+    """{operation: share} from "get=0.7,send=0.3"; shares are normalized to sum to 1"""
+    mix = {}
+    for part in text.split(","):
+        name, _, share = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation '{name}', expected one of {', '.join(OPERATIONS)}")
+        try:
+            mix[name] = float(share)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Invalid share '{share}' for {name}")
+    total = sum(mix.values())
+    if total <= 0:
+        raise argparse.ArgumentTypeError("The mix needs at least one positive share")
+    return {name: round(share / total, 4) for name, share in mix.items() if share > 0}
+
+
+async def wait_ready(target, timeout):
+    deadline = time.monotonic() + timeout
+    async with grpc.aio.insecure_channel(target) as channel:
+        stub = control_pb2_grpc.ControlServiceStub(channel)
+        while True:
+            try:
+                await stub.GetStatus(control_pb2.StatusRequest(), timeout=2)
+                return
+            except grpc.aio.AioRpcError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.5)
+
+
+async def hold_stream(stub, request, received, stop):
+    call = stub.StreamData(request)
+    try:
+        async for _ in call:
+            received[0] += 1
+            if stop.is_set():
+                break
+    except grpc.aio.AioRpcError as e:
+        if e.code() != grpc.StatusCode.CANCELLED:
+            received[1] += 1
+    finally:
+        call.cancel()
+
+
+async def call_once(stub, operation, args):
+    """Issue one unary call; returns whether it succeeded"""
+    if operation == "send":
+        response = await stub.SendData(control_pb2.DataRequest(mensaje=str(random.randint(0, 100))))
+        return response.success
+    if operation == "history":
+        response = await stub.GetHistoricalData(control_pb2.HistoricalDataRequest(
+            timeRange=args.history_range, max_points=args.history_points))
+        return response.success
+    response = await stub.GetData(control_pb2.DataRequest(mensaje="bench"))
+    return response.estado == "OK"
+
+
+async def unary_worker(stub, args, latencies, errors, stop):
+    operations = list(args.mix)
+    weights = [args.mix[operation] for operation in operations]
+    while not stop.is_set():
+        operation = random.choices(operations, weights)[0]
+        start = time.perf_counter()
+        try:
+            ok = await call_once(stub, operation, args)
+        except grpc.aio.AioRpcError:
+            ok = False
+        latencies[operation].append(time.perf_counter() - start)
+        if not ok:
+            errors[operation] += 1
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "calls": len(latencies),
+        "calls_per_second": len(latencies) / elapsed,
+        "errors": errors,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": (latencies[-1] if latencies else 0.0) * 1000
+    }
+
+
+async def run_load(target, args):
+    async with grpc.aio.insecure_channel(target) as channel:
+        stub = control_pb2_grpc.ControlServiceStub(channel)
+        stop = asyncio.Event()
+        stream_counts = [0, 0]  # updates received, failed streams
+        streams = [
+            asyncio.create_task(hold_stream(
+                stub, control_pb2.StreamRequest(interval=args.stream_interval, incremental=i < args.incremental_streams),
+                stream_counts, stop))
+            for i in range(args.streams)
+        ]
+        # Let the subscriptions settle before measuring
+        await asyncio.sleep(1)
+        stream_counts[0] = 0
+
+        latencies = {operation: [] for operation in args.mix}
+        errors = {operation: 0 for operation in args.mix}
+        workers = [
+            asyncio.create_task(unary_worker(stub, args, latencies, errors, stop))
+            for _ in range(args.concurrency)
+        ]
+        started = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        stop.set()
+        await asyncio.gather(*workers)
+        elapsed = time.perf_counter() - started
+        updates = stream_counts[0]
+        for task in streams:
+            task.cancel()
+        await asyncio.gather(*streams, return_exceptions=True)
+
+    result = summarize([value for values in latencies.values() for value in values], sum(errors.values()), elapsed)
+    result["operations"] = {
+        operation: summarize(latencies[operation], errors[operation], elapsed) for operation in args.mix
+    }
+    result["stream_updates"] = updates
+    result["updates_per_second"] = updates / elapsed
+    result["failed_streams"] = stream_counts[1]
+    return result
+
+
+def process_usage(pid):
+    """Resident memory in MB and thread count of a process, from /proc"""
+    usage = {"rss_mb": 0.0, "threads": 0}
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    usage["rss_mb"] = int(line.split()[1]) / 1024
+                elif line.startswith("Threads:"):
+                    usage["threads"] = int(line.split()[1])
+    except OSError:
+        pass
+    return usage
+
+
+async def run_and_measure(target, args, pid):
+    load = asyncio.create_task(run_load(target, args))
+    # Sample while the streams are still open
+    await asyncio.sleep(1 + args.duration * 0.9)
+    usage = process_usage(pid) if pid else {"rss_mb": 0.0, "threads": 0}
+    result = await load
+    result.update(usage)
+    return result
+
+
+def start_server(mode):
+    """server.py in a child process; returns (target, pid, stop)"""
+    env = dict(os.environ, GRPC_SERVER_MODE=mode)
+    # Request logging would dominate the measurement, so discard it
+    process = subprocess.Popen(
+        [sys.executable, "server.py"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+    def stop():
+        process.terminate()
+        process.wait()
+    return SERVER_ADDRESS, process.pid, stop
+
+
+def start_in_process(mode):
+    """The servicer of mode on a free local port of this process; returns (target, pid, stop).
+
+    Its background threads (fan-out, notify listener, rollups, retention)
+    keep running until the benchmark exits, which is why main() allows a
+    single mode with --in-process.
+    """
+    import server
+    from rpc_metrics import MetricsInterceptor, AsyncMetricsInterceptor
+
+    if mode == "thread":
+        grpc_server = grpc.server(
+            futures.ThreadPoolExecutor(
+                max_workers=server.GRPC_MAX_WORKERS + server.GRPC_MAX_STREAMS + server.HISTORY_MAX_STREAMS),
+            interceptors=[MetricsInterceptor()], options=server.server_options())
+        control_pb2_grpc.add_ControlServiceServicer_to_server(server.ControlServiceServicer(), grpc_server)
+        port = grpc_server.add_insecure_port("localhost:0")
+        grpc_server.start()
+        return f"localhost:{port}", os.getpid(), lambda: grpc_server.stop(0)
+
+    import aio_server
+    from db_pool import db_settings_from_env
+
+    async def start():
+        db_settings = db_settings_from_env()
+        db_pool = await aio_server.open_pool(db_settings)
+        servicer = aio_server.AsyncControlServiceServicer(db_pool, db_settings)
+        await servicer.start()
+        grpc_server = grpc.aio.server(interceptors=[AsyncMetricsInterceptor()], options=aio_server.server_options())
+        control_pb2_grpc.add_ControlServiceServicer_to_server(servicer, grpc_server)
+        port = grpc_server.add_insecure_port("localhost:0")
+        await grpc_server.start()
+        return grpc_server, port
+
+    # The server gets an event loop of its own, apart from the load generator's
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="bench-server", daemon=True).start()
+    grpc_server, port = asyncio.run_coroutine_threadsafe(start(), loop).result()
+    return f"localhost:{port}", os.getpid(), lambda: asyncio.run_coroutine_threadsafe(grpc_server.stop(0), loop).result()
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing each result worse than the baseline by more than tolerance"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("runs", {}).get(name)
+        if base is None:
+            continue
+        pairs = [(name, result, base)]
+        for operation, operation_result in result.get("operations", {}).items():
+            if operation in base.get("operations", {}):
+                pairs.append((f"{name} {operation}", operation_result, base["operations"][operation]))
+        for label, current, previous in pairs:
+            for key in HIGHER_IS_BETTER:
+                if key in current and previous.get(key) and current[key] < previous[key] * (1 - tolerance):
+                    regressions.append(f"{label} {key}: {current[key]:.1f} < baseline {previous[key]:.1f}")
+            for key in LOWER_IS_BETTER:
+                if key in current and previous.get(key) and current[key] > previous[key] * (1 + tolerance):
+                    regressions.append(f"{label} {key}: {current[key]:.2f} > baseline {previous[key]:.2f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="thread,asyncio")
+    parser.add_argument("--target", default="", help="Measure a running server instead of starting one")
+    parser.add_argument("--in-process", action="store_true", help="Run the servicer inside this process")
+    parser.add_argument("--streams", type=int, default=100)
+    parser.add_argument("--incremental-streams", type=int, default=0,
+                        help="How many of the --streams are incremental")
+    parser.add_argument("--stream-interval", type=int, default=1000, help="StreamData interval in ms")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("get=0.8,send=0.2"))
+    parser.add_argument("--history-range", default="1h", help="timeRange of GetHistoricalData calls")
+    parser.add_argument("--history-points", type=int, default=500, help="max_points of GetHistoricalData calls")
+    parser.add_argument("--json", default="", help="Write the results to this file, - for stdout")
+    parser.add_argument("--baseline", default="", help="Results of an earlier --json run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    modes = [args.target] if args.target else args.modes.split(",")
+    if args.in_process and not args.target and len(modes) > 1:
+        # The first servicer's threads would still poll the database while the next mode is measured
+        parser.error("--in-process measures one mode per run; pass a single --modes value")
+    results = {}
+    for mode in modes:
+        if args.target:
+            target, pid, stop = args.target, None, None
+        elif args.in_process:
+            target, pid, stop = start_in_process(mode)
+        else:
+            target, pid, stop = start_server(mode)
+        try:
+            asyncio.run(wait_ready(target, timeout=60))
+            print(f"Running {mode}: {args.streams} streams, {args.concurrency} workers, {args.duration}s",
+                  file=sys.stderr)
+            results[mode] = asyncio.run(run_and_measure(target, args, pid))
+        finally:
+            if stop is not None:
+                stop()
+
+    print(f"{'mode':<10} {'call':<8} {'calls/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+          f"{'errors':>7}", file=sys.stderr)
+    for mode, result in results.items():
+        for operation, row in [("all", result)] + list(result["operations"].items()):
+            print(f"{mode:<10} {operation:<8} {row['calls_per_second']:>10.0f} {row['p50_ms']:>8.2f} "
+                  f"{row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f} {row['max_ms']:>8.2f} {row['errors']:>7}",
+                  file=sys.stderr)
+        print(f"{mode:<10} streams: {result['stream_updates']} updates ({result['updates_per_second']:.0f}/s), "
+              f"{result['failed_streams']} failed, rss {result['rss_mb']:.1f} MB, {result['threads']} threads",
+              file=sys.stderr)
+
+    report = {
+        "config": {
+            "streams": args.streams,
+            "incremental_streams": args.incremental_streams,
+            "stream_interval": args.stream_interval,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "mix": args.mix,
+            "in_process": args.in_process
+        },
+        "runs": results
+    }
+    if args.json == "-":
+        print(json.dumps(report, indent=2))
+    elif args.json:
+        with open(args.json, "w") as output:
+            json.dump(report, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get("config") != report["config"]:
+            print(f"Warning: {args.baseline} was run with a different configuration", file=sys.stderr)
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"Regression: {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"No regression beyond {args.tolerance:.0%} of {args.baseline}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
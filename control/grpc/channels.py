@@ -0,0 +1,74 @@
+import control_pb2
+
+# A channel is one series of samples, stored in the server column of sensor_data.
+# Requests with an empty channel write to DEFAULT_CHANNEL and read every channel.
+DEFAULT_CHANNEL = "main-server"
+
+# Values per channel returned by GetLatestByChannel
+DEFAULT_CHANNEL_WINDOW = 10
+MAX_CHANNEL_WINDOW = 1000
+
+# Channel names in use, read as a skip scan over the (server, timestamp, id)
+# index: one index probe per channel instead of a scan of the table
+CHANNEL_NAMES = """
+    WITH RECURSIVE channels AS (
+        (SELECT server FROM sensor_data WHERE server IS NOT NULL ORDER BY server LIMIT 1)
+        UNION ALL
+        SELECT (SELECT server FROM sensor_data WHERE server > c.server ORDER BY server LIMIT 1)
+        FROM channels c
+        WHERE c.server IS NOT NULL
+    )
+    SELECT server FROM channels WHERE server IS NOT NULL
+"""
+
+# Latest window of each channel in a list, in one query: a LATERAL index
+# scan per channel. Rows are (channel, id, value), newest first per channel
+LATEST_BY_CHANNEL = """
+    SELECT c.channel, d.id, d.value
+    FROM unnest(%s::text[]) AS c(channel)
+    CROSS JOIN LATERAL (
+        SELECT id, value, timestamp FROM sensor_data
+        WHERE server = c.channel
+        ORDER BY timestamp DESC, id DESC
+        LIMIT %s
+    ) AS d
+    ORDER BY c.channel, d.timestamp DESC, d.id DESC
+"""
+
+
+def rows_query(sequence, limit, channel, until=None):
+    """Query for up to limit rows of (id, value) after sequence, or the newest ones for None.
+
+    Rows after a sequence come oldest first, the newest ones newest first.
+    until leaves out rows with a higher id.
+    """
+    conditions = []
+    params = []
+    if sequence is not None:
+        conditions.append("id > %s")
+        params.append(sequence)
+    if until is not None:
+        conditions.append("id <= %s")
+        params.append(until)
+    if channel:
+        conditions.append("server = %s")
+        params.append(channel)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    order = "id" if sequence is not None else "id DESC"
+    params.append(limit)
+    return f"""
+        SELECT id, value FROM sensor_data
+        {where}
+        ORDER BY {order}
+        LIMIT %s
+    """, params
+
+
+def channel_windows(channels, rows):
+    """ChannelWindow messages, in the order of channels, from LATEST_BY_CHANNEL rows"""
+    windows = {channel: control_pb2.ChannelWindow(channel=channel) for channel in channels}
+    for channel, record_id, value in rows:
+        window = windows[channel]
+        window.valores.append(value)
+        window.sequences.append(record_id)
+    return list(windows.values())
@@ -8,13 +8,26 @@ def run(value=None):
     Run the gRPC client.
     
     Args:
-        value (str, optional): The value to send to the server. If provided, will make a SendData request.
+        value (str or list, optional): The value to send to the server. If provided, will make a SendData request.
+                               A list of values is sent with a single SendBatchData request.
                                If not provided, will make a GetData request.
     """
     with grpc.insecure_channel('localhost:50051') as channel:
         stub = control_pb2_grpc.ControlServiceStub(channel)
         
-        if value is not None:
+        if isinstance(value, list):
+            # Send all values in one batch
+            try:
+                batch = control_pb2.BatchDataRequest(
+                    requests=[control_pb2.DataRequest(mensaje=v) for v in value]
+                )
+                batch_response = stub.SendBatchData(batch)
+                print(f"Batch sent. Server received: {batch_response.recibido}")
+                print(f"Stored: {batch_response.stored}, rejected: {batch_response.rejected}, "
+                      f"rate: {batch_response.rows_per_second:.0f} rows/s")
+            except grpc.RpcError as e:
+                print(f"Failed to send batch: {e.details()}")
+        elif value is not None:
             # Send data to the server
             try:
                 send_response = stub.SendData(control_pb2.DataRequest(mensaje=value))
@@ -34,7 +47,11 @@ def run(value=None):
 
 if __name__ == "__main__":
     # Check if a value was provided as a command line argument
-    if len(sys.argv) > 1:
+    if len(sys.argv) > 2:
+        values = sys.argv[1:]
+        print(f"Sending {len(values)} values in one batch")
+        run(values)
+    elif len(sys.argv) > 1:
         value = sys.argv[1]
         print(f"Sending value: {value}")
         run(value)
@@ -0,0 +1,75 @@
+from collections import namedtuple
+
+import numpy as np
+
+import control_pb2
+
+# Raw history rows for the columnar format carry this instead of the timestamp itself,
+# so no datetime object is built per row
+EPOCH_US = "(extract(epoch FROM timestamp) * 1000000)::int8"
+
+# Arrays of one history response, newest first; servers are the names server_index points into
+Columns = namedtuple("Columns", ["timestamps", "values", "servers", "server_index"])
+
+
+def columns_query(query, servers):
+    """SELECT of one row (servers, count, timestamps, values, server_index) for the rows of query.
+
+    query selects sensor_data rows (timestamp, id, value, server); servers
+    selects the names server_index points into. PostgreSQL packs each
+    column into a bytea of big-endian int8send/int4send values, so neither
+    side builds an object per row. A single statement reads the names and
+    the rows in one snapshot, so every row's server is among the names.
+    """
+    order = "ORDER BY timestamp DESC, id DESC"
+    return f"""
+        WITH servers AS (
+            SELECT ARRAY(SELECT name FROM ({servers}) AS s(name) UNION SELECT 'main-server' ORDER BY 1) AS names
+        )
+        SELECT (SELECT names FROM servers), COUNT(*),
+               string_agg(int8send(COALESCE({EPOCH_US}, 0)), '' {order}),
+               string_agg(int4send(value), '' {order}),
+               string_agg(int4send(array_position((SELECT names FROM servers), COALESCE(server, 'main-server')) - 1),
+                          '' {order})
+        FROM ({query}) AS rows
+    """
+
+
+def decode_columns(row):
+    """Columns from the row of a columns_query"""
+    servers, count, timestamps, values, server_index = row
+    timestamps = np.frombuffer(timestamps or b"", dtype=">i8").astype("<i8")
+    values = np.frombuffer(values or b"", dtype=">i4").astype("<i4")
+    server_index = np.frombuffer(server_index or b"", dtype=">i4").astype("<i4")
+    # string_agg skips NULLs, which would shift every later row
+    if not len(timestamps) == len(values) == len(server_index) == count:
+        raise ValueError("Packed history columns differ in length")
+    return Columns(timestamps, values, servers, server_index)
+
+
+def rows_to_columns(rows):
+    """Columns from rows of (value, datetime, server): downsampled points, at most the point budget.
+
+    Servers are dictionary-encoded in order of first use.
+    """
+    count = len(rows)
+    values = np.fromiter((row[0] for row in rows), dtype="<i4", count=count)
+    timestamps = np.array([row[1] for row in rows], dtype="datetime64[us]").astype("<i8")
+    servers = {}
+    server_index = np.fromiter((servers.setdefault(row[2] or "main-server", len(servers)) for row in rows),
+                               dtype="<i4", count=count)
+    return Columns(timestamps, values, list(servers), server_index)
+
+
+def encode_columns(columns, aggregation="", resolution="raw"):
+    """HistoricalDataColumns of Columns, each array packed as little-endian bytes"""
+    return control_pb2.HistoricalDataColumns(
+        success=True,
+        count=len(columns.values),
+        timestamps=columns.timestamps.tobytes(),
+        values=columns.values.tobytes(),
+        servers=columns.servers,
+        server_index=columns.server_index.tobytes(),
+        aggregation=aggregation,
+        resolution=resolution
+    )
@@ -13,13 +13,15 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\rcontrol.proto\"\x07\n\x05\x45mpty\"0\n\x0b\x44\x61taRequest\x12\x0f\n\x07mensaje\x18\x01 \x01(\t\x12\x10\n\x08interval\x18\x02 \x01(\x05\"B\n\x0c\x44\x61taResponse\x12\x0e\n\x06\x65stado\x18\x01 \x01(\t\x12\x0f\n\x07valores\x18\x02 \x03(\x05\x12\x11\n\ttimestamp\x18\x03 \x01(\x03\"-\n\x08Response\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x10\n\x08recibido\x18\x02 \x01(\t\"*\n\x15HistoricalDataRequest\x12\x11\n\ttimeRange\x18\x01 \x01(\t\"F\n\x12HistoricalDataItem\x12\r\n\x05value\x18\x01 \x01(\x05\x12\x11\n\ttimestamp\x18\x02 \x01(\t\x12\x0e\n\x06server\x18\x03 \x01(\t\"L\n\x16HistoricalDataResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12!\n\x04\x64\x61ta\x18\x02 \x03(\x0b\x32\x13.HistoricalDataItem\"#\n\rStatusRequest\x12\x12\n\nserverName\x18\x01 \x01(\t\"\xb0\x01\n\x0eStatusResponse\x12&\n\x06status\x18\x01 \x01(\x0e\x32\x16.StatusResponse.Status\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x0e\n\x06uptime\x18\x03 \x01(\x02\x12\x19\n\x11\x61\x63tiveConnections\x18\x04 \x01(\x05\":\n\x06Status\x12\x0b\n\x07UNKNOWN\x10\x00\x12\x0b\n\x07HEALTHY\x10\x01\x12\x0c\n\x08\x44\x45GRADED\x10\x02\x12\x08\n\x04\x44OWN\x10\x03\"1\n\x0b\x41uthRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\">\n\x0c\x41uthResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\r\n\x05token\x18\x02 \x01(\t\x12\x0e\n\x06\x65xpiry\x18\x03 \x01(\x03\"#\n\rConfigRequest\x12\x12\n\nconfigName\x18\x01 \x01(\t\"\x80\x01\n\x0e\x43onfigResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12-\n\x07\x63onfigs\x18\x02 \x03(\x0b\x32\x1c.ConfigResponse.ConfigsEntry\x1a.\n\x0c\x43onfigsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"y\n\x13UpdateConfigRequest\x12\x32\n\x07\x63onfigs\x18\x01 \x03(\x0b\x32!.UpdateConfigRequest.ConfigsEntry\x1a.\n\x0c\x43onfigsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"2\n\x10\x42\x61tchDataRequest\x12\x1e\n\x08requests\x18\x01 \x03(\x0b\x32\x0c.DataRequest\"5\n\x11\x42\x61tchDataResponse\x12 \n\tresponses\x18\x01 \x03(\x0b\x32\r.DataResponse\"3\n\rStreamRequest\x12\x10\n\x08interval\x18\x01 \x01(\x05\x12\x10\n\x08\x63lientId\x18\x02 \x01(\t\">\n\x0c\x45rrorDetails\x12\x0c\n\x04\x63ode\x18\x01 \x01(\x05\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x0f\n\x07\x64\x65tails\x18\x03 \x01(\t2\xda\x01\n\x0e\x43ontrolService\x12(\n\x07GetData\x12\x0c.DataRequest\x1a\r.DataResponse\"\x00\x12%\n\x08SendData\x12\x0c.DataRequest\x1a\t.Response\"\x00\x12\x46\n\x11GetHistoricalData\x12\x16.HistoricalDataRequest\x1a\x17.HistoricalDataResponse\"\x00\x12/\n\nStreamData\x12\x0e.StreamRequest\x1a\r.DataResponse\"\x00\x30\x01\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\rcontrol.proto\"\x07\n\x05\x45mpty\"A\n\x0b\x44\x61taRequest\x12\x0f\n\x07mensaje\x18\x01 \x01(\t\x12\x10\n\x08interval\x18\x02 \x01(\x05\x12\x0f\n\x07\x63hannel\x18\x03 \x01(\t\"f\n\x0c\x44\x61taResponse\x12\x0e\n\x06\x65stado\x18\x01 \x01(\t\x12\x0f\n\x07valores\x18\x02 \x03(\x05\x12\x11\n\ttimestamp\x18\x03 \x01(\x03\x12\x11\n\tsequences\x18\x04 \x03(\x03\x12\x0f\n\x07\x63hannel\x18\x05 \x01(\t\"?\n\x08Response\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x10\n\x08recibido\x18\x02 \x01(\t\x12\x10\n\x08sequence\x18\x03 \x01(\x03\"\x8e\x01\n\x15HistoricalDataRequest\x12\x11\n\ttimeRange\x18\x01 \x01(\t\x12\x12\n\nmax_points\x18\x02 \x01(\x05\x12\x13\n\x0b\x61ggregation\x18\x03 \x01(\t\x12\x12\n\nchunk_size\x18\x04 \x01(\x05\x12\x14\n\x0cresume_token\x18\x05 \x01(\t\x12\x0f\n\x07\x63hannel\x18\x06 \x01(\t\"F\n\x12HistoricalDataItem\x12\r\n\x05value\x18\x01 \x01(\x05\x12\x11\n\ttimestamp\x18\x02 \x01(\t\x12\x0e\n\x06server\x18\x03 \x01(\t\"u\n\x16HistoricalDataResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12!\n\x04\x64\x61ta\x18\x02 \x03(\x0b\x32\x13.HistoricalDataItem\x12\x13\n\x0b\x61ggregation\x18\x03 \x01(\t\x12\x12\n\nresolution\x18\x04 \x01(\t\"\xbd\x01\n\x15HistoricalDataColumns\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07servers\x18\x04 \x03(\t\x12\x13\n\x0b\x61ggregation\x18\x06 \x01(\t\x12\x12\n\nresolution\x18\x07 \x01(\t\x12\r\n\x05\x63ount\x18\x08 \x01(\x05\x12\x12\n\ntimestamps\x18\t \x01(\x0c\x12\x0e\n\x06values\x18\n \x01(\x0c\x12\x14\n\x0cserver_index\x18\x0b \x01(\x0cJ\x04\x08\x02\x10\x03J\x04\x08\x03\x10\x04J\x04\x08\x05\x10\x06\"\\\n\x13HistoricalDataChunk\x12!\n\x04\x64\x61ta\x18\x01 \x03(\x0b\x32\x13.HistoricalDataItem\x12\x14\n\x0cresume_token\x18\x02 \x01(\t\x12\x0c\n\x04last\x18\x03 \x01(\x08\"@\n\rStatusRequest\x12\x12\n\nserverName\x18\x01 \x01(\t\x12\x1b\n\x13include_subscribers\x18\x02 \x01(\x08\"\xd4\x01\n\x10SubscriberStatus\x12\x11\n\tclient_id\x18\x01 \x01(\t\x12\x10\n\x08interval\x18\x02 \x01(\x05\x12\x0f\n\x07\x63hannel\x18\x03 \x01(\t\x12\x10\n\x08overflow\x18\x04 \x01(\t\x12\x0e\n\x06queued\x18\x05 \x01(\x05\x12\x0e\n\x06lag_ms\x18\x06 \x01(\x01\x12\x0c\n\x04sent\x18\x07 \x01(\x03\x12\x0f\n\x07\x64ropped\x18\x08 \x01(\x03\x12\x11\n\tcoalesced\x18\t \x01(\x03\x12\x10\n\x08\x64\x65\x66\x65rred\x18\n \x01(\x03\x12\x14\n\x0csequence_lag\x18\x0b \x01(\x03\"\xb7\x02\n\x0eStatusResponse\x12&\n\x06status\x18\x01 \x01(\x0e\x32\x16.StatusResponse.Status\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x0e\n\x06uptime\x18\x03 \x01(\x02\x12\x19\n\x11\x61\x63tiveConnections\x18\x04 \x01(\x05\x12-\n\x07metrics\x18\x05 \x03(\x0b\x32\x1c.StatusResponse.MetricsEntry\x12&\n\x0bsubscribers\x18\x06 \x03(\x0b\x32\x11.SubscriberStatus\x1a.\n\x0cMetricsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x01:\x02\x38\x01\":\n\x06Status\x12\x0b\n\x07UNKNOWN\x10\x00\x12\x0b\n\x07HEALTHY\x10\x01\x12\x0c\n\x08\x44\x45GRADED\x10\x02\x12\x08\n\x04\x44OWN\x10\x03\"1\n\x0b\x41uthRequest\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x10\n\x08password\x18\x02 \x01(\t\">\n\x0c\x41uthResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\r\n\x05token\x18\x02 \x01(\t\x12\x0e\n\x06\x65xpiry\x18\x03 \x01(\x03\"#\n\rConfigRequest\x12\x12\n\nconfigName\x18\x01 \x01(\t\"\x80\x01\n\x0e\x43onfigResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12-\n\x07\x63onfigs\x18\x02 \x03(\x0b\x32\x1c.ConfigResponse.ConfigsEntry\x1a.\n\x0c\x43onfigsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"y\n\x13UpdateConfigRequest\x12\x32\n\x07\x63onfigs\x18\x01 \x03(\x0b\x32!.UpdateConfigRequest.ConfigsEntry\x1a.\n\x0c\x43onfigsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t:\x02\x38\x01\"2\n\x10\x42\x61tchDataRequest\x12\x1e\n\x08requests\x18\x01 \x03(\x0b\x32\x0c.DataRequest\"5\n\x11\x42\x61tchDataResponse\x12 \n\tresponses\x18\x01 \x03(\x0b\x32\r.DataResponse\"y\n\x08\x42\x61tchAck\x12\r\n\x05\x62\x61tch\x18\x01 \x01(\x05\x12\x0e\n\x06stored\x18\x02 \x01(\x05\x12\x10\n\x08\x66irst_id\x18\x03 \x01(\x03\x12\x0f\n\x07last_id\x18\x04 \x01(\x03\x12\x12\n\nelapsed_ms\x18\x05 \x01(\x01\x12\x17\n\x0frows_per_second\x18\x06 \x01(\x01\"\x8c\x01\n\x10\x42\x61tchAckResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x10\n\x08recibido\x18\x02 \x01(\t\x12\x0e\n\x06stored\x18\x03 \x01(\x05\x12\x10\n\x08rejected\x18\x04 \x01(\x05\x12\x17\n\x0frows_per_second\x18\x05 \x01(\x01\x12\x1a\n\x07\x62\x61tches\x18\x06 \x03(\x0b\x32\t.BatchAck\"\x80\x01\n\rStreamRequest\x12\x10\n\x08interval\x18\x01 \x01(\x05\x12\x10\n\x08\x63lientId\x18\x02 \x01(\t\x12\x13\n\x0bincremental\x18\x03 \x01(\x08\x12\x13\n\x0bresume_from\x18\x04 \x01(\x03\x12\x0f\n\x07\x63hannel\x18\x05 \x01(\t\x12\x10\n\x08overflow\x18\x06 \x01(\t\"7\n\x14\x43hannelWindowRequest\x12\x10\n\x08\x63hannels\x18\x01 \x03(\t\x12\r\n\x05limit\x18\x02 \x01(\x05\"D\n\rChannelWindow\x12\x0f\n\x07\x63hannel\x18\x01 \x01(\t\x12\x0f\n\x07valores\x18\x02 \x03(\x05\x12\x11\n\tsequences\x18\x03 \x03(\x03\"I\n\x15\x43hannelWindowResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x1f\n\x07windows\x18\x02 \x03(\x0b\x32\x0e.ChannelWindow\">\n\x0c\x45rrorDetails\x12\x0c\n\x04\x63ode\x18\x01 \x01(\x05\x12\x0f\n\x07message\x18\x02 \x01(\t\x12\x0f\n\x07\x64\x65tails\x18\x03 \x01(\t2\xd5\x04\n\x0e\x43ontrolService\x12(\n\x07GetData\x12\x0c.DataRequest\x1a\r.DataResponse\"\x00\x12\x45\n\x12GetLatestByChannel\x12\x15.ChannelWindowRequest\x1a\x16.ChannelWindowResponse\"\x00\x12%\n\x08SendData\x12\x0c.DataRequest\x1a\t.Response\"\x00\x12\x46\n\x11GetHistoricalData\x12\x16.HistoricalDataRequest\x1a\x17.HistoricalDataResponse\"\x00\x12/\n\nStreamData\x12\x0e.StreamRequest\x1a\r.DataResponse\"\x00\x30\x01\x12\x37\n\rSendBatchData\x12\x11.BatchDataRequest\x1a\x11.BatchAckResponse\"\x00\x12\x35\n\x0eSendDataStream\x12\x0c.DataRequest\x1a\x11.BatchAckResponse\"\x00(\x01\x12H\n\x14StreamHistoricalData\x12\x16.HistoricalDataRequest\x1a\x14.HistoricalDataChunk\"\x00\x30\x01\x12H\n\x14GetHistoricalColumns\x12\x16.HistoricalDataRequest\x1a\x16.HistoricalDataColumns\"\x00\x12.\n\tGetStatus\x12\x0e.StatusRequest\x1a\x0f.StatusResponse\"\x00\x62\x06proto3')
 
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, globals())
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'control_pb2', globals())
 if _descriptor._USE_C_DESCRIPTORS == False:
 
   DESCRIPTOR._options = None
+  _STATUSRESPONSE_METRICSENTRY._options = None
+  _STATUSRESPONSE_METRICSENTRY._serialized_options = b'8\001'
   _CONFIGRESPONSE_CONFIGSENTRY._options = None
   _CONFIGRESPONSE_CONFIGSENTRY._serialized_options = b'8\001'
   _UPDATECONFIGREQUEST_CONFIGSENTRY._options = None
@@ -27,45 +29,63 @@ if _descriptor._USE_C_DESCRIPTORS == False:
   _EMPTY._serialized_start=17
   _EMPTY._serialized_end=24
   _DATAREQUEST._serialized_start=26
-  _DATAREQUEST._serialized_end=74
-  _DATARESPONSE._serialized_start=76
-  _DATARESPONSE._serialized_end=142
-  _RESPONSE._serialized_start=144
-  _RESPONSE._serialized_end=189
-  _HISTORICALDATAREQUEST._serialized_start=191
-  _HISTORICALDATAREQUEST._serialized_end=233
-  _HISTORICALDATAITEM._serialized_start=235
-  _HISTORICALDATAITEM._serialized_end=305
-  _HISTORICALDATARESPONSE._serialized_start=307
-  _HISTORICALDATARESPONSE._serialized_end=383
-  _STATUSREQUEST._serialized_start=385
-  _STATUSREQUEST._serialized_end=420
-  _STATUSRESPONSE._serialized_start=423
-  _STATUSRESPONSE._serialized_end=599
-  _STATUSRESPONSE_STATUS._serialized_start=541
-  _STATUSRESPONSE_STATUS._serialized_end=599
-  _AUTHREQUEST._serialized_start=601
-  _AUTHREQUEST._serialized_end=650
-  _AUTHRESPONSE._serialized_start=652
-  _AUTHRESPONSE._serialized_end=714
-  _CONFIGREQUEST._serialized_start=716
-  _CONFIGREQUEST._serialized_end=751
-  _CONFIGRESPONSE._serialized_start=754
-  _CONFIGRESPONSE._serialized_end=882
-  _CONFIGRESPONSE_CONFIGSENTRY._serialized_start=836
-  _CONFIGRESPONSE_CONFIGSENTRY._serialized_end=882
-  _UPDATECONFIGREQUEST._serialized_start=884
-  _UPDATECONFIGREQUEST._serialized_end=1005
-  _UPDATECONFIGREQUEST_CONFIGSENTRY._serialized_start=836
-  _UPDATECONFIGREQUEST_CONFIGSENTRY._serialized_end=882
-  _BATCHDATAREQUEST._serialized_start=1007
-  _BATCHDATAREQUEST._serialized_end=1057
-  _BATCHDATARESPONSE._serialized_start=1059
-  _BATCHDATARESPONSE._serialized_end=1112
-  _STREAMREQUEST._serialized_start=1114
-  _STREAMREQUEST._serialized_end=1165
-  _ERRORDETAILS._serialized_start=1167
-  _ERRORDETAILS._serialized_end=1229
-  _CONTROLSERVICE._serialized_start=1232
-  _CONTROLSERVICE._serialized_end=1450
+  _DATAREQUEST._serialized_end=91
+  _DATARESPONSE._serialized_start=93
+  _DATARESPONSE._serialized_end=195
+  _RESPONSE._serialized_start=197
+  _RESPONSE._serialized_end=260
+  _HISTORICALDATAREQUEST._serialized_start=263
+  _HISTORICALDATAREQUEST._serialized_end=405
+  _HISTORICALDATAITEM._serialized_start=407
+  _HISTORICALDATAITEM._serialized_end=477
+  _HISTORICALDATARESPONSE._serialized_start=479
+  _HISTORICALDATARESPONSE._serialized_end=596
+  _HISTORICALDATACOLUMNS._serialized_start=599
+  _HISTORICALDATACOLUMNS._serialized_end=788
+  _HISTORICALDATACHUNK._serialized_start=790
+  _HISTORICALDATACHUNK._serialized_end=882
+  _STATUSREQUEST._serialized_start=884
+  _STATUSREQUEST._serialized_end=948
+  _SUBSCRIBERSTATUS._serialized_start=951
+  _SUBSCRIBERSTATUS._serialized_end=1163
+  _STATUSRESPONSE._serialized_start=1166
+  _STATUSRESPONSE._serialized_end=1477
+  _STATUSRESPONSE_METRICSENTRY._serialized_start=1371
+  _STATUSRESPONSE_METRICSENTRY._serialized_end=1417
+  _STATUSRESPONSE_STATUS._serialized_start=1419
+  _STATUSRESPONSE_STATUS._serialized_end=1477
+  _AUTHREQUEST._serialized_start=1479
+  _AUTHREQUEST._serialized_end=1528
+  _AUTHRESPONSE._serialized_start=1530
+  _AUTHRESPONSE._serialized_end=1592
+  _CONFIGREQUEST._serialized_start=1594
+  _CONFIGREQUEST._serialized_end=1629
+  _CONFIGRESPONSE._serialized_start=1632
+  _CONFIGRESPONSE._serialized_end=1760
+  _CONFIGRESPONSE_CONFIGSENTRY._serialized_start=1714
+  _CONFIGRESPONSE_CONFIGSENTRY._serialized_end=1760
+  _UPDATECONFIGREQUEST._serialized_start=1762
+  _UPDATECONFIGREQUEST._serialized_end=1883
+  _UPDATECONFIGREQUEST_CONFIGSENTRY._serialized_start=1714
+  _UPDATECONFIGREQUEST_CONFIGSENTRY._serialized_end=1760
+  _BATCHDATAREQUEST._serialized_start=1885
+  _BATCHDATAREQUEST._serialized_end=1935
+  _BATCHDATARESPONSE._serialized_start=1937
+  _BATCHDATARESPONSE._serialized_end=1990
+  _BATCHACK._serialized_start=1992
+  _BATCHACK._serialized_end=2113
+  _BATCHACKRESPONSE._serialized_start=2116
+  _BATCHACKRESPONSE._serialized_end=2256
+  _STREAMREQUEST._serialized_start=2259
+  _STREAMREQUEST._serialized_end=2387
+  _CHANNELWINDOWREQUEST._serialized_start=2389
+  _CHANNELWINDOWREQUEST._serialized_end=2444
+  _CHANNELWINDOW._serialized_start=2446
+  _CHANNELWINDOW._serialized_end=2514
+  _CHANNELWINDOWRESPONSE._serialized_start=2516
+  _CHANNELWINDOWRESPONSE._serialized_end=2589
+  _ERRORDETAILS._serialized_start=2591
+  _ERRORDETAILS._serialized_end=2653
+  _CONTROLSERVICE._serialized_start=2656
+  _CONTROLSERVICE._serialized_end=3253
 # @@protoc_insertion_point(module_scope)
@@ -0,0 +1,223 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+
+from metrics import REGISTRY, statement_name
+
+log = logging.getLogger(__name__)
+
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "db_query_seconds", "Time to execute a SQL statement, by verb and first table", ("statement",))
+DB_POOL_WAIT_SECONDS = REGISTRY.histogram(
+    "db_pool_wait_seconds", "Time to check a connection out of the pool")
+
+
+def db_settings_from_env():
+    """Connection parameters from the DB_* environment variables"""
+    return {
+        "host": os.getenv("DB_HOST", "172.90.0.40"),
+        "port": os.getenv("DB_PORT", "5432"),
+        "dbname": os.getenv("DB_NAME", "mydb"),
+        "user": os.getenv("DB_USER", "user"),
+        "password": os.getenv("DB_PASSWORD", "password")
+    }
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    """Cursor that records the duration of each execute in DB_QUERY_SECONDS"""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - start, statement_name(query))
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available before the checkout timeout"""
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of PostgreSQL connections.
+
+    Each connection is used by one thread at a time. Connections are
+    validated on checkout: closed ones are replaced, and ones idle for
+    longer than validate_after seconds are pinged with SELECT 1 first.
+    """
+
+    def __init__(self, minconn, maxconn, timeout=30.0, validate_after=30.0, **connect_kwargs):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Invalid pool size: min={minconn}, max={maxconn}")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.validate_after = validate_after
+        self.connect_kwargs = connect_kwargs
+        self._idle = deque()  # (connection, last_used) pairs, most recently used last
+        self._size = 0  # Open connections, idle or checked out
+        self._closed = False
+        self._cond = threading.Condition()
+
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    @classmethod
+    def from_env(cls, default_max=10):
+        """Build a pool from the DB_* and DB_POOL_* environment variables"""
+        settings = db_settings_from_env()
+        host, port = settings["host"], settings["port"]
+        log.info("Starting SQL connection pool to %s:%s", host, port)
+        while True:
+            try:
+                pool = cls(
+                    minconn=int(os.getenv("DB_POOL_MIN", "2")),
+                    maxconn=int(os.getenv("DB_POOL_MAX", str(default_max))),
+                    timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+                    validate_after=float(os.getenv("DB_POOL_VALIDATE_AFTER", "30")),
+                    **settings
+                )
+                log.info("Connected to PostgreSQL database at %s:%s (pool min=%d, max=%d)",
+                         host, port, pool.minconn, pool.maxconn)
+                return pool
+            except psycopg2.OperationalError as e:
+                log.error("Failed to connect to database: %s", e)
+                # Wait and try again instead of raising
+                time.sleep(5)
+
+    def _connect(self):
+        return psycopg2.connect(cursor_factory=TimedCursor, **self.connect_kwargs)
+
+    def _is_usable(self, conn, last_used):
+        """Check a connection before handing it out"""
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        if time.monotonic() - last_used < self.validate_after:
+            return True
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def getconn(self, timeout=None):
+        """Check out a validated connection, waiting up to timeout seconds for one to free up"""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout("Connection pool is closed")
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        create = False
+                        break
+                    if self._size < self.maxconn:
+                        self._size += 1
+                        create = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(f"No database connection available after {timeout}s")
+                    self._cond.wait(remaining)
+
+            # Connect and validate outside the lock so other threads are not held up
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                DB_POOL_WAIT_SECONDS.observe(time.monotonic() - start)
+                return conn
+            if self._is_usable(conn, last_used):
+                DB_POOL_WAIT_SECONDS.observe(time.monotonic() - start)
+                return conn
+            log.warning("Discarding broken database connection from pool")
+            self._discard(conn)
+
+    def putconn(self, conn, discard=False):
+        """Return a connection to the pool, closing it if it is broken or discard is set"""
+        if not discard and not conn.closed:
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+        if discard or conn.closed or self._closed:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager that checks a connection out and always returns it"""
+        conn = self.getconn(timeout)
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # The connection itself is likely broken; do not reuse it
+            broken = True
+            raise
+        finally:
+            # Also runs on GeneratorExit when a streaming RPC is cancelled mid-query
+            self.putconn(conn, discard=broken)
+            if broken:
+                # Ping the idle ones on their next checkout in case the server restarted
+                self.expire_idle()
+
+    def expire_idle(self):
+        """Force a health check on every idle connection at its next checkout"""
+        with self._cond:
+            self._idle = deque((conn, float("-inf")) for conn, _ in self._idle)
+
+    def stats(self):
+        """Current pool usage"""
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "max": self.maxconn
+            }
+
+    def closeall(self):
+        """Close idle connections and refuse new checkouts"""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._discard(conn)
@@ -0,0 +1,295 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from rollups import ROLLUPS
+
+# Reductions accepted in HistoricalDataRequest.aggregation
+AGGREGATIONS = ("minmax", "avg", "lttb")
+DEFAULT_AGGREGATION = "minmax"
+
+# Fewest points each reduction can produce: minmax returns a bucket's low and
+# high, LTTB always keeps the first and last point and one between
+MIN_POINTS = {"minmax": 2, "avg": 1, "lttb": 3}
+
+# Raw LTTB runs over the low and high of this many buckets per output point
+# instead of over every row of the range
+LTTB_OVERSAMPLE = 4
+
+# sensor_data.timestamp has no time zone; epoch values are computed as if it were UTC
+EPOCH = datetime(1970, 1, 1)
+
+RANGE_FILTER = "timestamp >= %(start)s AND timestamp <= %(end)s"
+ROLLUP_FILTER = "bucket >= %(start)s AND bucket <= %(end)s"
+
+
+def _where(time_filter, channel):
+    """Condition for a time range, restricted to one channel unless channel is empty"""
+    return f"{time_filter} AND server = %(channel)s" if channel else time_filter
+
+
+def to_epoch(timestamp):
+    return (timestamp - EPOCH).total_seconds()
+
+
+def from_epoch(seconds):
+    return EPOCH + timedelta(seconds=seconds)
+
+
+def _buckets(start, end, count):
+    """Epoch origin and width of count equal buckets covering [start, end]"""
+    origin = to_epoch(start)
+    # Widen slightly so the newest row falls into the last bucket, not one past it
+    width = max((to_epoch(end) - origin) / count, 1e-6) * (1 + 1e-9)
+    return origin, width
+
+
+# Each reduction is a query builder, returning (sql, params), and a function
+# turning the fetched rows into points. Keeping the I/O out of them lets the
+# thread and asyncio servers share the same SQL.
+
+def _minmax_query(start, end, max_points, channel):
+    """Lowest and highest value of each bucket, two points per bucket.
+
+    min/max over ARRAY[value, epoch] picks the value together with its own
+    timestamp in a single hash-aggregate pass, with no sort of the range.
+    """
+    origin, width = _buckets(start, end, max(1, max_points // 2))
+    return f"""
+        SELECT MIN(ARRAY[value::float8, extract(epoch FROM timestamp)::float8]),
+               MAX(ARRAY[value::float8, extract(epoch FROM timestamp)::float8]),
+               MIN(server)
+        FROM sensor_data
+        WHERE {_where(RANGE_FILTER, channel)}
+        GROUP BY floor((extract(epoch FROM timestamp) - %(origin)s) / %(width)s)
+    """, {"start": start, "end": end, "origin": origin, "width": width, "channel": channel}
+
+
+def _minmax_points(rows, max_points):
+    points = []
+    for low, high, server in rows:
+        points.append((int(low[0]), low[1], server))
+        if high[1] != low[1]:
+            points.append((int(high[0]), high[1], server))
+    points.sort(key=lambda point: point[1], reverse=True)
+    return [(value, from_epoch(seconds), server) for value, seconds, server in points]
+
+
+def _average_query(start, end, max_points, channel):
+    """Mean value of each bucket, placed at the middle of the bucket's rows"""
+    origin, width = _buckets(start, end, max_points)
+    return f"""
+        SELECT round(AVG(value))::int,
+               MIN(timestamp) + (MAX(timestamp) - MIN(timestamp)) / 2 AS bucket_time,
+               MIN(server)
+        FROM sensor_data
+        WHERE {_where(RANGE_FILTER, channel)}
+        GROUP BY floor((extract(epoch FROM timestamp) - %(origin)s) / %(width)s)
+        ORDER BY bucket_time DESC
+    """, {"start": start, "end": end, "origin": origin, "width": width, "channel": channel}
+
+
+def _average_points(rows, max_points):
+    return list(rows)
+
+
+def lttb(x, y, threshold):
+    """Largest-Triangle-Three-Buckets: indices of the threshold points that best keep the shape.
+
+    x must be sorted ascending. Each bucket's area computation is vectorized;
+    only the walk over buckets is a Python loop.
+    """
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        raise ValueError(f"LTTB needs a threshold of at least 3, got {threshold}")
+    every = (n - 2) / (threshold - 2)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def _lttb_query(start, end, max_points, channel):
+    """Candidate points for LTTB: the low and high of max_points * LTTB_OVERSAMPLE buckets.
+
+    The same single pass as _minmax_query, so at most 2 * LTTB_OVERSAMPLE
+    points per output point reach Python whatever the size of the range,
+    and the peaks LTTB would pick are among them.
+    """
+    origin, width = _buckets(start, end, max_points * LTTB_OVERSAMPLE)
+    return f"""
+        SELECT point[2], point[1]::int, server
+        FROM (
+            SELECT MIN(ARRAY[value::float8, extract(epoch FROM timestamp)::float8]) AS low,
+                   MAX(ARRAY[value::float8, extract(epoch FROM timestamp)::float8]) AS high,
+                   MIN(server) AS server
+            FROM sensor_data
+            WHERE {_where(RANGE_FILTER, channel)}
+            GROUP BY floor((extract(epoch FROM timestamp) - %(origin)s) / %(width)s)
+        ) AS buckets
+        CROSS JOIN LATERAL (VALUES (low), (CASE WHEN high[2] <> low[2] THEN high END)) AS points (point)
+        WHERE point IS NOT NULL
+        ORDER BY point[2]
+    """, {"start": start, "end": end, "origin": origin, "width": width, "channel": channel}
+
+
+def _lttb_points(rows, max_points):
+    if not rows:
+        return []
+    x = np.fromiter((row[0] for row in rows), dtype=np.float64, count=len(rows))
+    y = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+    selected = lttb(x, y, max_points)
+    return [(rows[i][1], from_epoch(rows[i][0]), rows[i][2]) for i in selected[::-1]]
+
+
+REDUCERS = {
+    "minmax": (_minmax_query, _minmax_points),
+    "avg": (_average_query, _average_points),
+    "lttb": (_lttb_query, _lttb_points),
+}
+
+
+# The same reductions over a rollup table. Rollup rows carry no time for
+# their min and max, so those points are placed at the start of the bucket;
+# a rollup is only used when its buckets are finer than the output ones.
+
+def _rollup_minmax_query(table, start, end, max_points, channel):
+    origin, width = _buckets(start, end, max(1, max_points // 2))
+    return f"""
+        SELECT MIN(ARRAY[min::float8, extract(epoch FROM bucket)::float8]),
+               MAX(ARRAY[max::float8, extract(epoch FROM bucket)::float8]),
+               MIN(server)
+        FROM {table}
+        WHERE {_where(ROLLUP_FILTER, channel)}
+        GROUP BY floor((extract(epoch FROM bucket) - %(origin)s) / %(width)s)
+    """, {"start": start, "end": end, "origin": origin, "width": width, "channel": channel}
+
+
+def _rollup_average_query(table, start, end, max_points, channel):
+    origin, width = _buckets(start, end, max_points)
+    return f"""
+        SELECT round(SUM(sum)::numeric / SUM(count))::int,
+               MIN(bucket) + (MAX(bucket) - MIN(bucket)) / 2 AS bucket_time,
+               MIN(server)
+        FROM {table}
+        WHERE {_where(ROLLUP_FILTER, channel)}
+        GROUP BY floor((extract(epoch FROM bucket) - %(origin)s) / %(width)s)
+        ORDER BY bucket_time DESC
+    """, {"start": start, "end": end, "origin": origin, "width": width, "channel": channel}
+
+
+def _rollup_lttb_query(table, start, end, max_points, channel):
+    # LTTB runs over the per-bucket means
+    return f"""
+        SELECT extract(epoch FROM bucket)::float8, round(SUM(sum)::numeric / SUM(count))::int, MIN(server)
+        FROM {table}
+        WHERE {_where(ROLLUP_FILTER, channel)}
+        GROUP BY bucket
+        ORDER BY bucket
+    """, {"start": start, "end": end, "channel": channel}
+
+
+ROLLUP_REDUCERS = {
+    "minmax": (_rollup_minmax_query, _minmax_points),
+    "avg": (_rollup_average_query, _average_points),
+    "lttb": (_rollup_lttb_query, _lttb_points),
+}
+
+
+def _count_query(table, start, end, max_points, channel):
+    """Rows of table in [start, end], counting no further than max_points + 1"""
+    time_filter = RANGE_FILTER if table == "sensor_data" else ROLLUP_FILTER
+    return f"""
+        SELECT COUNT(*) FROM (
+            SELECT 1 FROM {table} WHERE {_where(time_filter, channel)} LIMIT %(limit)s
+        ) AS bounded
+    """, {"start": start, "end": end, "limit": max_points + 1, "channel": channel}
+
+
+def window_query(time_range, time_filter, channel=""):
+    """Query for the (start, end) a timeRange covers; both NULL when there is no data.
+
+    For "all" the range spans the raw rows and the hourly rollups, which may
+    outlive them under retention: a rollup bucket ends one hour after it starts.
+    """
+    if time_range != "all":
+        return "SELECT LOCALTIMESTAMP - %(interval)s::interval, LOCALTIMESTAMP", {"interval": time_filter}
+    raw = "WHERE server = %(channel)s" if channel else ""
+    return f"""
+        SELECT LEAST((SELECT MIN(timestamp) FROM sensor_data {raw}),
+                     (SELECT MIN(bucket) FROM sensor_data_1h {raw})),
+               GREATEST((SELECT MAX(timestamp) FROM sensor_data {raw}),
+                        (SELECT MAX(bucket) + INTERVAL '1 hour' FROM sensor_data_1h {raw}))
+    """, {"channel": channel}
+
+
+def _plans(start, end, max_points, aggregation, channel):
+    """Candidate sources, coarsest first, as (resolution, count query, reduce query, points).
+
+    A rollup is a candidate when the range spans at least max_points of its
+    buckets, so it can still fill the point budget; raw rows come last.
+    """
+    span = to_epoch(end) - to_epoch(start)
+    for resolution, table, _, seconds in ROLLUPS:
+        if span / seconds < max_points:
+            continue
+        # Include the bucket the range starts in
+        bucket_start = from_epoch(to_epoch(start) // seconds * seconds)
+        query, points = ROLLUP_REDUCERS[aggregation]
+        yield (resolution, _count_query(table, bucket_start, end, max_points, channel),
+               query(table, bucket_start, end, max_points, channel), points)
+    query, points = REDUCERS[aggregation]
+    yield ("raw", _count_query("sensor_data", start, end, max_points, channel),
+           query(start, end, max_points, channel), points)
+
+
+def point_budget(max_points, aggregation):
+    """max_points raised to the fewest points the aggregation can reduce to"""
+    return max(max_points, MIN_POINTS[aggregation])
+
+
+def downsample(cursor, start, end, max_points, aggregation, channel=""):
+    """Rows (value, timestamp, server) in [start, end], newest first, reduced to about max_points.
+
+    channel restricts the rows to one channel; empty reduces every channel together.
+    max_points below MIN_POINTS of the aggregation is raised to it.
+
+    Reads the coarsest rollup holding more than max_points buckets in the
+    range, falling back to finer ones and then to raw rows. Returns
+    (points, resolution), or None when the range holds no more than
+    max_points raw rows, so the caller can return them unchanged.
+    """
+    max_points = point_budget(max_points, aggregation)
+    for resolution, count_query, reduce_query, points in _plans(start, end, max_points, aggregation, channel):
+        cursor.execute(*count_query)
+        if cursor.fetchone()[0] > max_points:
+            cursor.execute(*reduce_query)
+            return points(cursor.fetchall(), max_points), resolution
+    return None
+
+
+async def downsample_async(cursor, start, end, max_points, aggregation, channel=""):
+    """downsample() for an asyncio cursor; the reduction runs off the event loop"""
+    max_points = point_budget(max_points, aggregation)
+    for resolution, count_query, reduce_query, points in _plans(start, end, max_points, aggregation, channel):
+        await cursor.execute(*count_query)
+        if (await cursor.fetchone())[0] > max_points:
+            await cursor.execute(*reduce_query)
+            return await asyncio.to_thread(points, await cursor.fetchall(), max_points), resolution
+    return None
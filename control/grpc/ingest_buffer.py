@@ -0,0 +1,142 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+log = logging.getLogger(__name__)
+
+# INGEST_DURABILITY levels for SendData
+#   "sync":    insert and commit every row before acknowledging it
+#   "group":   acknowledge after the group commit that stored the row
+#   "enqueue": acknowledge once the row is in the buffer; it is lost if the
+#              process dies or the flush fails before it is committed
+DURABILITY_LEVELS = ("sync", "group", "enqueue")
+
+
+class IngestBufferFull(Exception):
+    """Raised when the buffer stays full for longer than the submit timeout"""
+
+
+class IngestBuffer:
+    """Bounded write-behind buffer drained by one flusher thread.
+
+    Rows are committed in groups of up to max_rows, or after the oldest
+    waiting row is max_delay_ms old. flush(values) inserts and commits a
+    group and returns the new ids in the same order. submit() returns a
+    Future resolving to the row id when the caller wants to wait for the
+    commit, so the same buffer serves threads and asyncio.
+    """
+
+    def __init__(self, flush, max_rows=500, max_delay_ms=10, capacity=10000):
+        if max_rows < 1 or capacity < max_rows:
+            raise ValueError(f"Invalid ingest buffer size: max_rows={max_rows}, capacity={capacity}")
+        self.flush = flush
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self.capacity = capacity
+        self._pending = []  # (value, Future or None)
+        self._first_at = 0.0  # Enqueue time of the oldest pending row
+        self._closed = False
+        self._cond = threading.Condition()
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.rows_failed = 0
+        self.last_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+        self._thread = threading.Thread(target=self._run, name="ingest-flusher", daemon=True)
+        self._thread.start()
+
+    def submit(self, value, wait_for_commit=False, timeout=30.0):
+        """Queue a value; returns a Future of its id if wait_for_commit is set, else None.
+
+        Blocks while the buffer is full, raising IngestBufferFull after timeout seconds.
+        """
+        future = Future() if wait_for_commit else None
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while len(self._pending) >= self.capacity:
+                if self._closed:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise IngestBufferFull(f"Ingest buffer full ({self.capacity} rows)")
+                self._cond.wait(remaining)
+            if self._closed:
+                raise IngestBufferFull("Ingest buffer is closed")
+            if not self._pending:
+                self._first_at = time.monotonic()
+            self._pending.append((value, future))
+            if len(self._pending) >= self.max_rows or len(self._pending) == 1:
+                self._cond.notify_all()
+        return future
+
+    def _next_group(self):
+        """Wait until a group is due and take it; None once closed and drained"""
+        with self._cond:
+            while True:
+                if self._pending:
+                    if len(self._pending) >= self.max_rows or self._closed:
+                        break
+                    remaining = self._first_at + self.max_delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                elif self._closed:
+                    return None
+                else:
+                    self._cond.wait()
+            group = self._pending[:self.max_rows]
+            del self._pending[:self.max_rows]
+            if self._pending:
+                # The rest has been waiting since before this flush
+                self._first_at = time.monotonic() - self.max_delay
+            # Wake producers blocked on a full buffer
+            self._cond.notify_all()
+            return group
+
+    def _run(self):
+        while True:
+            group = self._next_group()
+            if group is None:
+                return
+            values = [value for value, _ in group]
+            start_time = time.perf_counter()
+            try:
+                ids = self.flush(values)
+            except Exception as e:
+                log.error("Error flushing %d buffered values: %s", len(values), e)
+                with self._cond:
+                    self.rows_failed += len(values)
+                for _, future in group:
+                    if future is not None:
+                        future.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - start_time
+            with self._cond:
+                self.flushes += 1
+                self.rows_flushed += len(values)
+                self.last_flush_latency = elapsed
+                self.total_flush_latency += elapsed
+            for (_, future), record_id in zip(group, ids):
+                if future is not None:
+                    future.set_result(record_id)
+
+    def close(self, timeout=None):
+        """Stop accepting rows and wait for the flusher to commit what is queued"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "buffer_depth": len(self._pending),
+                "buffer_capacity": self.capacity,
+                "flushes": self.flushes,
+                "rows_flushed": self.rows_flushed,
+                "rows_failed": self.rows_failed,
+                "flush_rows_avg": self.rows_flushed / self.flushes if self.flushes else 0.0,
+                "flush_latency_ms_last": self.last_flush_latency * 1000,
+                "flush_latency_ms_avg": self.total_flush_latency / self.flushes * 1000 if self.flushes else 0.0
+            }
@@ -0,0 +1,197 @@
+import bisect
+import threading
+from array import array
+
+
+class LatestValuesBuffer:
+    """Fixed-depth ring of the most recent samples, kept in id order.
+
+    Values and ids live in preallocated arrays, channels in a list beside
+    them; appends overwrite the oldest slot. latest(n) is served from memory
+    whenever the ring holds at least n samples (of the channel asked for),
+    or holds every row of the table; otherwise it is a miss and the caller
+    reads the database. Ids double as the sequence numbers of incremental
+    streams, answered by since().
+    """
+
+    def __init__(self, depth):
+        if depth < 1:
+            raise ValueError(f"Invalid buffer depth: {depth}")
+        self.depth = depth
+        self._values = array("i", [0]) * depth
+        self._ids = array("q", [0]) * depth
+        self._channels = [None] * depth
+        self._head = 0  # Next slot to write
+        self._count = 0
+        self._last_id = 0
+        # True while the ring holds every row of the table (it has not wrapped yet)
+        self._complete = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, rows, complete):
+        """Replace the contents with rows of (id, value, channel), newest first.
+
+        complete tells whether rows are the whole table, in which case short
+        reads are still hits.
+        """
+        with self._lock:
+            self._head = 0
+            self._count = 0
+            self._last_id = 0
+            for record_id, value, channel in reversed(rows[:self.depth]):
+                self._append(record_id, value, channel)
+            self._complete = complete and len(rows) <= self.depth
+
+    def _append(self, record_id, value, channel):
+        self._values[self._head] = value
+        self._ids[self._head] = record_id
+        self._channels[self._head] = channel
+        self._head = (self._head + 1) % self.depth
+        if self._count < self.depth:
+            self._count += 1
+        else:
+            self._complete = False
+        self._last_id = record_id
+
+    def extend(self, rows):
+        """Add committed rows of (id, value, channel), keeping the ring in id order.
+
+        Rows normally arrive in ascending id order and are appended. With
+        concurrent writers a row can commit after one with a higher id; it is
+        inserted at its place among the ids held. Ids already held are
+        skipped, and in a full ring ids older than the oldest held are
+        dropped, being no longer among the latest values.
+        """
+        with self._lock:
+            for record_id, value, channel in rows:
+                if record_id > self._last_id or not self._count:
+                    self._append(record_id, value, channel)
+                else:
+                    self._insert(record_id, value, channel)
+
+    def _slot(self, index):
+        """Ring slot of the entry index places from the oldest"""
+        return (self._head - self._count + index) % self.depth
+
+    def _insert(self, record_id, value, channel):
+        """Put a row older than the newest held at its place in id order; call with the lock held"""
+        # First entry with an id at or above record_id
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._ids[self._slot(middle)] < record_id:
+                low = middle + 1
+            else:
+                high = middle
+        if self._ids[self._slot(low)] == record_id:
+            return
+        full = self._count == self.depth
+        if full and low == 0:
+            return
+        # Shift the newer entries one slot towards the head; in a full ring
+        # the newest moves into the slot of the oldest, which is dropped
+        for index in range(self._count - 1, low - 1, -1):
+            source, target = self._slot(index), self._slot(index + 1)
+            self._values[target] = self._values[source]
+            self._ids[target] = self._ids[source]
+            self._channels[target] = self._channels[source]
+        slot = self._slot(low)
+        self._values[slot] = value
+        self._ids[slot] = record_id
+        self._channels[slot] = channel
+        self._head = (self._head + 1) % self.depth
+        if full:
+            self._complete = False
+        else:
+            self._count += 1
+
+    def last_id(self):
+        with self._lock:
+            return self._last_id
+
+    def _newest(self, column, n):
+        """The newest n entries of column, oldest first; call with the lock held"""
+        start = self._head - n
+        if start >= 0:
+            return list(column[start:self._head])
+        return list(column[start:]) + list(column[:self._head])
+
+    def _newest_rows(self, n, channel, until=None):
+        """Up to n of the newest (id, value) rows of channel up to id until, oldest first; call with the lock held"""
+        if channel is None and until is None:
+            n = min(n, self._count)
+            return list(zip(self._newest(self._ids, n), self._newest(self._values, n)))
+        rows = []
+        slot = self._head
+        for _ in range(self._count):
+            slot = (slot - 1) % self.depth
+            if until is not None and self._ids[slot] > until:
+                continue
+            if channel is None or self._channels[slot] == channel:
+                rows.append((self._ids[slot], self._values[slot]))
+                if len(rows) == n:
+                    break
+        rows.reverse()
+        return rows
+
+    def latest_rows(self, n, channel=None, until=None):
+        """The newest n rows of (id, value), oldest first, or None if the ring cannot answer.
+
+        channel restricts the rows to one channel; None takes every channel.
+        until leaves out rows with a higher id.
+        """
+        with self._lock:
+            rows = self._newest_rows(n, channel, until)
+            if len(rows) < n and not self._complete:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return rows
+
+    def latest(self, n, channel=None):
+        """The newest n values, newest first, or None if the ring cannot answer"""
+        rows = self.latest_rows(n, channel)
+        if rows is None:
+            return None
+        return [value for _, value in reversed(rows)]
+
+    def since(self, sequence, limit, channel=None, until=None):
+        """Up to limit rows of (id, value) with an id above sequence, and at most until, oldest first.
+
+        None if rows after sequence may already have been overwritten.
+        """
+        with self._lock:
+            oldest = self._ids[self._head - self._count] if self._count else 0
+            if sequence < oldest - 1 and not self._complete:
+                self.misses += 1
+                return None
+            self.hits += 1
+            ids = self._newest(self._ids, self._count)
+            # Ids ascend through the ring, so bisect for the first newer one
+            first = bisect.bisect_right(ids, sequence)
+            stop = len(ids) if until is None else bisect.bisect_right(ids, until)
+            values = self._newest(self._values, self._count)
+            if channel is None:
+                last = max(min(first + limit, stop), first)
+                return list(zip(ids[first:last], values[first:last]))
+            channels = self._newest(self._channels, self._count)
+            rows = []
+            for i in range(first, stop):
+                if channels[i] == channel:
+                    rows.append((ids[i], values[i]))
+                    if len(rows) == limit:
+                        break
+            return rows
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "depth": self.depth,
+                "size": self._count,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
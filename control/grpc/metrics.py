@@ -0,0 +1,192 @@
+import bisect
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger(__name__)
+
+# Metrics in the Prometheus text exposition format. Recording is cheap enough
+# to leave on: observe() takes only the lock of its own series, and gauges
+# are read from the existing stats() methods when a scrape comes in.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds in seconds, from sub-millisecond cache hits to slow history reads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Statements labelled with their first table; anything else (DDL) by its verb alone
+_DML = ("select", "insert", "update", "delete", "with")
+_TABLE = re.compile(r"\b(?:from|into|update)\s+([a-z_][a-z0-9_.]*)", re.IGNORECASE)
+_EXTRACT = re.compile(r"\bextract\s*\(\s*\w+\s+from\b", re.IGNORECASE)
+_statement_names = {}
+
+
+def statement_name(query):
+    """Low-cardinality label for a SQL statement: its verb and first table, e.g. "select sensor_data" """
+    if isinstance(query, bytes):
+        # Built per call by execute_values, so not worth caching
+        return _parse_statement(query[:200].decode(errors="replace"))
+    name = _statement_names.get(query)
+    if name is None:
+        name = _parse_statement(str(query))
+        if len(_statement_names) >= 1000:
+            _statement_names.clear()
+        _statement_names[query] = name
+    return name
+
+
+def _parse_statement(text):
+    words = text.split(None, 1)
+    if not words:
+        return "empty"
+    verb = words[0].lower()
+    if verb not in _DML:
+        return verb
+    # extract(epoch FROM column) names a column, not a table
+    match = _TABLE.search(_EXTRACT.sub("extract(", text))
+    return f"{verb} {match.group(1).lower()}" if match else verb
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+class _Series:
+    __slots__ = ("counts", "sum", "lock")
+
+    def __init__(self, buckets):
+        self.counts = [0] * (len(buckets) + 1)  # Last slot counts values above every bound
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+
+class Histogram:
+    """Distribution of durations in seconds, one series per combination of label values"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        if not self.labelnames:
+            # Export zero counts before the first observation
+            self._series[()] = _Series(self.buckets)
+        self._lock = threading.Lock()  # Only taken to add a series
+
+    def observe(self, seconds, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            if len(labels) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {labels}")
+            with self._lock:
+                series = self._series.setdefault(labels, _Series(self.buckets))
+        index = bisect.bisect_left(self.buckets, seconds)
+        with series.lock:
+            series.counts[index] += 1
+            series.sum += seconds
+
+    @contextmanager
+    def time(self, *labels):
+        """Observe the duration of the with block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = list(self._series.items())
+        for labels, entry in series:
+            with entry.lock:
+                counts = list(entry.counts)
+                total = entry.sum
+            prefix = _format_labels(self.labelnames, labels)
+            separator = "," if prefix else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f'{self.name}_bucket{{{prefix}{separator}le="{bound}"}} {cumulative}'
+            cumulative += counts[-1]
+            yield f'{self.name}_bucket{{{prefix}{separator}le="+Inf"}} {cumulative}'
+            label_text = f"{{{prefix}}}" if prefix else ""
+            yield f"{self.name}_sum{label_text} {total}"
+            yield f"{self.name}_count{label_text} {cumulative}"
+
+
+class Registry:
+    """Histograms plus gauge sources, rendered together for a scrape"""
+
+    def __init__(self):
+        self._histograms = []
+        self._gauge_sources = []
+        self._lock = threading.Lock()
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        histogram = Histogram(name, documentation, labelnames, buckets)
+        with self._lock:
+            self._histograms.append(histogram)
+        return histogram
+
+    def gauges(self, source, prefix=""):
+        """Export every entry of the dict source() returns as a gauge named prefix + key"""
+        with self._lock:
+            self._gauge_sources.append((prefix, source))
+
+    def render(self):
+        with self._lock:
+            histograms = list(self._histograms)
+            gauge_sources = list(self._gauge_sources)
+        lines = []
+        for histogram in histograms:
+            lines.extend(histogram.collect())
+        for prefix, source in gauge_sources:
+            try:
+                values = source()
+            except Exception as e:
+                log.error("Error collecting %s metrics: %s", prefix or "gauge", e)
+                continue
+            for key, value in values.items():
+                name = prefix + key
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# The registry every module of this process records into
+REGISTRY = Registry()
+
+
+def serve_metrics(port, registry=REGISTRY):
+    """Serve GET /metrics on port from a daemon thread; returns the HTTP server"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # One line per scrape is noise
+
+    server = ThreadingHTTPServer(("", port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    log.info("Metrics served on port %d at /metrics", port)
+    return server
@@ -0,0 +1,316 @@
+import logging
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from rollups import create_rollup_tables, install_rollup_trigger, schedule_backfill
+
+log = logging.getLogger(__name__)
+
+# Serializes migrations when several servers start against the same database
+MIGRATION_LOCK_ID = 4242001
+
+# Partition granularities supported for sensor_data
+PARTITION_GRANULARITIES = ("day", "month")
+
+# batched: runs outside a transaction, committing as it goes; apply() has to
+#   be safe to run again after an interruption
+# offline: rewrites the whole of sensor_data under an exclusive lock; applied
+#   at startup only while the table is small, otherwise by the offline step
+Migration = namedtuple("Migration", ["version", "description", "apply", "enabled", "batched", "offline"],
+                       defaults=(False, False))
+
+
+def _always(settings):
+    return True
+
+
+def _create_sensor_data(cursor, settings):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sensor_data (
+            id SERIAL PRIMARY KEY,
+            value INTEGER NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            server VARCHAR(100) DEFAULT 'main-server'
+        )
+    """)
+
+
+def _add_timestamp_indexes(cursor, settings):
+    # B-tree for latest-N and short ranges, BRIN for scans over long ranges
+    cursor.execute("CREATE INDEX IF NOT EXISTS sensor_data_timestamp_idx ON sensor_data (timestamp)")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS sensor_data_timestamp_brin
+        ON sensor_data USING brin (timestamp) WITH (pages_per_range = 32)
+    """)
+
+
+def _add_keyset_index(cursor, settings):
+    # Serves ORDER BY timestamp DESC, id DESC pagination; covers the plain timestamp index too
+    cursor.execute("CREATE INDEX IF NOT EXISTS sensor_data_timestamp_id_idx ON sensor_data (timestamp, id)")
+    cursor.execute("DROP INDEX IF EXISTS sensor_data_timestamp_idx")
+
+
+def _add_channel_index(cursor, settings):
+    # Per-channel latest-N and ranges, and the channel list skip scan. Rows
+    # written before channels were used get the default channel so they match it
+    cursor.execute("UPDATE sensor_data SET server = 'main-server' WHERE server IS NULL")
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS sensor_data_server_timestamp_idx
+        ON sensor_data (server, timestamp, id)
+    """)
+
+
+def _fill_channels_and_index(cursor, settings):
+    """_add_channel_index for a live table: the update in id batches, the index built concurrently"""
+    cursor.execute("SELECT MIN(id), MAX(id) FROM sensor_data WHERE server IS NULL")
+    lower, upper = cursor.fetchone()
+    batch_rows = settings.get("batch_rows", 10000)
+    while lower is not None and lower <= upper:
+        cursor.execute(
+            "UPDATE sensor_data SET server = 'main-server' WHERE id >= %s AND id < %s AND server IS NULL",
+            (lower, lower + batch_rows)
+        )
+        lower += batch_rows
+    if is_partitioned(cursor):
+        # Partitioning (migration 4) already built it; partitioned tables have no CONCURRENTLY
+        _add_channel_index(cursor, settings)
+        return
+    # An interrupted concurrent build leaves an invalid index behind
+    cursor.execute("""
+        SELECT 1 FROM pg_index WHERE indexrelid = to_regclass('sensor_data_server_timestamp_idx') AND NOT indisvalid
+    """)
+    if cursor.fetchone():
+        cursor.execute("DROP INDEX CONCURRENTLY sensor_data_server_timestamp_idx")
+    cursor.execute("""
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS sensor_data_server_timestamp_idx
+        ON sensor_data (server, timestamp, id)
+    """)
+
+
+def _widen_ids(cursor, settings):
+    # SERIAL ids run out at 2^31 rows
+    cursor.execute("ALTER TABLE sensor_data ALTER COLUMN id TYPE BIGINT")
+    cursor.execute("ALTER SEQUENCE sensor_data_id_seq AS BIGINT")
+
+
+def _partitioning_enabled(settings):
+    return settings.get("partition_by") in PARTITION_GRANULARITIES
+
+
+def _partition_sensor_data(cursor, settings):
+    """Rebuild sensor_data as a range-partitioned table and copy the rows over"""
+    if is_partitioned(cursor):
+        return
+    granularity = settings["partition_by"]
+
+    cursor.execute("ALTER TABLE sensor_data RENAME TO sensor_data_unpartitioned")
+    cursor.execute("ALTER TABLE sensor_data_unpartitioned RENAME CONSTRAINT sensor_data_pkey TO sensor_data_unpartitioned_pkey")
+    cursor.execute("ALTER INDEX IF EXISTS sensor_data_timestamp_idx RENAME TO sensor_data_unpartitioned_timestamp_idx")
+    cursor.execute("ALTER INDEX IF EXISTS sensor_data_timestamp_brin RENAME TO sensor_data_unpartitioned_timestamp_brin")
+    cursor.execute("ALTER INDEX IF EXISTS sensor_data_timestamp_id_idx RENAME TO sensor_data_unpartitioned_timestamp_id_idx")
+    cursor.execute("ALTER INDEX IF EXISTS sensor_data_server_timestamp_idx RENAME TO sensor_data_unpartitioned_server_timestamp_idx")
+
+    # The partition key has to be part of the primary key
+    cursor.execute("""
+        CREATE TABLE sensor_data (
+            id BIGINT NOT NULL DEFAULT nextval('sensor_data_id_seq'),
+            value INTEGER NOT NULL,
+            timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            server VARCHAR(100) DEFAULT 'main-server',
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+    # Catches rows outside the pre-created partitions so inserts never fail
+    cursor.execute("CREATE TABLE sensor_data_default PARTITION OF sensor_data DEFAULT")
+    _add_timestamp_indexes(cursor, settings)
+    _add_keyset_index(cursor, settings)
+    _add_channel_index(cursor, settings)
+
+    cursor.execute("SELECT MIN(timestamp)::date, CURRENT_DATE FROM sensor_data_unpartitioned")
+    oldest, today = cursor.fetchone()
+    start = period_start(oldest or today, granularity)
+    end = period_start(today, granularity)
+    for _ in range(settings.get("premake", 3)):
+        end = next_period(end, granularity)
+    while start <= end:
+        _create_partition(cursor, start, granularity)
+        start = next_period(start, granularity)
+
+    cursor.execute("""
+        INSERT INTO sensor_data (id, value, timestamp, server)
+        SELECT id, value, COALESCE(timestamp, CURRENT_TIMESTAMP), server
+        FROM sensor_data_unpartitioned
+    """)
+    cursor.execute("ALTER SEQUENCE sensor_data_id_seq OWNED BY sensor_data.id")
+    cursor.execute("DROP TABLE sensor_data_unpartitioned")
+
+
+def _add_rollups(cursor, settings):
+    """Minute and hour rollup tables; the aggregator fills them from the existing rows"""
+    create_rollup_tables(cursor)
+    # The trigger's lock splits the rows exactly between it and the backfill
+    install_rollup_trigger(cursor)
+    schedule_backfill(cursor)
+
+
+def _add_rollup_deltas(cursor, settings):
+    # Rollups filled before they were merged in the background only lack the delta tables
+    create_rollup_tables(cursor)
+
+
+MIGRATIONS = [
+    Migration(1, "create sensor_data", _create_sensor_data, _always),
+    Migration(2, "timestamp B-tree and BRIN indexes", _add_timestamp_indexes, _always),
+    Migration(3, "64-bit sensor_data ids", _widen_ids, _always, offline=True),
+    Migration(4, "range-partition sensor_data by timestamp", _partition_sensor_data, _partitioning_enabled,
+              offline=True),
+    Migration(5, "(timestamp, id) keyset index", _add_keyset_index, _always),
+    Migration(6, "minute and hour rollups", _add_rollups, _always),
+    Migration(7, "(server, timestamp, id) channel index", _fill_channels_and_index, _always, batched=True),
+    Migration(8, "rollup delta table merged in the background", _add_rollup_deltas, _always),
+]
+
+
+def _lock(cursor):
+    # Polled rather than waited for: a session blocked in pg_advisory_lock
+    # holds a snapshot, which CREATE INDEX CONCURRENTLY would wait for in turn
+    while True:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        if cursor.fetchone()[0]:
+            return
+        time.sleep(1)
+
+
+def _table_rows_reach(cursor, limit):
+    # Counts at most limit rows, so a large table costs no more than a small one
+    cursor.execute("SELECT COUNT(*) FROM (SELECT 1 FROM sensor_data LIMIT %s) AS s", (limit,))
+    return cursor.fetchone()[0] >= limit
+
+
+def run_migrations(conn, settings, offline=False):
+    """Apply every enabled migration that is not yet recorded in schema_migrations.
+
+    Each migration runs in its own transaction together with its
+    schema_migrations row, except batched ones, which commit as they go and
+    are recorded once done. Disabled migrations are not recorded, so
+    enabling one later (e.g. DB_PARTITION_BY) applies it on the next start.
+
+    Offline migrations are skipped, and stay pending, when sensor_data has
+    settings["online_rows"] rows or more, unless offline is set: at that size
+    their exclusive lock would hold up the servers' inserts for the whole
+    rewrite. Returns the versions left pending.
+    """
+    partition_by = settings.get("partition_by", "")
+    if partition_by and partition_by not in PARTITION_GRANULARITIES:
+        raise ValueError(f"Invalid DB_PARTITION_BY '{partition_by}', expected one of {', '.join(PARTITION_GRANULARITIES)}"
+                         " or empty")
+    pending = []
+    conn.autocommit = True
+    cursor = conn.cursor()
+    _lock(cursor)
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("SELECT version FROM schema_migrations")
+        applied = {row[0] for row in cursor.fetchall()}
+
+        for migration in MIGRATIONS:
+            if migration.version in applied or not migration.enabled(settings):
+                continue
+            if (migration.offline and not offline
+                    and _table_rows_reach(cursor, settings.get("online_rows", 100000))):
+                log.warning("Migration %d (%s) rewrites sensor_data, which is too large to lock at startup; "
+                            "run 'python server.py migrate' to apply it", migration.version, migration.description)
+                pending.append(migration.version)
+                continue
+            log.info("Applying migration %d: %s", migration.version, migration.description)
+            conn.autocommit = migration.batched
+            try:
+                migration.apply(cursor, settings)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                    (migration.version, migration.description)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.autocommit = True
+    finally:
+        cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+        cursor.close()
+        conn.autocommit = False
+    return pending
+
+
+def is_partitioned(cursor):
+    cursor.execute("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table p
+            JOIN pg_class c ON c.oid = p.partrelid
+            WHERE c.relname = 'sensor_data' AND c.relnamespace = 'public'::regnamespace
+        )
+    """)
+    return cursor.fetchone()[0]
+
+
+def period_start(day, granularity):
+    return day.replace(day=1) if granularity == "month" else day
+
+
+def next_period(start, granularity):
+    if granularity == "month":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def partition_name(start, granularity):
+    suffix = start.strftime("%Y%m") if granularity == "month" else start.strftime("%Y%m%d")
+    return f"sensor_data_p{suffix}"
+
+
+def _create_partition(cursor, start, granularity):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {partition_name(start, granularity)}
+        PARTITION OF sensor_data FOR VALUES FROM (%s) TO (%s)
+    """, (start, next_period(start, granularity)))
+
+
+def ensure_partitions(conn, granularity, premake):
+    """Create the partitions for the current period and the next premake periods.
+
+    Returns the names of the partitions that were created. A period whose
+    rows already landed in the default partition is skipped and reported;
+    those rows have to be moved before the partition can be attached.
+    """
+    cursor = conn.cursor()
+    created = []
+    try:
+        if not is_partitioned(cursor):
+            return created
+        cursor.execute("SELECT CURRENT_DATE")
+        start = period_start(cursor.fetchone()[0], granularity)
+        conn.commit()
+        for _ in range(premake + 1):
+            name = partition_name(start, granularity)
+            cursor.execute("SELECT to_regclass(%s)", (name,))
+            if cursor.fetchone()[0] is None:
+                try:
+                    _create_partition(cursor, start, granularity)
+                    conn.commit()
+                    created.append(name)
+                except Exception as e:
+                    conn.rollback()
+                    log.error("Could not create partition %s: %s", name, e)
+            start = next_period(start, granularity)
+        conn.commit()
+    finally:
+        cursor.close()
+    return created
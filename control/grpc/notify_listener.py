@@ -0,0 +1,90 @@
+import logging
+import select
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+log = logging.getLogger(__name__)
+
+# Channel notified by the sensor_data insert trigger installed in setup_db
+NOTIFY_CHANNEL = "sensor_data"
+
+
+def install_notify_trigger(cursor):
+    """Notify NOTIFY_CHANNEL once per insert statement into sensor_data.
+
+    Notifications are sent on commit, so they also cover rows written by
+    other clients of the table.
+    """
+    cursor.execute(f"""
+        CREATE OR REPLACE FUNCTION notify_sensor_data() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('{NOTIFY_CHANNEL}', '');
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    cursor.execute("""
+        CREATE OR REPLACE TRIGGER sensor_data_notify
+        AFTER INSERT ON sensor_data
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_sensor_data()
+    """)
+
+
+class NotifyListener:
+    """Dedicated connection that LISTENs for sensor_data inserts.
+
+    on_notify() runs once per batch of received notifications. While the
+    listener is disconnected on_state(False) is called so callers can fall
+    back to polling; on_state(True) follows every successful LISTEN.
+    """
+
+    def __init__(self, connect_kwargs, on_notify, on_state, reconnect_delay=5.0):
+        self.connect_kwargs = connect_kwargs
+        self.on_notify = on_notify
+        self.on_state = on_state
+        self.reconnect_delay = reconnect_delay
+        self._thread = threading.Thread(target=self._run, name="notify-listener", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _listen(self):
+        conn = psycopg2.connect(**self.connect_kwargs)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        cursor = conn.cursor()
+        cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+        cursor.close()
+        return conn
+
+    def _run(self):
+        while True:
+            conn = None
+            try:
+                conn = self._listen()
+                log.info("Listening for notifications on '%s'", NOTIFY_CHANNEL)
+                self.on_state(True)
+                while True:
+                    # The timeout lets a dead socket surface through poll()
+                    readable, _, _ = select.select([conn], [], [], 30)
+                    conn.poll()
+                    if conn.notifies:
+                        conn.notifies.clear()
+                        self.on_notify()
+                    elif not readable:
+                        # Idle: make sure the server is still there
+                        cursor = conn.cursor()
+                        cursor.execute("SELECT 1")
+                        cursor.close()
+            except Exception as e:
+                log.error("Notification listener error: %s", e)
+            finally:
+                self.on_state(False)
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except psycopg2.Error:
+                        pass
+            time.sleep(self.reconnect_delay)
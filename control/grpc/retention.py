@@ -0,0 +1,182 @@
+import logging
+import re
+import threading
+import time
+from datetime import datetime
+
+from migrations import is_partitioned, next_period
+
+log = logging.getLogger(__name__)
+
+# Tables with a retention policy, and the column their age is measured on
+RETENTION_TABLES = {
+    "sensor_data": "timestamp",
+    "sensor_data_1m": "bucket",
+    "sensor_data_1h": "bucket",
+}
+
+UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+
+def parse_retention(text):
+    """PostgreSQL interval for a policy like "7d", "12h" or "30m"; None keeps data forever"""
+    text = (text or "").strip().lower()
+    if text in ("", "0", "forever"):
+        return None
+    match = re.fullmatch(r"(\d+)\s*([mhd])", text)
+    if not match:
+        raise ValueError(f"Invalid retention '{text}', expected e.g. 7d, 12h or 30m")
+    return f"{match.group(1)} {UNITS[match.group(2)]}"
+
+
+def _expired_partitions(cursor, cutoff):
+    """sensor_data partitions whose whole range is older than cutoff, oldest first"""
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'sensor_data'::regclass
+    """)
+    expired = []
+    for (name,) in cursor.fetchall():
+        match = re.fullmatch(r"sensor_data_p(\d{6}|\d{8})", name)
+        if not match:
+            # The default partition and foreign names are only ever trimmed row by row
+            continue
+        suffix = match.group(1)
+        granularity = "month" if len(suffix) == 6 else "day"
+        start = datetime.strptime(suffix, "%Y%m" if granularity == "month" else "%Y%m%d")
+        if next_period(start, granularity) <= cutoff:
+            expired.append((start, name))
+    return [name for _, name in sorted(expired)]
+
+
+class RetentionEngine:
+    """Background thread that removes data older than each table's policy.
+
+    Fully expired sensor_data partitions are dropped whole; everything else
+    is deleted in batches of batch_size rows, one short transaction each, so
+    inserts never wait behind a long delete. connection() must return a
+    context manager yielding a psycopg2 connection.
+    """
+
+    def __init__(self, connection, policies, interval=3600, batch_size=10000, lock_timeout_ms=2000):
+        # table -> PostgreSQL interval; tables kept forever are left out
+        self.policies = {table: keep for table, keep in policies.items() if keep}
+        self.connection = connection
+        self.interval = interval
+        self.batch_size = batch_size
+        self.lock_timeout_ms = lock_timeout_ms
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.rows_reclaimed = 0
+        self.partitions_dropped = 0
+        self.last_run_seconds = 0.0
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+
+    def start(self):
+        if self.policies:
+            log.info("Retention: %s", ", ".join(f"{table} {keep}" for table, keep in self.policies.items()))
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                log.error("Error applying retention: %s", e)
+            time.sleep(self.interval)
+
+    def run_once(self):
+        """Apply every policy once; returns {table: rows reclaimed}.
+
+        Rows of dropped partitions are counted from the planner's estimate,
+        so the sensor_data figure is approximate when partitions were dropped.
+        """
+        start_time = time.perf_counter()
+        reclaimed = {}
+        dropped = []
+        dropped_rows = 0
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                for table, keep in self.policies.items():
+                    cursor.execute("SELECT LOCALTIMESTAMP - %s::interval", (keep,))
+                    cutoff = cursor.fetchone()[0]
+                    conn.commit()
+                    rows = 0
+                    if table == "sensor_data" and is_partitioned(cursor):
+                        for name in _expired_partitions(cursor, cutoff):
+                            partition_rows = self._drop_partition(conn, cursor, name)
+                            if partition_rows is not None:
+                                rows += partition_rows
+                                dropped_rows += partition_rows
+                                dropped.append(name)
+                        conn.commit()
+                    rows += self._delete_batches(conn, cursor, table, cutoff)
+                    reclaimed[table] = rows
+            finally:
+                cursor.close()
+
+        elapsed = time.perf_counter() - start_time
+        with self._lock:
+            self.runs += 1
+            self.rows_reclaimed += sum(reclaimed.values())
+            self.partitions_dropped += len(dropped)
+            self.last_run_seconds = elapsed
+        summary = ", ".join(f"{table} {rows} rows" for table, rows in reclaimed.items())
+        if dropped:
+            summary += f" (dropped {', '.join(dropped)}, about {dropped_rows} rows)"
+        log.info("Retention reclaimed %s in %.2fs", summary, elapsed)
+        return reclaimed
+
+    def _drop_partition(self, conn, cursor, name):
+        """Drop one expired partition; returns its estimated row count, or None if it was skipped"""
+        try:
+            # Counting a month of rows only to report them would read the whole
+            # partition; use the statistics instead (-1 if never analyzed)
+            cursor.execute("""
+                SELECT COALESCE(NULLIF(c.reltuples, -1)::bigint, s.n_live_tup, 0)
+                FROM pg_class c
+                LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+                WHERE c.oid = %s::regclass
+            """, (name,))
+            rows = cursor.fetchone()[0]
+            # Dropping needs a brief exclusive lock on sensor_data; give up
+            # instead of queueing inserts behind a long-running query
+            cursor.execute(f"SET LOCAL lock_timeout = '{int(self.lock_timeout_ms)}ms'")
+            cursor.execute(f"DROP TABLE {name}")
+            conn.commit()
+            return rows
+        except Exception as e:
+            conn.rollback()
+            log.warning("Could not drop partition %s, retrying next run: %s", name, e)
+            return None
+
+    def _delete_batches(self, conn, cursor, table, cutoff):
+        """Delete rows older than cutoff, batch_size rows per transaction"""
+        column = RETENTION_TABLES[table]
+        key = "id, timestamp" if table == "sensor_data" else "bucket, server"
+        deleted = 0
+        while True:
+            cursor.execute(f"""
+                DELETE FROM {table} WHERE ({key}) IN (
+                    SELECT {key} FROM {table}
+                    WHERE {column} < %s
+                    ORDER BY {column}
+                    LIMIT %s
+                )
+            """, (cutoff, self.batch_size))
+            batch = cursor.rowcount
+            conn.commit()
+            deleted += batch
+            if batch < self.batch_size:
+                return deleted
+
+    def stats(self):
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "rows_reclaimed": self.rows_reclaimed,
+                "partitions_dropped": self.partitions_dropped,
+                "last_run_seconds": self.last_run_seconds
+            }
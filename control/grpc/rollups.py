@@ -0,0 +1,261 @@
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Pre-aggregated copies of sensor_data at coarser resolutions.
+# (resolution, table, date_trunc unit, bucket width in seconds), coarsest first
+ROLLUPS = (
+    ("1h", "sensor_data_1h", "hour", 3600),
+    ("1m", "sensor_data_1m", "minute", 60),
+)
+
+# Partial minute aggregates written by the insert trigger, waiting for the
+# aggregator to merge them into the rollups
+DELTA_TABLE = "sensor_data_rollup_delta"
+
+# Rows that were in sensor_data before the trigger existed, still to be added
+BACKFILL_TABLE = "sensor_data_rollup_backfill"
+
+# Aggregate columns shared by the rollups and the delta table
+COLUMNS = "count, min, max, sum, last, last_timestamp, last_id"
+
+
+def _delta_insert(source, condition="TRUE"):
+    """Append the minute aggregates of the raw rows of source to the delta table.
+
+    A plain insert: unlike an upsert into the rollups it takes no lock that
+    another insert could wait on.
+    """
+    return f"""
+        INSERT INTO {DELTA_TABLE} (bucket, server, {COLUMNS})
+        SELECT date_trunc('minute', timestamp), COALESCE(server, 'main-server'),
+               COUNT(*), MIN(value), MAX(value), SUM(value),
+               (array_agg(value ORDER BY timestamp DESC, id DESC))[1],
+               MAX(timestamp),
+               (array_agg(id ORDER BY timestamp DESC, id DESC))[1]
+        FROM {source}
+        WHERE timestamp IS NOT NULL AND {condition}
+        GROUP BY 1, 2
+    """
+
+
+def _merge(table, unit, source):
+    """Merge delta-shaped rows of source into a rollup table, one row per (bucket, server).
+
+    Buckets are written in key order so concurrent merges touching the
+    same buckets cannot deadlock.
+    """
+    newer = "(EXCLUDED.last_timestamp, EXCLUDED.last_id) > (r.last_timestamp, r.last_id)"
+    return f"""
+        INSERT INTO {table} AS r (bucket, server, {COLUMNS})
+        SELECT date_trunc('{unit}', bucket), server,
+               SUM(count), MIN(min), MAX(max), SUM(sum),
+               (array_agg(last ORDER BY last_timestamp DESC, last_id DESC))[1],
+               MAX(last_timestamp),
+               (array_agg(last_id ORDER BY last_timestamp DESC, last_id DESC))[1]
+        FROM {source}
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+        ON CONFLICT (bucket, server) DO UPDATE SET
+            count = r.count + EXCLUDED.count,
+            min = LEAST(r.min, EXCLUDED.min),
+            max = GREATEST(r.max, EXCLUDED.max),
+            sum = r.sum + EXCLUDED.sum,
+            last = CASE WHEN {newer} THEN EXCLUDED.last ELSE r.last END,
+            last_timestamp = CASE WHEN {newer} THEN EXCLUDED.last_timestamp ELSE r.last_timestamp END,
+            last_id = CASE WHEN {newer} THEN EXCLUDED.last_id ELSE r.last_id END
+        RETURNING 1
+    """
+
+
+# Moves up to %(limit)s delta rows into every rollup in one statement, so
+# they are counted exactly once. SKIP LOCKED lets several servers merge
+# side by side; the result is the number of delta rows merged
+MERGE_DELTAS = f"""
+    WITH delta AS (
+        DELETE FROM {DELTA_TABLE}
+        WHERE id IN (SELECT id FROM {DELTA_TABLE} ORDER BY id LIMIT %(limit)s FOR UPDATE SKIP LOCKED)
+        RETURNING bucket, server, {COLUMNS}
+    ), {", ".join(f"merge_{resolution} AS ({_merge(table, unit, 'delta')})" for resolution, table, unit, _ in reversed(ROLLUPS))}
+    SELECT COUNT(*) FROM delta
+"""
+
+
+def create_rollup_tables(cursor):
+    for _, table, _, _ in ROLLUPS:
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                bucket TIMESTAMP NOT NULL,
+                server VARCHAR(100) NOT NULL,
+                count BIGINT NOT NULL,
+                min INTEGER NOT NULL,
+                max INTEGER NOT NULL,
+                sum BIGINT NOT NULL,
+                last INTEGER NOT NULL,
+                last_timestamp TIMESTAMP NOT NULL,
+                last_id BIGINT NOT NULL,
+                PRIMARY KEY (bucket, server)
+            )
+        """)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {DELTA_TABLE} (
+            id BIGSERIAL PRIMARY KEY,
+            bucket TIMESTAMP NOT NULL,
+            server VARCHAR(100) NOT NULL,
+            count BIGINT NOT NULL,
+            min INTEGER NOT NULL,
+            max INTEGER NOT NULL,
+            sum BIGINT NOT NULL,
+            last INTEGER NOT NULL,
+            last_timestamp TIMESTAMP NOT NULL,
+            last_id BIGINT NOT NULL
+        )
+    """)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {BACKFILL_TABLE} (
+            done_id BIGINT NOT NULL,
+            until_id BIGINT NOT NULL
+        )
+    """)
+
+
+def install_rollup_trigger(cursor):
+    """Record the minute aggregates of every insert statement in the delta table.
+
+    Runs on each start, as rebuilding sensor_data (partitioning) drops its triggers.
+    """
+    cursor.execute(f"""
+        CREATE OR REPLACE FUNCTION sensor_data_rollup() RETURNS trigger AS $$
+        BEGIN
+            {_delta_insert("new_rows")};
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    cursor.execute("""
+        CREATE OR REPLACE TRIGGER sensor_data_rollup
+        AFTER INSERT ON sensor_data
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION sensor_data_rollup()
+    """)
+
+
+def schedule_backfill(cursor):
+    """Have the aggregator add the rows already in sensor_data to the rollups.
+
+    Call in the transaction that installed the trigger: creating it waited
+    for every insert in progress and holds off new ones until commit, so the
+    rows visible now are exactly those the trigger will never see.
+    """
+    cursor.execute("SELECT MAX(id) FROM sensor_data")
+    until_id = cursor.fetchone()[0]
+    if until_id is not None:
+        cursor.execute(f"INSERT INTO {BACKFILL_TABLE} (done_id, until_id) VALUES (0, %s)", (until_id,))
+
+
+class RollupAggregator:
+    """Background thread that merges the delta table into the rollups.
+
+    The insert trigger only appends partial aggregates to DELTA_TABLE, so
+    concurrent inserts into the same channel never wait for each other on a
+    rollup row. Every interval_ms the deltas are merged batch_size at a time,
+    one short transaction each, and rows older than the trigger are
+    backfilled through the same path. Rollups therefore trail the raw rows
+    by up to about one interval. connection() must return a context manager
+    yielding a psycopg2 connection.
+    """
+
+    def __init__(self, connection, interval_ms=1000, batch_size=10000):
+        self.connection = connection
+        self.interval = interval_ms / 1000
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.deltas_merged = 0
+        self.rows_backfilled = 0
+        self.last_run_seconds = 0.0
+        self._thread = threading.Thread(target=self._run, name="rollup-aggregator", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                log.error("Error merging rollups: %s", e)
+            time.sleep(self.interval)
+
+    def run_once(self):
+        """Merge every pending delta, backfilling as it goes; returns the number of delta rows merged"""
+        start_time = time.perf_counter()
+        merged = 0
+        backfilled = 0
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                while True:
+                    rows = self._backfill_batch(conn, cursor)
+                    backfilled += rows or 0
+                    while True:
+                        cursor.execute(MERGE_DELTAS, {"limit": self.batch_size})
+                        batch = cursor.fetchone()[0]
+                        conn.commit()
+                        merged += batch
+                        if batch < self.batch_size:
+                            break
+                    if rows is None:
+                        break
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+        with self._lock:
+            self.runs += 1
+            self.deltas_merged += merged
+            self.rows_backfilled += backfilled
+            self.last_run_seconds = time.perf_counter() - start_time
+        return merged
+
+    def _backfill_batch(self, conn, cursor):
+        """Turn the next batch_size ids of pre-trigger rows into deltas.
+
+        Returns the number of rows read, or None when there is nothing left
+        to backfill (or another server is doing it).
+        """
+        cursor.execute(f"SELECT done_id, until_id FROM {BACKFILL_TABLE} FOR UPDATE SKIP LOCKED")
+        progress = cursor.fetchone()
+        if progress is None:
+            conn.commit()
+            return None
+        done_id, until_id = progress
+        upper = min(done_id + self.batch_size, until_id)
+        cursor.execute(f"""
+            WITH inserted AS (
+                {_delta_insert("sensor_data", "id > %(done)s AND id <= %(upper)s")}
+                RETURNING count
+            )
+            SELECT COALESCE(SUM(count), 0)::bigint FROM inserted
+        """, {"done": done_id, "upper": upper})
+        rows = cursor.fetchone()[0]
+        if upper >= until_id:
+            cursor.execute(f"DELETE FROM {BACKFILL_TABLE}")
+            log.info("Rollup backfill complete up to id %d", until_id)
+        else:
+            cursor.execute(f"UPDATE {BACKFILL_TABLE} SET done_id = %s", (upper,))
+        conn.commit()
+        return rows
+
+    def stats(self):
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "deltas_merged": self.deltas_merged,
+                "rows_backfilled": self.rows_backfilled,
+                "last_run_seconds": self.last_run_seconds
+            }
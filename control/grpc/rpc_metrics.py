@@ -0,0 +1,139 @@
+import asyncio
+import time
+
+import grpc
+
+from metrics import REGISTRY
+
+# Unary RPCs are timed to their response; streaming ones for the life of the stream
+RPC_SECONDS = REGISTRY.histogram(
+    "grpc_server_handling_seconds", "Time from RPC start to completion, by method and status code",
+    ("method", "code"))
+
+
+def _code(context, failed):
+    """Status code name an RPC finished with"""
+    code = context.code()
+    if code is None:
+        return "UNKNOWN" if failed else "OK"
+    # Set through context.set_code or context.abort
+    return code.name if isinstance(code, grpc.StatusCode) else str(code)
+
+
+def _method_name(handler_call_details):
+    return handler_call_details.method.rsplit("/", 1)[-1]
+
+
+def _rebuild(handler, unary_unary=None, unary_stream=None, stream_unary=None, stream_stream=None):
+    """Copy of handler with its behavior replaced by the one given"""
+    if unary_unary:
+        factory, behavior = grpc.unary_unary_rpc_method_handler, unary_unary
+    elif unary_stream:
+        factory, behavior = grpc.unary_stream_rpc_method_handler, unary_stream
+    elif stream_unary:
+        factory, behavior = grpc.stream_unary_rpc_method_handler, stream_unary
+    else:
+        factory, behavior = grpc.stream_stream_rpc_method_handler, stream_stream
+    return factory(behavior, request_deserializer=handler.request_deserializer,
+                   response_serializer=handler.response_serializer)
+
+
+class MetricsInterceptor(grpc.ServerInterceptor):
+    """Records every RPC of the thread-mode server in RPC_SECONDS"""
+
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        if handler is None:
+            return None
+        method = _method_name(handler_call_details)
+
+        def timed_unary(behavior):
+            def wrapper(request, context):
+                start = time.perf_counter()
+                failed = False
+                try:
+                    return behavior(request, context)
+                except Exception:
+                    failed = True
+                    raise
+                finally:
+                    RPC_SECONDS.observe(time.perf_counter() - start, method, _code(context, failed))
+            return wrapper
+
+        def timed_stream(behavior):
+            def wrapper(request, context):
+                start = time.perf_counter()
+                code = None
+                try:
+                    yield from behavior(request, context)
+                except GeneratorExit:
+                    code = "CANCELLED"  # Closed by a client disconnect
+                    raise
+                except Exception:
+                    code = _code(context, True)
+                    raise
+                finally:
+                    if code is None:
+                        # A stream that stopped because the client went away
+                        code = _code(context, False) if context.is_active() else "CANCELLED"
+                    RPC_SECONDS.observe(time.perf_counter() - start, method, code)
+            return wrapper
+
+        if handler.unary_unary:
+            return _rebuild(handler, unary_unary=timed_unary(handler.unary_unary))
+        if handler.unary_stream:
+            return _rebuild(handler, unary_stream=timed_stream(handler.unary_stream))
+        if handler.stream_unary:
+            return _rebuild(handler, stream_unary=timed_unary(handler.stream_unary))
+        return _rebuild(handler, stream_stream=timed_stream(handler.stream_stream))
+
+
+class AsyncMetricsInterceptor(grpc.aio.ServerInterceptor):
+    """Records every RPC of the asyncio server in RPC_SECONDS"""
+
+    async def intercept_service(self, continuation, handler_call_details):
+        handler = await continuation(handler_call_details)
+        if handler is None:
+            return None
+        method = _method_name(handler_call_details)
+
+        def timed_unary(behavior):
+            async def wrapper(request, context):
+                start = time.perf_counter()
+                code = None
+                try:
+                    return await behavior(request, context)
+                except asyncio.CancelledError:
+                    code = "CANCELLED"
+                    raise
+                except Exception:
+                    code = _code(context, True)
+                    raise
+                finally:
+                    RPC_SECONDS.observe(time.perf_counter() - start, method, code or _code(context, False))
+            return wrapper
+
+        def timed_stream(behavior):
+            async def wrapper(request, context):
+                start = time.perf_counter()
+                code = None
+                try:
+                    async for response in behavior(request, context):
+                        yield response
+                except (asyncio.CancelledError, GeneratorExit):
+                    code = "CANCELLED"
+                    raise
+                except Exception:
+                    code = _code(context, True)
+                    raise
+                finally:
+                    RPC_SECONDS.observe(time.perf_counter() - start, method, code or _code(context, False))
+            return wrapper
+
+        if handler.unary_unary:
+            return _rebuild(handler, unary_unary=timed_unary(handler.unary_unary))
+        if handler.unary_stream:
+            return _rebuild(handler, unary_stream=timed_stream(handler.unary_stream))
+        if handler.stream_unary:
+            return _rebuild(handler, stream_unary=timed_unary(handler.stream_unary))
+        return _rebuild(handler, stream_stream=timed_stream(handler.stream_stream))
@@ -1,240 +1,454 @@
 import grpc
+import logging
 import random
 import psycopg2
+from psycopg2.extras import execute_values
 from concurrent import futures
 import time
 import threading
+import queue
 import os
-from datetime import datetime
+import signal
+import sys
+import uuid
 import control_pb2
 import control_pb2_grpc
+from db_pool import ConnectionPool
+from stream_fanout import (
+    StreamFanout, MAX_INCREMENT, OVERFLOW_POLICIES, increment_response, window_size, subscriber_status
+)
+from notify_listener import NotifyListener
+from columnar import columns_query, decode_columns, encode_columns, rows_to_columns
+from channels import (
+    DEFAULT_CHANNEL, DEFAULT_CHANNEL_WINDOW, MAX_CHANNEL_WINDOW, CHANNEL_NAMES, LATEST_BY_CHANNEL,
+    rows_query, channel_windows
+)
+from migrations import ensure_partitions
+from downsampling import downsample, window_query, AGGREGATIONS, DEFAULT_AGGREGATION
+from latest_buffer import LatestValuesBuffer
+from watermark import CommitWatermark, ROWS_WITH_SNAPSHOT, split_snapshot_rows
+from ingest_buffer import IngestBuffer
+from metrics import REGISTRY, serve_metrics
+from rpc_metrics import MetricsInterceptor
+from server_common import (
+    GRPC_MAX_WORKERS, GRPC_MAX_STREAMS, GRPC_SERVER_MODE, METRICS_PORT, STREAM_MODE, STREAM_QUEUE_SIZE,
+    DB_PARTITION_BY, DB_PARTITION_PREMAKE, DB_MAINTENANCE_INTERVAL, HISTORY_CHUNK_SIZE, HISTORY_MAX_CHUNK_SIZE, HISTORY_MAX_STREAMS,
+    LATEST_BUFFER_DEPTH, LATEST_BUFFER_SYNC_MS, WATERMARK_TIMEOUT, INGEST_FLUSH_ROWS, INGEST_FLUSH_INTERVAL_MS, INGEST_BUFFER_CAPACITY,
+    ingest_durability, stream_overflow, migrate, prepare_database, server_options, retention_engine, rollup_aggregator,
+    parse_values, parse_time_range, encode_resume_token, decode_resume_token
+)
+import logs
+
+# Named explicitly: run as a script this module is __main__
+log = logging.getLogger("server")
+
 
 class ControlServiceServicer(control_pb2_grpc.ControlServiceServicer):
     def __init__(self):
         super().__init__()
-        print("Initializing ControlServiceServicer")
-        self.db_connection = None
-        # Store the active clients that need periodic updates
-        self.streaming_clients = {}
-        self.client_lock = threading.Lock()
-        # Connect to the database
-        self.connect_to_db()
+        log.info("Initializing ControlServiceServicer")
+        self.started_at = time.time()
+        # Every StreamData subscriber is served by one shared scheduler thread
+        self.stream_fanout = StreamFanout(
+            self.latest_values,
+            self.rows_since,
+            min_push_interval_ms=int(os.getenv("STREAM_PUSH_MIN_INTERVAL_MS", "20")),
+            max_queued=STREAM_QUEUE_SIZE,
+            overflow=stream_overflow()
+        )
+        self.active_streams = 0
+        self.active_history_streams = 0
+        self.stream_slots_lock = threading.Lock()
+        # Rows per multi-row insert for SendDataStream
+        self.ingest_batch_size = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+        # Latest-N reads come from memory; the database is only read for history
+        self.latest_buffer = LatestValuesBuffer(LATEST_BUFFER_DEPTH)
+        # Incremental streams stop here: every row up to it is in the buffer or the table
+        self.watermark = CommitWatermark(WATERMARK_TIMEOUT)
+        # Rate limit of poll_latest_buffer()
+        self.sync_lock = threading.Lock()
+        self.next_sync = 0.0
+        # Write-behind SendData: a flusher thread group-commits buffered rows
+        self.durability = ingest_durability()
+        self.ingest_buffer = None
+        if self.durability != "sync":
+            self.ingest_buffer = IngestBuffer(
+                lambda rows: self.insert_batch(rows)[0],
+                max_rows=INGEST_FLUSH_ROWS,
+                max_delay_ms=INGEST_FLUSH_INTERVAL_MS,
+                capacity=INGEST_BUFFER_CAPACITY
+            )
+            log.info("SendData uses write-behind with durability '%s'", self.durability)
+        # Set while the notify listener is connected: it then reports rows
+        # written by other clients, otherwise reads check for them first
+        self.notify_connected = False
+        # Pool of database connections shared by the RPC worker threads
+        self.db_pool = ConnectionPool.from_env(default_max=GRPC_MAX_WORKERS)
         self.setup_db()
-        # Start the periodic refresh thread
-        #self.start_periodic_refresh()
-    
-    def connect_to_db(self):
-        """Connect to PostgreSQL database"""
-        print("Starting SQL server connection")
-        try:
-            # Get database connection parameters from environment variables with fallbacks
-            host = os.getenv("DB_HOST", "172.90.0.40")
-            port = os.getenv("DB_PORT", "5432")
-            database = os.getenv("DB_NAME", "mydb")
-            user = os.getenv("DB_USER", "user")
-            password = os.getenv("DB_PASSWORD", "password")
-            
-            self.db_connection = psycopg2.connect(
-                host=host,
-                port=port,
-                database=database,
-                user=user,
-                password=password
+        self.load_latest_buffer()
+        if DB_PARTITION_BY:
+            threading.Thread(target=self.maintain_partitions, name="partition-maintenance", daemon=True).start()
+        # Drops or trims data past its RETENTION_* age
+        self.retention = retention_engine(self.db_pool.connection)
+        self.retention.start()
+        # Merges the partial aggregates left by inserts into the rollups
+        self.rollups = rollup_aggregator(self.db_pool.connection)
+        self.rollups.start()
+        # Wake the stream fan-out as soon as new rows are committed
+        if STREAM_MODE == "notify":
+            self.notify_listener = NotifyListener(
+                self.db_pool.connect_kwargs,
+                on_notify=self.on_rows_inserted,
+                on_state=self.on_notify_state
             )
-            print(f"Connected to PostgreSQL database at {host}:{port}")
-        except Exception as e:
-            print(f"Failed to connect to database: {e}")
-            # Wait and try again instead of raising
-            time.sleep(5)
-            self.connect_to_db()
+            self.notify_listener.start()
+        else:
+            log.info("Stream updates use polling (STREAM_MODE=poll)")
+        # The GetStatus counters double as gauges on the metrics endpoint
+        REGISTRY.gauges(self.status_metrics)
     
     def setup_db(self):
-        """Create necessary tables if they don't exist"""
+        """Bring the schema up to date and install the insert notification trigger"""
         try:
-            cursor = self.db_connection.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS sensor_data (
-                    id SERIAL PRIMARY KEY,
-                    value INTEGER NOT NULL,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    server VARCHAR(100) DEFAULT 'main-server'
-                )
-            """)
-            self.db_connection.commit()
+            with self.db_pool.connection() as conn:
+                prepare_database(conn)
+            log.info("Database setup complete")
+        except psycopg2.OperationalError as e:
+            log.error("Failed to setup database: %s", e)
+            # The broken connection was dropped from the pool, retry with a fresh one
+            log.info("Attempting to reconnect to database...")
+            time.sleep(5)
+            self.setup_db()
+
+    def load_latest_buffer(self):
+        """Fill the latest-values buffer with the newest rows of sensor_data"""
+        depth = self.latest_buffer.depth
+        with self.db_pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(ROWS_WITH_SNAPSHOT, (0, depth))
+            xmin, xmax, rows = split_snapshot_rows(cursor.fetchall())
             cursor.close()
-            print("Database setup complete")
-        except Exception as e:
-            print(f"Failed to setup database: {e}")
-            # If database connection is lost, reconnect
-            if "connection" in str(e).lower():
-                print("Attempting to reconnect to database...")
-                self.connect_to_db()
-                self.setup_db()
-            else:
-                raise
-    
-    def check_db_connection(self):
-        """Check if the database connection is alive and reconnect if needed"""
+        # Fewer rows than the depth means the buffer holds the whole table
+        rows.reverse()
+        self.latest_buffer.load(rows, complete=len(rows) < depth)
+        self.watermark.observe(xmin, xmax, rows[0][0] if rows else None)
+        log.info("Loaded %d values into the latest-values buffer (depth %d)", len(rows), depth)
+
+    def sync_latest_buffer(self):
+        """Add rows committed by other writers since the commit watermark, then move the watermark.
+
+        Reading from the watermark rather than the newest buffered id also
+        picks up rows that committed behind newer ones; extend() skips the
+        rows already held.
+        """
+        with self.db_pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(ROWS_WITH_SNAPSHOT, (self.watermark.value, self.latest_buffer.depth))
+            xmin, xmax, rows = split_snapshot_rows(cursor.fetchall())
+            cursor.close()
+        self.latest_buffer.extend(rows)
+        self.watermark.observe(xmin, xmax, rows[-1][0] if rows else None)
+
+    def poll_latest_buffer(self):
+        """sync_latest_buffer() at most once per LATEST_BUFFER_SYNC_MS.
+
+        Callers that find a sync due but already running read the buffer as it is.
+        """
+        if time.monotonic() < self.next_sync or not self.sync_lock.acquire(blocking=False):
+            return
         try:
-            # Simple query to check connection
-            cursor = self.db_connection.cursor()
-            cursor.execute("SELECT 1")
+            if time.monotonic() >= self.next_sync:
+                self.next_sync = time.monotonic() + LATEST_BUFFER_SYNC_MS / 1000
+                self.sync_latest_buffer()
+        finally:
+            self.sync_lock.release()
+
+    def on_rows_inserted(self):
+        """Notification from the insert trigger: catch up the buffer, then push to streams"""
+        try:
+            self.sync_latest_buffer()
+        except Exception as e:
+            log.error("Error syncing latest-values buffer: %s", e)
+        self.stream_fanout.wake()
+
+    def on_notify_state(self, connected):
+        self.notify_connected = connected
+        if connected:
+            # Rows may have been written while the listener was down
+            self.on_rows_inserted()
+        self.stream_fanout.set_push_mode(connected)
+
+    def latest_values(self, limit, channel=""):
+        """Newest values of a channel (every channel if empty), newest first, from the buffer when it can answer"""
+        if not self.notify_connected:
+            # Nothing reports other writers' rows, so look for them first
+            self.poll_latest_buffer()
+        values = self.latest_buffer.latest(limit, channel or None)
+        if values is None:
+            values = self.query_latest_values(limit, channel)
+        return values
+
+    def newest_sequence(self):
+        """Sequence (id) of the newest stored sample, 0 for an empty table"""
+        if not self.notify_connected:
+            self.poll_latest_buffer()
+        return self.latest_buffer.last_id()
+
+    def rows_since(self, sequence, limit, channel=""):
+        """Up to limit rows of (id, value) stored after sequence, oldest first.
+
+        Stops at the commit watermark, so no stream moves past a row that may still commit.
+        """
+        if not self.notify_connected or self.watermark.pending:
+            # Also moves the watermark on when no new insert will notify
+            self.poll_latest_buffer()
+        until = self.watermark.value
+        rows = self.latest_buffer.since(sequence, limit, channel or None, until)
+        if rows is None:
+            rows = self.query_rows(sequence, limit, channel, until)
+        return rows
+
+    def query_rows(self, sequence, limit, channel="", until=None):
+        """Rows of (id, value) after sequence, oldest first, or the newest limit rows for None"""
+        query, params = rows_query(sequence, limit, channel, until)
+        with self.db_pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
             cursor.close()
-            return True
-        except Exception:
-            # Connection lost, try to reconnect
+        if sequence is None:
+            rows.reverse()
+        return rows
+
+    def catch_up(self, resume_from, window, channel=""):
+        """Incremental updates an incremental stream starts with, oldest first.
+
+        With resume_from every row stored after it, MAX_INCREMENT rows per
+        update; otherwise the latest window up to the commit watermark.
+        """
+        if resume_from <= 0:
+            until = self.watermark.value
+            rows = self.latest_buffer.latest_rows(window, channel or None, until)
+            if rows is None:
+                rows = self.query_rows(None, window, channel, until)
+            if rows:
+                yield increment_response(rows, channel=channel)
+            return
+        sequence = resume_from
+        while True:
+            rows = self.rows_since(sequence, MAX_INCREMENT, channel)
+            if rows:
+                yield increment_response(rows, channel=channel)
+                sequence = rows[-1][0]
+            if len(rows) < MAX_INCREMENT:
+                return
+
+    def maintain_partitions(self):
+        """Keep DB_PARTITION_PREMAKE future partitions of sensor_data in place"""
+        while True:
             try:
-                self.db_connection.close()
-            except:
-                pass
-            self.connect_to_db()
-            return self.db_connection is not None
+                with self.db_pool.connection() as conn:
+                    created = ensure_partitions(conn, DB_PARTITION_BY, DB_PARTITION_PREMAKE)
+                if created:
+                    log.info("Created partitions: %s", ", ".join(created))
+            except Exception as e:
+                log.error("Error maintaining partitions: %s", e)
+            time.sleep(DB_MAINTENANCE_INTERVAL)
     
     def GetData(self, request, context):
         """Retrieve data from PostgreSQL database"""
-        print(f"server.py: GetData request received: {request}")
-        
-        # Register client for periodic updates if interval > 0
-        client_id = context.peer()
-        if hasattr(request, 'interval') and request.interval > 0:
-            with self.client_lock:
-                self.streaming_clients[client_id] = {
-                    'interval': request.interval,
-                    'last_update': time.time(),
-                    'context': context
-                }
-                print(f"Registered client {client_id} for updates every {request.interval}ms")
+        log.debug("GetData request received: %s", request)
         
         try:
-            # Ensure database connection is active
-            if not self.check_db_connection():
-                return control_pb2.DataResponse(
-                    estado="ERROR",
-                    valores=[0, 0, 0, 0, 0]
-                )
-            
-            cursor = self.db_connection.cursor()
-            
             # Get the number of entries based on interval if specified
             limit = 50  # Default
             if hasattr(request, 'interval') and request.interval > 0:
                 # Adjust number of records based on interval
                 #limit = max(5, min(20, int(30000 / request.interval)))
-                print(f"Using limit of {limit} based on interval {request.interval}")
-            
-            cursor.execute("""
-                SELECT value FROM sensor_data
-                ORDER BY timestamp DESC
-                LIMIT %s
-            """, (limit,))
-            results = cursor.fetchall()
-            cursor.close()
+                log.debug("Using limit of %d based on interval %d", limit, request.interval)
             
-            # Extract values from results
-            values = [row[0] for row in results]
+            values = self.latest_values(limit, request.channel)
             
             # If there are fewer than 5 entries, pad with zeros
             while len(values) < 5:
                 values.append(0)
             
-            print(f"Returning {len(values)} values")
+            log.debug("Returning %d values", len(values))
             return control_pb2.DataResponse(
                 estado="OK",
-                valores=values
+                valores=values,
+                channel=request.channel
             )
         except Exception as e:
-            print(f"Error retrieving data: {e}")
-            # If database error, try to reconnect
-            if "connection" in str(e).lower():
-                self.check_db_connection()
-            
+            log.error("Error retrieving data: %s", e)
             return control_pb2.DataResponse(
                 estado="ERROR",
                 valores=[0, 0, 0, 0, 0]
             )
     
+    def GetLatestByChannel(self, request, context):
+        """Latest values of several channels with a single query"""
+        log.debug("GetLatestByChannel request received: %s", request)
+        try:
+            limit = min(request.limit or DEFAULT_CHANNEL_WINDOW, MAX_CHANNEL_WINDOW)
+            with self.db_pool.connection() as conn:
+                cursor = conn.cursor()
+                channels = list(request.channels)
+                if not channels:
+                    cursor.execute(CHANNEL_NAMES)
+                    channels = [row[0] for row in cursor.fetchall()]
+                cursor.execute(LATEST_BY_CHANNEL, (channels, limit))
+                rows = cursor.fetchall()
+                cursor.close()
+            return control_pb2.ChannelWindowResponse(success=True, windows=channel_windows(channels, rows))
+        except Exception as e:
+            log.error("Error retrieving channel windows: %s", e)
+            return control_pb2.ChannelWindowResponse(success=False)
+    
     def SendData(self, request, context):
         """Store data in PostgreSQL database"""
-        print(f"server.py: SendData request received: {request}")
+        log.debug("SendData request received: %s", request)
         try:
-            # Ensure database connection is active
-            if not self.check_db_connection():
-                return control_pb2.Response(success=False, recibido=request.mensaje)
-            
             # Parse the value from mensaje
             try:
                 value = int(request.mensaje)
             except ValueError:
-                print(f"Invalid value format: {request.mensaje}")
+                log.warning("Invalid value format: %s", request.mensaje)
                 return control_pb2.Response(success=False, recibido=f"Invalid value: {request.mensaje}")
+            channel = request.channel or DEFAULT_CHANNEL
+            
+            if self.ingest_buffer is not None:
+                # The flusher commits the row together with others
+                future = self.ingest_buffer.submit((value, channel), wait_for_commit=self.durability == "group")
+                if future is None:
+                    return control_pb2.Response(success=True, recibido=f"Queued value {value}")
+                record_id = future.result()
+                log.debug("Stored value %d with ID %d", value, record_id)
+                return control_pb2.Response(success=True, recibido=f"Stored value {value} with ID {record_id}",
+                                            sequence=record_id)
             
             # Insert data into database
-            cursor = self.db_connection.cursor()
-            cursor.execute("""
-                INSERT INTO sensor_data (value)
-                VALUES (%s) RETURNING id, timestamp
-            """, (value,))
-            result = cursor.fetchone()
-            self.db_connection.commit()
-            cursor.close()
+            with self.db_pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT INTO sensor_data (value, server)
+                    VALUES (%s, %s) RETURNING id, timestamp
+                """, (value, channel))
+                result = cursor.fetchone()
+                conn.commit()
+                cursor.close()
             
             record_id = result[0]
             timestamp = result[1]
-            print(f"Stored value {value} with ID {record_id} at {timestamp}")
+            self.latest_buffer.extend([(record_id, value, channel)])
+            log.debug("Stored value %d with ID %d at %s", value, record_id, timestamp)
             
             return control_pb2.Response(
                 success=True, 
-                recibido=f"Stored value {value} with ID {record_id}"
+                recibido=f"Stored value {value} with ID {record_id}",
+                sequence=record_id
             )
         except Exception as e:
-            print(f"Error storing data: {e}")
-            # If database error, try to reconnect
-            if "connection" in str(e).lower():
-                self.check_db_connection()
-            
+            log.error("Error storing data: %s", e)
             return control_pb2.Response(
                 success=False, 
                 recibido=f"Error: {str(e)}"
             )
     
+    def insert_batch(self, rows):
+        """Insert rows of (value, channel) with one multi-row INSERT and a single commit"""
+        start_time = time.perf_counter()
+        with self.db_pool.connection() as conn:
+            cursor = conn.cursor()
+            inserted = execute_values(
+                cursor,
+                "INSERT INTO sensor_data (value, server) VALUES %s RETURNING id",
+                rows,
+                page_size=len(rows),
+                fetch=True
+            )
+            conn.commit()
+            cursor.close()
+        elapsed = time.perf_counter() - start_time
+        ids = [row[0] for row in inserted]
+        self.latest_buffer.extend((record_id, value, channel) for record_id, (value, channel) in zip(ids, rows))
+        return ids, elapsed
+
+    def _store_batches(self, batches):
+        """Store an iterable of row lists, one commit per list, and build the ack response"""
+        acks = []
+        stored = 0
+        rejected = 0
+        total_elapsed = 0.0
+        error = None
+        try:
+            for rows, batch_rejected in batches:
+                rejected += batch_rejected
+                if not rows:
+                    continue
+                ids, elapsed = self.insert_batch(rows)
+                stored += len(ids)
+                total_elapsed += elapsed
+                acks.append(control_pb2.BatchAck(
+                    batch=len(acks) + 1,
+                    stored=len(ids),
+                    first_id=ids[0],
+                    last_id=ids[-1],
+                    elapsed_ms=elapsed * 1000,
+                    rows_per_second=len(ids) / elapsed if elapsed > 0 else 0.0
+                ))
+                log.debug("Stored batch %d of %d values in %.1fms", len(acks), len(ids), elapsed * 1000)
+        except Exception as e:
+            # Batches committed before the failure stay acknowledged
+            log.error("Error storing batch: %s", e)
+            error = e
+
+        if error is not None:
+            recibido = f"Error after {len(acks)} batches: {str(error)}"
+        else:
+            recibido = f"Stored {stored} values in {len(acks)} batches"
+        return control_pb2.BatchAckResponse(
+            success=error is None,
+            recibido=recibido,
+            stored=stored,
+            rejected=rejected,
+            rows_per_second=stored / total_elapsed if total_elapsed > 0 else 0.0,
+            batches=acks
+        )
+
+    def SendBatchData(self, request, context):
+        """Store every DataRequest of a BatchDataRequest with a single insert and commit"""
+        log.debug("SendBatchData request received with %d values", len(request.requests))
+        return self._store_batches([parse_values(request.requests)])
+
+    def SendDataStream(self, request_iterator, context):
+        """Store a client stream of DataRequest messages in batches of ingest_batch_size"""
+        log.debug("SendDataStream started")
+
+        def batches():
+            pending = []
+            for data_request in request_iterator:
+                pending.append(data_request)
+                if len(pending) >= self.ingest_batch_size:
+                    yield parse_values(pending)
+                    pending = []
+            if pending:
+                yield parse_values(pending)
+
+        response = self._store_batches(batches())
+        log.debug("SendDataStream finished: %s", response.recibido)
+        return response
+
     def GetHistoricalData(self, request, context):
         """Retrieve historical data from PostgreSQL database"""
-        print(f"server.py: GetHistoricalData request received: {request}")
+        log.debug("GetHistoricalData request received: %s", request)
         try:
-            # Ensure database connection is active
-            if not self.check_db_connection():
+            aggregation = request.aggregation or DEFAULT_AGGREGATION
+            if aggregation not in AGGREGATIONS:
+                log.warning("Invalid aggregation: %s", request.aggregation)
                 return control_pb2.HistoricalDataResponse(success=False, data=[])
             
-            cursor = self.db_connection.cursor()
-            
-            # Parse the time range
-            time_filter = "1 day"  # Default 24h
-            if request.timeRange == "1h":
-                time_filter = "1 hour"
-            elif request.timeRange == "6h":
-                time_filter = "6 hours"
-            elif request.timeRange == "7d":
-                time_filter = "7 days"
-            elif request.timeRange == "30d":
-                time_filter = "30 days"
-            
-            if request.timeRange == "all":
-                # Get all data (with reasonable limit)
-                cursor.execute("""
-                    SELECT value, timestamp, server FROM sensor_data
-                    ORDER BY timestamp DESC
-                    LIMIT 1000
-                """)
-            else:
-                # Get data within time range
-                cursor.execute("""
-                    SELECT value, timestamp, server FROM sensor_data
-                    WHERE timestamp > NOW() - INTERVAL %s
-                    ORDER BY timestamp DESC
-                """, (time_filter,))
-            
-            results = cursor.fetchall()
-            cursor.close()
+            results, aggregation, resolution = self.query_history(request, aggregation)
             
             # Format the response
             data_items = []
@@ -246,174 +460,354 @@ class ControlServiceServicer(control_pb2_grpc.ControlServiceServicer):
                 )
                 data_items.append(item)
             
-            print(f"Returning {len(data_items)} historical data points")
+            log.debug("Returning %d historical data points", len(data_items))
             return control_pb2.HistoricalDataResponse(
                 success=True,
-                data=data_items
+                data=data_items,
+                aggregation=aggregation,
+                resolution=resolution
             )
         except Exception as e:
-            print(f"Error retrieving historical data: {e}")
-            # If database error, try to reconnect
-            if "connection" in str(e).lower():
-                self.check_db_connection()
-            
+            log.error("Error retrieving historical data: %s", e)
             return control_pb2.HistoricalDataResponse(
                 success=False,
                 data=[]
             )
     
+    def GetHistoricalColumns(self, request, context):
+        """GetHistoricalData as packed columns, without per-row timestamp formatting"""
+        log.debug("GetHistoricalColumns request received: %s", request)
+        try:
+            aggregation = request.aggregation or DEFAULT_AGGREGATION
+            if aggregation not in AGGREGATIONS:
+                log.warning("Invalid aggregation: %s", request.aggregation)
+                return control_pb2.HistoricalDataColumns(success=False)
+            
+            columns, aggregation, resolution = self.query_history(request, aggregation, columns=True)
+            log.debug("Returning %d historical data points as columns", len(columns.values))
+            return encode_columns(columns, aggregation, resolution)
+        except Exception as e:
+            log.error("Error retrieving historical data: %s", e)
+            return control_pb2.HistoricalDataColumns(success=False)
+    
+    def query_history(self, request, aggregation, columns=False):
+        """Rows (value, timestamp, server) for a HistoricalDataRequest, with the aggregation and resolution used.
+
+        With columns, the rows come as Columns instead, raw ones packed into
+        arrays by the database (see columns_query).
+        """
+        time_filter = parse_time_range(request.timeRange)
+        channel = request.channel
+        with self.db_pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                if request.max_points > 0:
+                    # Reduce in the database (or NumPy for LTTB) before building messages
+                    start, end = self.history_window(cursor, request.timeRange, time_filter, channel)
+                    if start is not None:
+                        reduced = downsample(cursor, start, end, request.max_points, aggregation, channel)
+                        if reduced is not None:
+                            rows = rows_to_columns(reduced[0]) if columns else reduced[0]
+                            return rows, aggregation, reduced[1]
+                
+                # Columns also take the id, as the tie-breaker of their order
+                select = "timestamp, id, value, server" if columns else "value, timestamp, server"
+                conditions = []
+                params = []
+                if request.timeRange != "all":
+                    conditions.append("timestamp > NOW() - INTERVAL %s")
+                    params.append(time_filter)
+                if channel:
+                    conditions.append("server = %s")
+                    params.append(channel)
+                where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+                limit = ""
+                if request.timeRange == "all":
+                    # Get all data (with reasonable limit)
+                    limit = "LIMIT %s"
+                    params.append(request.max_points or 1000)
+                query = f"""
+                    SELECT {select} FROM sensor_data
+                    {where}
+                    ORDER BY timestamp DESC
+                    {limit}
+                """
+                if columns:
+                    servers = "SELECT %s::text" if channel else CHANNEL_NAMES
+                    cursor.execute(columns_query(query, servers), ([channel] if channel else []) + params)
+                    return decode_columns(cursor.fetchone()), "", "raw"
+                cursor.execute(query, params)
+                return cursor.fetchall(), "", "raw"
+            finally:
+                cursor.close()
+    
+    def StreamHistoricalData(self, request, context):
+        """Stream a whole time range in chunks, newest first, from a server-side cursor"""
+        log.debug("StreamHistoricalData request received: %s", request)
+        chunk_size = min(request.chunk_size or HISTORY_CHUNK_SIZE, HISTORY_MAX_CHUNK_SIZE)
+        after = None
+        if request.resume_token:
+            try:
+                since, after_ts, after_id = decode_resume_token(request.resume_token)
+                after = (after_ts, after_id)
+            except (ValueError, KeyError, TypeError) as e:
+                context.abort(grpc.StatusCode.INVALID_ARGUMENT, f"Invalid resume_token: {e}")
+        
+        # Each download holds a connection until it ends; leave the rest of the pool to other RPCs
+        with self.stream_slots_lock:
+            if self.active_history_streams >= HISTORY_MAX_STREAMS:
+                context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED,
+                              f"Too many concurrent history downloads (limit {HISTORY_MAX_STREAMS})")
+            self.active_history_streams += 1
+        
+        sent = 0
+        try:
+            with self.db_pool.connection() as conn:
+                if after is None:
+                    # Fix the range start now so a resumed download covers the same window
+                    since = None
+                    if request.timeRange != "all":
+                        with conn.cursor() as cursor:
+                            since = self.history_window(cursor, request.timeRange,
+                                                        parse_time_range(request.timeRange))[0]
+                
+                conditions = []
+                params = []
+                if request.channel:
+                    conditions.append("server = %s")
+                    params.append(request.channel)
+                if since is not None:
+                    conditions.append("timestamp >= %s")
+                    params.append(since)
+                if after is not None:
+                    conditions.append("(timestamp, id) < (%s, %s)")
+                    params.extend(after)
+                where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+                
+                # Named cursor: rows stay on the server and arrive chunk by chunk;
+                # closed on every exit, also when the client cancels the stream
+                with conn.cursor(name=f"history_{uuid.uuid4().hex}") as cursor:
+                    cursor.itersize = chunk_size
+                    cursor.execute(f"""
+                        SELECT id, value, timestamp, server FROM sensor_data
+                        {where}
+                        ORDER BY timestamp DESC, id DESC
+                    """, params)
+                
+                    while context.is_active():
+                        rows = cursor.fetchmany(chunk_size)
+                        last = len(rows) < chunk_size
+                        token = ""
+                        if rows:
+                            token = encode_resume_token(since, rows[-1][2], rows[-1][0])
+                        yield control_pb2.HistoricalDataChunk(
+                            data=[
+                                control_pb2.HistoricalDataItem(
+                                    value=row[1],
+                                    timestamp=row[2].isoformat(),
+                                    server=row[3] if row[3] else "main-server"
+                                )
+                                for row in rows
+                            ],
+                            resume_token=token,
+                            last=last
+                        )
+                        sent += len(rows)
+                        if last:
+                            break
+        except Exception as e:
+            log.error("Error streaming historical data: %s", e)
+            context.abort(grpc.StatusCode.INTERNAL, f"Error after {sent} rows: {e}")
+        finally:
+            with self.stream_slots_lock:
+                self.active_history_streams -= 1
+        log.debug("StreamHistoricalData sent %d rows", sent)
+    
+    def history_window(self, cursor, time_range, time_filter, channel=""):
+        """Start and end timestamps covered by a timeRange; (None, None) if there is no data"""
+        cursor.execute(*window_query(time_range, time_filter, channel))
+        return cursor.fetchone()
+    
     def StreamData(self, request, context):
         """Stream data updates to the client"""
         client_id = context.peer()
         #client_id = request.clientId
         interval_ms = request.interval if request.interval > 0 else 5000  # Default 5 seconds
-        print(f"New streaming client connected: {client_id}, interval: {interval_ms}ms")
-        
-        # Create a queue for this client
-        import queue
-        client_queue = queue.Queue()
+        incremental = request.incremental or request.resume_from > 0
+        log.info("New streaming client connected: %s, interval: %dms%s", client_id, interval_ms,
+                 f", incremental from {request.resume_from}" if incremental else "")
+        if request.overflow and request.overflow not in OVERFLOW_POLICIES:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, f"Invalid overflow policy '{request.overflow}'")
+        if request.resume_from > self.newest_sequence():
+            context.abort(grpc.StatusCode.OUT_OF_RANGE,
+                          f"resume_from {request.resume_from} is ahead of the newest sample")
         
-        # Register the client
-        with self.client_lock:
-            self.streaming_clients[client_id] = {
-                'interval': interval_ms,
-                'last_update': 0,  # 0 means send immediately
-                'queue': client_queue
-            }
+        # Reserve workers for unary RPCs: each open stream holds one thread
+        subscriber = None
+        with self.stream_slots_lock:
+            if self.active_streams >= GRPC_MAX_STREAMS:
+                context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED,
+                              f"Too many concurrent streams (limit {GRPC_MAX_STREAMS})")
+            self.active_streams += 1
         
-        # Send initial data
-        initial_data = self.GetData(control_pb2.DataRequest(mensaje="initial", interval=interval_ms), context)
-        yield initial_data
-        
-        # Set up cleanup callback
-        def on_rpc_done():
-            print(f"Streaming client disconnected: {client_id}")
-            with self.client_lock:
-                if client_id in self.streaming_clients:
-                    del self.streaming_clients[client_id]
-        
-        context.add_callback(on_rpc_done)
-        
-        # Start background thread for this client
-        client_thread = threading.Thread(
-            target=self.handle_client_stream,
-            args=(client_id, client_queue, interval_ms, context),
-            daemon=True
-        )
-        client_thread.start()
-        
-        # Wait for updates from the queue and yield them to the client
         try:
-            while not context.is_active():
-                try:
-                    # Get the next update, with timeout
-                    update = client_queue.get(timeout=0.5)
-                    print(f"Sending update to client {client_id}: {update.valores}")
+            if incremental:
+                # Replay the missed rows, then let the fan-out continue after the last one sent.
+                # A new stream starts at the commit watermark, which its first window stops at
+                sequence = request.resume_from if request.resume_from > 0 else self.watermark.value
+                for update in self.catch_up(request.resume_from, window_size(interval_ms), request.channel):
+                    sequence = update.sequences[-1]
                     yield update
+                subscriber = self.stream_fanout.subscribe(client_id, interval_ms, sequence=sequence,
+                                                          channel=request.channel, overflow=request.overflow)
+                context.add_callback(lambda: self.stream_fanout.unsubscribe(subscriber))
+            else:
+                # Register with the shared fan-out engine and send initial data
+                subscriber = self.stream_fanout.subscribe(client_id, interval_ms, channel=request.channel,
+                                                          overflow=request.overflow)
+                context.add_callback(lambda: self.stream_fanout.unsubscribe(subscriber))
+                yield self.GetData(control_pb2.DataRequest(mensaje="initial", interval=interval_ms,
+                                                           channel=request.channel), context)
+            
+            # Wait for updates from the queue and yield them to the client
+            while context.is_active():
+                try:
+                    update = subscriber.get(timeout=5)
                 except queue.Empty:
-                    # No update available, check if context is still active
-                    if not context.is_active():
-                        break
+                    # Safety net; disconnects normally wake the queue via the RPC callback
                     continue
+                if update is None:
+                    if subscriber.overflowed:
+                        context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+                        context.set_details(f"Client fell {subscriber.max_queued} updates behind")
+                    break
+                yield update
         except Exception as e:
-            print(f"Error in StreamData for client {client_id}: {e}")
+            log.error("Error in StreamData for client %s: %s", client_id, e)
         finally:
             # Clean up on exit
-            with self.client_lock:
-                if client_id in self.streaming_clients:
-                    del self.streaming_clients[client_id]
-            print(f"StreamData for client {client_id} has ended")
-    
-    def handle_client_stream(self, client_id, client_queue, interval_ms, context):
-        """Periodically fetch and queue data for a specific client"""
-        interval_seconds = interval_ms / 1000
+            if subscriber is not None:
+                self.stream_fanout.unsubscribe(subscriber)
+            with self.stream_slots_lock:
+                self.active_streams -= 1
+            log.info("StreamData for client %s has ended", client_id)
+
+    def GetStatus(self, request, context):
+        """Report database health, uptime and internal counters"""
+        status = control_pb2.StatusResponse.HEALTHY
+        message = "OK"
+        try:
+            with self.db_pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT 1")
+                cursor.close()
+        except Exception as e:
+            status = control_pb2.StatusResponse.DEGRADED
+            message = f"Database unavailable: {e}"
         
-        while context.is_active():
-            try:
-                start_time = time.time()
-                
-                # Only proceed if enough time has passed since the last update
-                with self.client_lock:
-                    if client_id not in self.streaming_clients:
-                        # Client was removed, exit the thread
-                        break
-                    
-                    client_info = self.streaming_clients[client_id]
-                    time_since_update = start_time - client_info['last_update']
-                    
-                    if time_since_update < interval_seconds:
-                        # Not time for an update yet
-                        sleep_time = max(0.1, interval_seconds - time_since_update)
-                        time.sleep(sleep_time)
-                        continue
-                
-                # Time for an update - fetch the latest data
-                if not self.check_db_connection():
-                    time.sleep(1)  # Wait before retrying
-                    continue
-                
-                cursor = self.db_connection.cursor()
-                limit = max(5, min(20, int(30000 / interval_ms)))
+        subscribers = []
+        if request.include_subscribers:
+            newest = self.latest_buffer.last_id()
+            subscribers = [subscriber_status(subscriber, newest) for subscriber in self.stream_fanout.subscribers()]
+        
+        with self.stream_slots_lock:
+            active_streams = self.active_streams
+        return control_pb2.StatusResponse(
+            status=status,
+            message=message,
+            uptime=(time.time() - self.started_at) / 3600,
+            activeConnections=active_streams,
+            metrics=self.status_metrics(),
+            subscribers=subscribers
+        )
+
+    def status_metrics(self):
+        """Internal counters by name, as reported by GetStatus"""
+        metrics = {}
+        for name, value in self.latest_buffer.stats().items():
+            metrics[f"latest_buffer_{name}"] = value
+        for name, value in self.watermark.stats().items():
+            metrics[f"commit_watermark_{name}"] = value
+        for name, value in self.db_pool.stats().items():
+            metrics[f"db_pool_{name}"] = value
+        metrics["stream_subscribers"] = self.stream_fanout.subscriber_count()
+        for name, value in self.stream_fanout.stats().items():
+            metrics[f"stream_{name}"] = value
+        if self.ingest_buffer is not None:
+            for name, value in self.ingest_buffer.stats().items():
+                metrics[f"ingest_{name}"] = value
+        for name, value in self.retention.stats().items():
+            metrics[f"retention_{name}"] = value
+        for name, value in self.rollups.stats().items():
+            metrics[f"rollup_{name}"] = value
+        with self.stream_slots_lock:
+            metrics["stream_active"] = self.active_streams
+            metrics["history_stream_active"] = self.active_history_streams
+        for name, value in logs.stats().items():
+            metrics[f"log_{name}"] = value
+        return metrics
+
+    def query_latest_values(self, limit, channel=""):
+        """Latest values, newest first, read from the database"""
+        with self.db_pool.connection() as conn:
+            cursor = conn.cursor()
+            if channel:
+                cursor.execute("""
+                    SELECT value FROM sensor_data
+                    WHERE server = %s
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT %s
+                """, (channel, limit))
+            else:
                 cursor.execute("""
                     SELECT value FROM sensor_data
                     ORDER BY timestamp DESC
                     LIMIT %s
                 """, (limit,))
-                results = cursor.fetchall()
-                cursor.close()
-                
-                # Extract values from results
-                values = [row[0] for row in results]
-                while len(values) < 5:
-                    values.append(0)
-                
-                # Create a response
-                data_response = control_pb2.DataResponse(
-                    estado="OK",
-                    valores=values,
-                    timestamp=int(time.time())
-                )
-                
-                # Queue the update for the client
-                with self.client_lock:
-                    if client_id in self.streaming_clients:
-                        self.streaming_clients[client_id]['queue'].put(data_response)
-                        self.streaming_clients[client_id]['last_update'] = time.time()
-                        print(f"Queued periodic update for client {client_id} with values {values}")
-                
-                # Sleep until the next update is due
-                time.sleep(interval_seconds)
-                
-            except Exception as e:
-                print(f"Error handling stream for client {client_id}: {e}")
-                time.sleep(1)  # Wait before retrying
-                
-                # If database connection error, try to reconnect
-                if "connection" in str(e).lower():
-                    self.check_db_connection()
-
-
-        
+            results = cursor.fetchall()
+            cursor.close()
+        return [row[0] for row in results]
 
 
 def serve():
     """Start the gRPC server"""
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    control_pb2_grpc.add_ControlServiceServicer_to_server(ControlServiceServicer(), server)
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=GRPC_MAX_WORKERS + GRPC_MAX_STREAMS + HISTORY_MAX_STREAMS),
+        interceptors=[MetricsInterceptor()], options=server_options())
+    servicer = ControlServiceServicer()
+    if METRICS_PORT:
+        serve_metrics(METRICS_PORT)
+    control_pb2_grpc.add_ControlServiceServicer_to_server(servicer, server)
     server_address = '[::]:50051'
     server.add_insecure_port(server_address)
     server.start()
-    print(f"gRPC Server running on {server_address}")
+    log.info("gRPC Server running on %s", server_address)
+    # Container stop sends SIGTERM; shut down the same way as on Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
     try:
         # Keep the server running until interrupted
         while True:
             time.sleep(86400)  # 1 day in seconds
     except KeyboardInterrupt:
-        print("Server shutting down...")
+        log.info("Server shutting down...")
         server.stop(0)
+        if servicer.ingest_buffer is not None:
+            # Commit the rows that were already acknowledged
+            servicer.ingest_buffer.close()
 
 if __name__ == "__main__":
-    serve()
+    logs.setup_logging()
+    if sys.argv[1:] == ["migrate"]:
+        migrate()
+    elif GRPC_SERVER_MODE == "asyncio":
+        import asyncio
+        import aio_server
+        try:
+            asyncio.run(aio_server.serve())
+        except KeyboardInterrupt:
+            log.info("Server shutting down...")
+    else:
+        serve()
 
 
 '''
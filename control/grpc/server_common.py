@@ -0,0 +1,201 @@
+import base64
+import json
+import logging
+import os
+from datetime import datetime
+
+import psycopg2
+
+from db_pool import db_settings_from_env
+from stream_fanout import OVERFLOW_POLICIES
+from notify_listener import install_notify_trigger
+from rollups import install_rollup_trigger, RollupAggregator
+from retention import RetentionEngine, parse_retention
+from channels import DEFAULT_CHANNEL
+from migrations import run_migrations
+from ingest_buffer import DURABILITY_LEVELS
+
+# Settings and helpers shared by the thread server (server.py) and the
+# asyncio server (aio_server.py)
+
+log = logging.getLogger(__name__)
+
+# Worker threads for unary RPCs; also the default upper bound of the DB pool
+GRPC_MAX_WORKERS = int(os.getenv("GRPC_MAX_WORKERS", "10"))
+# Concurrent StreamData calls; each holds a server thread, so they get their own workers
+GRPC_MAX_STREAMS = int(os.getenv("GRPC_MAX_STREAMS", "1000"))
+# "notify": push stream updates on LISTEN/NOTIFY, polling while the listener is down
+# "poll": always poll the latest window on each subscriber interval
+STREAM_MODE = os.getenv("STREAM_MODE", "notify")
+# Updates queued per StreamData client, and what happens when a slow client
+# fills its queue: "drop_oldest", "coalesce" or "disconnect" (see stream_fanout)
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "100"))
+STREAM_OVERFLOW = os.getenv("STREAM_OVERFLOW", "drop_oldest")
+# Native range partitioning of sensor_data: "" (off), "day" or "month"
+DB_PARTITION_BY = os.getenv("DB_PARTITION_BY", "")
+# Partitions created ahead of time, and how often (seconds) that is checked
+DB_PARTITION_PREMAKE = int(os.getenv("DB_PARTITION_PREMAKE", "3"))
+DB_MAINTENANCE_INTERVAL = int(os.getenv("DB_MAINTENANCE_INTERVAL", "3600"))
+# Migrations that rewrite sensor_data run at startup only below this many
+# rows; above it they wait for "python server.py migrate". Batched
+# migrations commit every MIGRATION_BATCH_ROWS rows
+MIGRATION_ONLINE_ROWS = int(os.getenv("MIGRATION_ONLINE_ROWS", "100000"))
+MIGRATION_BATCH_ROWS = int(os.getenv("MIGRATION_BATCH_ROWS", "10000"))
+# "thread": grpc.server on a thread pool with psycopg2 (this module)
+# "asyncio": grpc.aio with psycopg 3 and an async pool (aio_server.py)
+GRPC_SERVER_MODE = os.getenv("GRPC_SERVER_MODE", "thread")
+
+# Rows per StreamHistoricalData chunk when the request does not set one, and the upper bound
+HISTORY_CHUNK_SIZE = int(os.getenv("HISTORY_CHUNK_SIZE", "1000"))
+HISTORY_MAX_CHUNK_SIZE = int(os.getenv("HISTORY_MAX_CHUNK_SIZE", "10000"))
+# Concurrent StreamHistoricalData calls; each holds a pool connection (and in
+# thread mode a worker) for the whole download, so keep it below DB_POOL_MAX
+HISTORY_MAX_STREAMS = int(os.getenv("HISTORY_MAX_STREAMS", "4"))
+
+# Most recent samples kept in memory for GetData and the stream fan-out
+LATEST_BUFFER_DEPTH = int(os.getenv("LATEST_BUFFER_DEPTH", "1000"))
+# While no notifications report other writers' rows (STREAM_MODE=poll or the
+# listener is down), reads look for them at most once per this many ms
+LATEST_BUFFER_SYNC_MS = int(os.getenv("LATEST_BUFFER_SYNC_MS", "100"))
+# Seconds incremental streams wait for an open transaction that may still
+# commit rows behind newer ones before moving past them (see watermark.py)
+WATERMARK_TIMEOUT = float(os.getenv("WATERMARK_TIMEOUT", "30"))
+
+# When SendData acknowledges a row: "sync" (own commit), "group" or "enqueue" (see ingest_buffer.py)
+INGEST_DURABILITY = os.getenv("INGEST_DURABILITY", "sync")
+# Write-behind group commits: at most this many rows, at most this long after the oldest one
+INGEST_FLUSH_ROWS = int(os.getenv("INGEST_FLUSH_ROWS", "500"))
+INGEST_FLUSH_INTERVAL_MS = int(os.getenv("INGEST_FLUSH_INTERVAL_MS", "10"))
+# Rows the write-behind buffer holds before SendData blocks
+INGEST_BUFFER_CAPACITY = int(os.getenv("INGEST_BUFFER_CAPACITY", "10000"))
+
+# How long data is kept ("7d", "12h", "30m"); empty keeps it forever, e.g.
+# RETENTION_RAW=7d RETENTION_1M=90d and hourly rollups forever
+RETENTION_RAW = os.getenv("RETENTION_RAW", "")
+RETENTION_1M = os.getenv("RETENTION_1M", "")
+RETENTION_1H = os.getenv("RETENTION_1H", "")
+# Seconds between retention runs, and rows removed per delete transaction
+RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL", "3600"))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "10000"))
+
+# Inserts leave partial aggregates that a background thread merges into the
+# rollups every ROLLUP_INTERVAL_MS, ROLLUP_BATCH_SIZE per transaction
+ROLLUP_INTERVAL_MS = int(os.getenv("ROLLUP_INTERVAL_MS", "1000"))
+ROLLUP_BATCH_SIZE = int(os.getenv("ROLLUP_BATCH_SIZE", "10000"))
+
+# HTTP port serving Prometheus metrics at /metrics; 0 turns it off
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9101"))
+
+# Shortest interval (ms) at which a client may send keepalive pings, also
+# while it has no call open; pings sent faster than that get it disconnected
+GRPC_MIN_PING_INTERVAL_MS = int(os.getenv("GRPC_MIN_PING_INTERVAL_MS", "10000"))
+
+
+def server_options():
+    """Channel arguments of the gRPC server, in both modes"""
+    return [
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.min_ping_interval_without_data_ms", GRPC_MIN_PING_INTERVAL_MS),
+    ]
+
+
+def prepare_database(conn, offline=False):
+    """Bring the schema up to date and install the sensor_data insert triggers.
+
+    offline also applies the migrations that rewrite a large sensor_data
+    (see run_migrations); only for when the servers are stopped.
+    """
+    run_migrations(conn, {
+        "partition_by": DB_PARTITION_BY,
+        "premake": DB_PARTITION_PREMAKE,
+        "online_rows": MIGRATION_ONLINE_ROWS,
+        "batch_rows": MIGRATION_BATCH_ROWS
+    }, offline=offline)
+    cursor = conn.cursor()
+    install_notify_trigger(cursor)
+    install_rollup_trigger(cursor)
+    conn.commit()
+    cursor.close()
+
+
+def migrate():
+    """Offline schema step ("python server.py migrate"): every pending migration, then exit"""
+    conn = psycopg2.connect(**db_settings_from_env())
+    try:
+        prepare_database(conn, offline=True)
+    finally:
+        conn.close()
+    log.info("Database migrations complete")
+
+
+def ingest_durability():
+    """Configured INGEST_DURABILITY, falling back to "sync" for unknown values"""
+    if INGEST_DURABILITY not in DURABILITY_LEVELS:
+        log.warning("Unknown INGEST_DURABILITY '%s', using 'sync'", INGEST_DURABILITY)
+        return "sync"
+    return INGEST_DURABILITY
+
+
+def stream_overflow():
+    """Configured STREAM_OVERFLOW, falling back to "drop_oldest" for unknown values"""
+    if STREAM_OVERFLOW not in OVERFLOW_POLICIES:
+        log.warning("Unknown STREAM_OVERFLOW '%s', using 'drop_oldest'", STREAM_OVERFLOW)
+        return "drop_oldest"
+    return STREAM_OVERFLOW
+
+
+def retention_engine(connection):
+    """RetentionEngine for the RETENTION_* settings, using connection() for its database work"""
+    policies = {
+        "sensor_data": parse_retention(RETENTION_RAW),
+        "sensor_data_1m": parse_retention(RETENTION_1M),
+        "sensor_data_1h": parse_retention(RETENTION_1H),
+    }
+    return RetentionEngine(connection, policies, interval=RETENTION_INTERVAL, batch_size=RETENTION_BATCH_SIZE)
+
+
+def rollup_aggregator(connection):
+    """RollupAggregator for the ROLLUP_* settings, using connection() for its database work"""
+    return RollupAggregator(connection, interval_ms=ROLLUP_INTERVAL_MS, batch_size=ROLLUP_BATCH_SIZE)
+
+
+def parse_values(requests):
+    """Split DataRequest messages into rows of (value, channel) and a rejected count"""
+    rows = []
+    rejected = 0
+    for data_request in requests:
+        try:
+            rows.append((int(data_request.mensaje), data_request.channel or DEFAULT_CHANNEL))
+        except ValueError:
+            rejected += 1
+    return rows, rejected
+
+
+def parse_time_range(time_range):
+    """PostgreSQL interval for a timeRange value; "all" is handled by the callers"""
+    time_filter = "1 day"  # Default 24h
+    if time_range == "1h":
+        time_filter = "1 hour"
+    elif time_range == "6h":
+        time_filter = "6 hours"
+    elif time_range == "7d":
+        time_filter = "7 days"
+    elif time_range == "30d":
+        time_filter = "30 days"
+    return time_filter
+
+
+def encode_resume_token(since, timestamp, record_id):
+    """Opaque keyset position: the range start plus the last (timestamp, id) sent"""
+    position = {
+        "since": since.isoformat() if since else None,
+        "ts": timestamp.isoformat(),
+        "id": record_id
+    }
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_resume_token(token):
+    position = json.loads(base64.urlsafe_b64decode(token.encode()))
+    since = datetime.fromisoformat(position["since"]) if position["since"] else None
+    return since, datetime.fromisoformat(position["ts"]), int(position["id"])
@@ -0,0 +1,410 @@
+import heapq
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+import control_pb2
+from metrics import REGISTRY
+
+log = logging.getLogger(__name__)
+
+# Largest window any subscriber can ask for
+MAX_WINDOW = 20
+
+# Most rows an incremental update carries; a longer backlog spreads over several updates
+MAX_INCREMENT = 1000
+
+# What a subscriber whose queue is full does with the next update
+#   "drop_oldest": discard the oldest queued update to make room
+#   "coalesce":    discard every queued update; the new window supersedes them
+#   "disconnect":  end the stream with RESOURCE_EXHAUSTED
+# Incremental subscribers never lose rows to the first two: their sequence
+# stops advancing while the queue is full and they catch up once it drains.
+OVERFLOW_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+FANOUT_SECONDS = REGISTRY.histogram(
+    "stream_fanout_seconds", "Time to read and queue one round of stream updates, by kind", ("kind",))
+
+
+def window_size(interval_ms):
+    """Number of latest values sent to a subscriber updating every interval_ms"""
+    return max(5, min(MAX_WINDOW, int(30000 / interval_ms)))
+
+
+def increment_response(rows, timestamp=None, channel=""):
+    """Incremental DataResponse for rows of (sequence, value), oldest first"""
+    return control_pb2.DataResponse(
+        estado="OK",
+        valores=[value for _, value in rows],
+        sequences=[sequence for sequence, _ in rows],
+        timestamp=int(time.time()) if timestamp is None else timestamp,
+        channel=channel
+    )
+
+
+class Subscriber:
+    """One StreamData client registered with the fan-out engine.
+
+    Updates wait in a queue of at most max_queued entries; overflow is one
+    of OVERFLOW_POLICIES. A None update tells the RPC to end the stream.
+    """
+
+    def __init__(self, client_id, interval_ms, max_queued=100, overflow="drop_oldest"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Invalid overflow policy '{overflow}', expected one of {', '.join(OVERFLOW_POLICIES)}")
+        self.client_id = client_id
+        self.interval_ms = interval_ms
+        self.max_queued = max_queued
+        self.overflow = overflow
+        self.active = True
+        # Incremental subscribers get the rows after this sequence instead of
+        # the latest window; None for window subscribers
+        self.sequence = None
+        self.channel = ""  # Empty for every channel
+        self._updates = deque()  # (queued at, update)
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.deferred = 0  # Increments held back while the queue was full
+        self.overflowed = False  # Disconnected for falling behind
+
+    def put(self, update):
+        """Queue an update; called from the fan-out thread.
+
+        Returns False if the update was not queued.
+        """
+        with self._lock:
+            if not self.active:
+                return False
+            if len(self._updates) >= self.max_queued:
+                if self.overflow == "disconnect":
+                    self.overflowed = True
+                    self.active = False
+                    self._updates.clear()
+                    self._updates.append((time.monotonic(), None))
+                    self._notify()
+                    return False
+                if self.sequence is not None:
+                    self.deferred += 1
+                    return False
+                if self.overflow == "coalesce":
+                    self.coalesced += len(self._updates)
+                    self._updates.clear()
+                else:
+                    self._updates.popleft()
+                    self.dropped += 1
+            self._updates.append((time.monotonic(), update))
+            self._notify()
+            return True
+
+    def _notify(self):
+        """Wake the RPC waiting for an update; called with the lock held"""
+        self._ready.notify()
+
+    def _take(self):
+        """The oldest queued update, or raise queue.Empty; call with the lock held"""
+        if not self._updates:
+            raise queue.Empty
+        _, update = self._updates.popleft()
+        if update is not None:
+            self.sent += 1
+        return update
+
+    def get(self, timeout=None):
+        """Wait for the next update; raises queue.Empty after timeout seconds"""
+        with self._lock:
+            self._ready.wait_for(lambda: self._updates, timeout)
+            return self._take()
+
+    def close(self):
+        """Mark the subscriber as gone and wake the RPC waiting on its queue"""
+        with self._lock:
+            self.active = False
+            self._updates.append((time.monotonic(), None))
+            self._notify()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queued": len(self._updates),
+                "lag_ms": (time.monotonic() - self._updates[0][0]) * 1000 if self._updates else 0.0,
+                "sent": self.sent,
+                "dropped": self.dropped,
+                "coalesced": self.coalesced,
+                "deferred": self.deferred
+            }
+
+
+def subscriber_status(subscriber, newest_sequence):
+    """SubscriberStatus of a subscriber; newest_sequence measures how far an incremental one is behind"""
+    stats = subscriber.stats()
+    return control_pb2.SubscriberStatus(
+        client_id=subscriber.client_id,
+        interval=subscriber.interval_ms,
+        channel=subscriber.channel,
+        overflow=subscriber.overflow,
+        queued=stats["queued"],
+        lag_ms=stats["lag_ms"],
+        sent=stats["sent"],
+        dropped=stats["dropped"],
+        coalesced=stats["coalesced"],
+        deferred=stats["deferred"],
+        sequence_lag=max(newest_sequence - subscriber.sequence, 0) if subscriber.sequence is not None else 0
+    )
+
+
+class StreamFanout:
+    """Single scheduler that serves every StreamData subscriber.
+
+    Subscribers are grouped by interval and the groups are kept in a timer
+    heap ordered by their next due time. On each tick the latest window is
+    read once per channel, with the largest limit any due group needs, and
+    the same DataResponse is queued for every subscriber of a group.
+
+    In push mode (see set_push_mode) the database is only read when wake()
+    reports new rows, and the fresh window goes to every subscriber at once.
+    Timer ticks then resend the cached window without touching the database.
+
+    Incremental subscribers instead receive the rows stored after the last
+    sequence they were sent, read once per distinct sequence, and nothing
+    when no rows arrived.
+    """
+
+    def __init__(self, fetch_latest, fetch_since=None, min_push_interval_ms=20, subscriber_class=Subscriber,
+                 max_queued=100, overflow="drop_oldest"):
+        # fetch_latest(limit, channel) returns the newest values, newest first
+        self.fetch_latest = fetch_latest
+        # fetch_since(sequence, limit, channel) returns rows of (sequence, value) after sequence, oldest first,
+        # none past a row that may still commit: subscribers never go back below their sequence
+        self.fetch_since = fetch_since
+        self.subscriber_class = subscriber_class
+        # Per-subscriber queue bound and the default policy when it is reached
+        self.max_queued = max_queued
+        self.overflow = overflow
+        # Counters of subscribers that have left, so the totals survive them
+        self._finished = {"sent": 0, "dropped": 0, "coalesced": 0, "deferred": 0, "overflowed": 0}
+        # Lower bound between two push reads, so an insert burst costs one query
+        self.min_push_interval = min_push_interval_ms / 1000
+        # interval_ms -> set of Subscriber. A group stays here, possibly empty,
+        # for as long as it has an entry in the heap
+        self._groups = {}
+        self._heap = []  # (due_time, interval_ms), one entry per group
+        self._cond = threading.Condition()
+        self._thread = None
+        self._push_mode = False
+        self._woken = False
+        self._last_push = 0.0
+        self._cached_values = {}  # channel -> latest window; only trusted in push mode
+
+    def subscribe(self, client_id, interval_ms, sequence=None, channel="", overflow=""):
+        """Register a client; its first periodic update is due one interval from now.
+
+        With a sequence the client is incremental and continues after that
+        sequence. A channel restricts its updates to that channel, and
+        overflow overrides the default overflow policy.
+        """
+        subscriber = self.subscriber_class(client_id, interval_ms, self.max_queued, overflow or self.overflow)
+        subscriber.sequence = sequence
+        subscriber.channel = channel
+        with self._cond:
+            group = self._groups.get(interval_ms)
+            if group is None:
+                group = self._groups[interval_ms] = set()
+                heapq.heappush(self._heap, (time.monotonic() + interval_ms / 1000, interval_ms))
+            group.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stream-fanout", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        log.debug("Subscribed %s every %dms (%d streams)", client_id, interval_ms, self.subscriber_count())
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        """Remove a client; an emptied group leaves the heap at its next due time"""
+        subscriber.close()
+        with self._cond:
+            group = self._groups.get(subscriber.interval_ms)
+            if group is not None and subscriber in group:
+                group.remove(subscriber)
+                for name, value in subscriber.stats().items():
+                    if name in self._finished:
+                        self._finished[name] += value
+                self._finished["overflowed"] += subscriber.overflowed
+
+    def subscriber_count(self):
+        with self._cond:
+            return sum(len(group) for group in self._groups.values())
+
+    def subscribers(self):
+        with self._cond:
+            return [subscriber for group in self._groups.values() for subscriber in group]
+
+    def stats(self):
+        """Update counters over every subscriber so far, and the worst queue of the current ones"""
+        with self._cond:
+            totals = dict(self._finished)
+            current = [(subscriber, subscriber.stats()) for group in self._groups.values() for subscriber in group]
+        queued_max = 0
+        lag_ms_max = 0.0
+        for subscriber, stats in current:
+            for name in ("sent", "dropped", "coalesced", "deferred"):
+                totals[name] += stats[name]
+            totals["overflowed"] += subscriber.overflowed
+            queued_max = max(queued_max, stats["queued"])
+            lag_ms_max = max(lag_ms_max, stats["lag_ms"])
+        totals["queued_max"] = queued_max
+        totals["lag_ms_max"] = lag_ms_max
+        return totals
+
+    def set_push_mode(self, enabled):
+        """Switch between push (wake-driven) and polling updates"""
+        with self._cond:
+            if enabled == self._push_mode:
+                return
+            self._push_mode = enabled
+            # Rows may have arrived while nobody was listening
+            self._cached_values = {}
+            self._woken = enabled
+            self._cond.notify()
+        log.info("Stream fan-out switched to %s mode", "push" if enabled else "polling")
+
+    def wake(self):
+        """New rows were stored: push a fresh window to every subscriber"""
+        with self._cond:
+            if self._push_mode:
+                self._woken = True
+                self._cond.notify()
+
+    def _next_due(self):
+        """Wait for a wake-up or for due intervals; pop due groups, dropping empty ones.
+
+        Returns (due, pushed). When pushed is set, due holds every group and
+        none of them is removed from the heap.
+        """
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                push_at = None
+                if self._woken and not any(self._groups.values()):
+                    # Nobody to push to; the next subscriber starts from a fresh read
+                    self._woken = False
+                    self._cached_values = {}
+                elif self._woken:
+                    push_at = self._last_push + self.min_push_interval
+                    if push_at <= now:
+                        self._woken = False
+                        self._last_push = now
+                        due = [(None, interval_ms, list(group)) for interval_ms, group in self._groups.items() if group]
+                        return due, True
+                if self._heap and self._heap[0][0] <= now:
+                    break
+                wake_times = [t for t in (push_at, self._heap[0][0] if self._heap else None) if t is not None]
+                self._cond.wait(min(wake_times) - now if wake_times else None)
+
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                due_time, interval_ms = heapq.heappop(self._heap)
+                group = self._groups[interval_ms]
+                if not group:
+                    del self._groups[interval_ms]
+                    continue
+                due.append((due_time, interval_ms, list(group)))
+            return due, False
+
+    def _latest_values(self, limit, pushed, channel):
+        """Read a channel's latest window, or reuse the cached one for push-mode timer ticks"""
+        with self._cond:
+            cached = self._cached_values.get(channel)
+            push_mode = self._push_mode
+        if push_mode and not pushed and cached is not None:
+            return cached
+        values = self.fetch_latest(MAX_WINDOW if push_mode else limit, channel)
+        with self._cond:
+            if self._push_mode:
+                self._cached_values[channel] = values
+        return values
+
+    def _send_windows(self, groups, pushed):
+        """Queue the latest window for each (interval_ms, subscribers) group"""
+        # channel -> interval_ms -> subscribers
+        channels = {}
+        for interval_ms, subscribers in groups:
+            for subscriber in subscribers:
+                channels.setdefault(subscriber.channel, {}).setdefault(interval_ms, []).append(subscriber)
+
+        timestamp = int(time.time())
+        for channel, channel_groups in channels.items():
+            try:
+                values = self._latest_values(max(window_size(interval_ms) for interval_ms in channel_groups),
+                                             pushed, channel)
+            except Exception as e:
+                log.error("Error fetching stream update: %s", e)
+                continue
+            for interval_ms, subscribers in channel_groups.items():
+                window = values[:window_size(interval_ms)]
+                while len(window) < 5:
+                    window.append(0)
+                # One response object shared by the whole group
+                response = control_pb2.DataResponse(estado="OK", valores=window, timestamp=timestamp,
+                                                     channel=channel)
+                for subscriber in subscribers:
+                    subscriber.put(response)
+
+    def _send_increments(self, subscribers):
+        """Queue the rows after each incremental subscriber's sequence"""
+        timestamp = int(time.time())
+        responses = {}  # (sequence, channel) -> response, or None when nothing is new
+        for subscriber in subscribers:
+            key = (subscriber.sequence, subscriber.channel)
+            if key not in responses:
+                try:
+                    rows = self.fetch_since(subscriber.sequence, MAX_INCREMENT, subscriber.channel)
+                except Exception as e:
+                    log.error("Error fetching stream update: %s", e)
+                    return
+                responses[key] = increment_response(rows, timestamp, subscriber.channel) if rows else None
+            response = responses[key]
+            if response is not None and subscriber.put(response):
+                # Only this thread advances the sequence once subscribed
+                subscriber.sequence = response.sequences[-1]
+
+    def _run(self):
+        while True:
+            due, pushed = [], False
+            try:
+                due, pushed = self._next_due()
+                if due:
+                    self._dispatch(due, pushed)
+            except Exception as e:
+                # One bad round must not stop every stream; the groups stay scheduled
+                log.error("Error in stream fan-out: %s", e)
+            if due and not pushed:
+                self._reschedule(due)
+
+    def _dispatch(self, due, pushed):
+        """Queue one round of updates to the subscribers of the due groups"""
+        windowed = [(interval_ms, [s for s in subscribers if s.sequence is None])
+                    for _, interval_ms, subscribers in due]
+        windowed = [(interval_ms, subscribers) for interval_ms, subscribers in windowed if subscribers]
+        if windowed:
+            with FANOUT_SECONDS.time("window"):
+                self._send_windows(windowed, pushed)
+        incremental = [s for _, _, subscribers in due for s in subscribers if s.sequence is not None]
+        if incremental:
+            with FANOUT_SECONDS.time("increment"):
+                self._send_increments(incremental)
+
+    def _reschedule(self, due):
+        """Put the timer-due groups back on the heap at their next tick"""
+        now = time.monotonic()
+        with self._cond:
+            for due_time, interval_ms, _ in due:
+                next_due = due_time + interval_ms / 1000
+                if next_due <= now:
+                    # Fell behind (slow query); skip missed ticks instead of bursting
+                    next_due = now + interval_ms / 1000
+                heapq.heappush(self._heap, (next_due, interval_ms))
@@ -0,0 +1,105 @@
+import logging
+import threading
+import time
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+# Rows after a sequence, newest first, together with the snapshot they were
+# read in: one statement, so the snapshot is the one the rows were read with.
+# Every row has the snapshot's xmin and xmax; with no rows there is one row of
+# just those.
+ROWS_WITH_SNAPSHOT = """
+    SELECT pg_snapshot_xmin(s)::text::bigint, pg_snapshot_xmax(s)::text::bigint, d.id, d.value, d.server
+    FROM pg_current_snapshot() AS s
+    LEFT JOIN LATERAL (
+        SELECT id, value, server FROM sensor_data
+        WHERE id > %s
+        ORDER BY id DESC
+        LIMIT %s
+    ) AS d ON true
+"""
+
+# Checkpoints held at once; past it the newest absorbs the next one
+MAX_PENDING = 1000
+
+
+def split_snapshot_rows(result):
+    """(xmin, xmax, rows of (id, value, channel) oldest first) of a ROWS_WITH_SNAPSHOT result"""
+    xmin, xmax = result[0][:2]
+    rows = [(record_id, value, channel) for _, _, record_id, value, channel in reversed(result)
+            if record_id is not None]
+    return xmin, xmax, rows
+
+
+class CommitWatermark:
+    """Highest sequence (sensor_data id) at or below which no row can still commit.
+
+    Ids are taken when a row is inserted but the row only becomes visible
+    when its transaction commits, so with concurrent writers a row can
+    commit after one with a higher id. An incremental stream that had moved
+    past the higher id would never be sent it; streams therefore only move
+    up to the watermark.
+
+    Each buffer sync reports the snapshot it read rows in with observe().
+    The newest id read becomes a checkpoint, released as the watermark once
+    every transaction in progress in that snapshot has ended: when a later
+    snapshot's xmin reaches the checkpoint's xmax, or at once when nothing
+    was in progress. A checkpoint held back for more than timeout seconds,
+    by a long transaction that may have nothing to do with sensor_data, is
+    released anyway.
+    """
+
+    def __init__(self, timeout=30.0):
+        self.timeout = timeout
+        self._value = 0
+        self._pending = deque()  # (sequence, xmax, observed at), oldest first
+        self._lock = threading.Lock()
+        self.timeouts = 0
+
+    @property
+    def value(self):
+        with self._lock:
+            return self._value
+
+    @property
+    def pending(self):
+        """True while a checkpoint waits for transactions to end; a sync may then move the watermark"""
+        with self._lock:
+            return bool(self._pending)
+
+    def observe(self, xmin, xmax, sequence=None):
+        """Report a snapshot and the newest id visible in it (None if no row was read); returns the watermark.
+
+        Call once the rows read in the snapshot are where readers of the
+        watermark will look for them.
+        """
+        now = time.monotonic()
+        with self._lock:
+            pending = self._pending
+            while pending and (pending[0][1] <= xmin or now - pending[0][2] > self.timeout):
+                checkpoint, checkpoint_xmax, _ = pending.popleft()
+                if checkpoint_xmax > xmin:
+                    self.timeouts += 1
+                    log.warning("Transactions older than %.0fs are still open; streams move past id %d without them",
+                                self.timeout, checkpoint)
+                self._value = max(self._value, checkpoint)
+            newest = pending[-1][0] if pending else self._value
+            if sequence is not None and sequence > newest:
+                if xmin == xmax:
+                    # Nothing was in progress, so every earlier id is final
+                    self._value = sequence
+                elif len(pending) >= MAX_PENDING:
+                    # Waiting for the newer xmax only ever releases later
+                    pending[-1] = (sequence, xmax, pending[-1][2])
+                else:
+                    pending.append((sequence, xmax, now))
+            return self._value
+
+    def stats(self):
+        with self._lock:
+            return {
+                "value": self._value,
+                "pending": len(self._pending),
+                "timeouts": self.timeouts
+            }
@@ -0,0 +1,69 @@
+import asyncio
+import os
+import sys
+
+# Añadir los módulos del backend al path; se prueban sin servidor
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'control', 'backend'))
+
+from bulk_upload import parse_records
+
+
+class BulkUploadLibrary:
+    """
+    Biblioteca para Robot Framework que prueba el análisis por trozos de los cuerpos de /send/bulk (bulk_upload.py)
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def parse_bulk_body(self, body, body_format, chunk_size=0, channel=''):
+        """
+        Analiza un cuerpo que llega en trozos de chunk_size bytes, cortando números y caracteres UTF-8
+
+        Args:
+            body: Cuerpo de la petición; \\n y \\r se escriben como en Robot
+            body_format: json, ndjson o csv
+            chunk_size: Bytes por trozo; 0 para el cuerpo en un solo trozo
+            channel: Canal de los registros que no indican uno
+
+        Returns:
+            list: Registros como "valor@canal"
+        """
+        data = body.encode()
+        size = int(chunk_size) or max(len(data), 1)
+
+        async def chunks():
+            for start in range(0, len(data), size):
+                yield data[start:start + size]
+
+        async def parse():
+            return [f"{value}@{record_channel}"
+                    async for value, record_channel in parse_records(chunks(), body_format, channel)]
+
+        self.records = asyncio.run(parse())
+        return self.records
+
+    def bulk_records_should_be(self, *expected):
+        """
+        Comprueba los registros del último cuerpo analizado
+
+        Args:
+            *expected: Registros esperados como "valor@canal"
+        """
+        if self.records != list(expected):
+            raise AssertionError(f"Parsed {self.records}, expected {list(expected)}")
+
+    def parsing_should_give_the_same_records_for_every_chunk_size(self, body, body_format, channel=''):
+        """
+        Comprueba que cualquier tamaño de trozo, hasta de un byte, da los mismos registros que el cuerpo entero
+
+        Args:
+            body: Cuerpo de la petición
+            body_format: json, ndjson o csv
+            channel: Canal de los registros que no indican uno
+        """
+        whole = self.parse_bulk_body(body, body_format, 0, channel)
+        for chunk_size in range(1, len(body.encode()) + 1):
+            records = self.parse_bulk_body(body, body_format, chunk_size, channel)
+            if records != whole:
+                raise AssertionError(f"Chunks of {chunk_size} bytes parsed {records}, whole body {whole}")
@@ -0,0 +1,72 @@
+import os
+import sys
+
+# Añadir los módulos del servidor gRPC al path; se prueban sin servidor ni base de datos
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'control', 'grpc'))
+
+import numpy as np
+
+from downsampling import lttb, point_budget
+
+
+class DownsamplingLibrary:
+    """
+    Biblioteca para Robot Framework que prueba la reducción de puntos del histórico (downsampling.py)
+    """
+
+    def __init__(self):
+        self.x = None
+        self.y = None
+
+    def create_series(self, length, spike_at=None):
+        """
+        Crea una serie plana de valores 0 con un instante por segundo
+
+        Args:
+            length: Número de puntos
+            spike_at: Índice de un punto con valor 100; ninguno si no se indica
+        """
+        self.x = np.arange(int(length), dtype=np.float64)
+        self.y = np.zeros(int(length))
+        if spike_at is not None:
+            self.y[int(spike_at)] = 100
+
+    def lttb_indices(self, threshold):
+        """
+        Índices que LTTB conserva de la serie
+
+        Args:
+            threshold: Número de puntos pedidos
+
+        Returns:
+            list: Índices en orden creciente
+        """
+        return [int(index) for index in lttb(self.x, self.y, int(threshold))]
+
+    def lttb_indices_should_be_bounded(self, threshold):
+        """
+        Comprueba que LTTB devuelve el presupuesto exacto, sin repetir puntos y con los extremos de la serie
+
+        Args:
+            threshold: Número de puntos pedidos, menor que la longitud de la serie
+        """
+        indices = self.lttb_indices(threshold)
+        if len(indices) != int(threshold):
+            raise AssertionError(f"LTTB kept {len(indices)} points, expected {threshold}")
+        if indices[0] != 0 or indices[-1] != len(self.x) - 1:
+            raise AssertionError(f"LTTB dropped an end of the series: {indices}")
+        if any(a >= b for a, b in zip(indices, indices[1:])):
+            raise AssertionError(f"LTTB indices are not strictly increasing: {indices}")
+
+    def point_budget_should_be(self, max_points, aggregation, expected):
+        """
+        Comprueba los puntos a los que se reduce un rango
+
+        Args:
+            max_points: max_points de la petición
+            aggregation: minmax, avg o lttb
+            expected: Presupuesto esperado
+        """
+        budget = point_budget(int(max_points), aggregation)
+        if budget != int(expected):
+            raise AssertionError(f"Point budget of {max_points} for {aggregation} is {budget}, expected {expected}")
@@ -0,0 +1,129 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+# Añadir los módulos del backend al path; se prueban sin servidor ni base de datos
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'control', 'backend'))
+
+import pyarrow.parquet as pq
+import zstandard
+
+from export import export_query, export_rows, media_type
+
+START = datetime(2024, 1, 1)
+
+
+class ExportLibrary:
+    """
+    Biblioteca para Robot Framework que prueba la codificación de las exportaciones de /history/export (export.py)
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.parts = []
+        self.export_format = None
+        self.compression = None
+
+    def export_generated_rows(self, count, export_format, compression='none', chunk_rows=100):
+        """
+        Exporta filas generadas, entregadas en trozos como desde el cursor del servidor
+
+        La fila i tiene id i, un instante i segundos después de 2024-01-01,
+        el valor i * 10 y el canal a o b alternados.
+
+        Args:
+            count: Número de filas
+            export_format: csv, ndjson o parquet
+            compression: none, gzip o zstd
+            chunk_rows: Filas por trozo
+        """
+        count, chunk_rows = int(count), int(chunk_rows)
+        self.rows = [(i, START + timedelta(seconds=i), i * 10, "ab"[i % 2]) for i in range(1, count + 1)]
+        self.export_format, self.compression = export_format, compression
+
+        async def chunks():
+            for start in range(0, count, chunk_rows):
+                yield self.rows[start:start + chunk_rows]
+
+        async def export():
+            return [part async for part in export_rows(chunks(), export_format, compression)]
+
+        self.parts = asyncio.run(export())
+
+    def _data(self):
+        data = b"".join(self.parts)
+        if self.export_format == "parquet" or self.compression == "none":
+            return data
+        if self.compression == "gzip":
+            return gzip.decompress(data)
+        return zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)).read()
+
+    def exported_rows(self):
+        """
+        Filas de la última exportación, decodificadas del archivo
+
+        Returns:
+            list: Filas como (id, instante, valor, canal)
+        """
+        data = self._data()
+        if self.export_format == "csv":
+            reader = csv.reader(io.StringIO(data.decode()))
+            header = next(reader)
+            if header != ["id", "timestamp", "value", "channel"]:
+                raise AssertionError(f"Unexpected CSV header {header}")
+            return [(int(row_id), datetime.fromisoformat(timestamp), int(value), channel)
+                    for row_id, timestamp, value, channel in reader]
+        if self.export_format == "ndjson":
+            return [(item["id"], datetime.fromisoformat(item["timestamp"]), item["value"], item["channel"])
+                    for item in map(json.loads, data.decode().splitlines())]
+        table = pq.read_table(io.BytesIO(data))
+        return list(zip(*(table.column(name).to_pylist() for name in ("id", "timestamp", "value", "channel"))))
+
+    def exported_rows_should_match(self):
+        """
+        Comprueba que el archivo exportado contiene exactamente las filas generadas
+        """
+        rows = self.exported_rows()
+        if rows != self.rows:
+            raise AssertionError(f"Export holds {len(rows)} rows that differ from the {len(self.rows)} generated")
+
+    def parquet_row_groups_should_be(self, expected):
+        """
+        Comprueba el número de grupos de filas del Parquet exportado, uno por trozo
+
+        Args:
+            expected: Grupos esperados
+        """
+        groups = pq.ParquetFile(io.BytesIO(self._data())).num_row_groups
+        if groups != int(expected):
+            raise AssertionError(f"Parquet file has {groups} row groups, expected {expected}")
+
+    def export_parts_should_be_at_least(self, expected):
+        """
+        Comprueba que la exportación salió en varias partes en lugar de en un solo bloque al final
+
+        Args:
+            expected: Número mínimo de partes
+        """
+        if len(self.parts) < int(expected):
+            raise AssertionError(f"Export came in {len(self.parts)} parts, expected at least {expected}")
+
+    def export_media_type(self, export_format, compression='none'):
+        """
+        Content-Type y extensión de una exportación
+
+        Returns:
+            str: "tipo extensión"
+        """
+        return " ".join(media_type(export_format, compression))
+
+    def build_export_query(self, time_range='all', channel=''):
+        """
+        Construye la consulta de una exportación, para comprobar sus validaciones
+        """
+        return export_query(time_range, channel=channel)
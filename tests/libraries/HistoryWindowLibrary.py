@@ -0,0 +1,155 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+# Añadir los módulos del servidor gRPC al path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'control', 'grpc'))
+
+import psycopg2
+
+from downsampling import downsample, window_query
+
+
+class HistoryWindowLibrary:
+    """
+    Biblioteca para Robot Framework que prueba el rango de timeRange=all y su reducción (downsampling.py)
+
+    Trabaja sobre tablas temporales con los nombres de sensor_data y sus rollups,
+    que ocultan las reales durante la sesión sin tocar sus datos.
+    """
+
+    # Una conexión, y con ella las tablas temporales, para toda la suite
+    ROBOT_LIBRARY_SCOPE = 'SUITE'
+
+    def __init__(self):
+        self.conn = None
+        self.window = None
+
+    def connect_to_history_database(self, db_name, db_user, db_password, db_host, db_port):
+        """
+        Conecta a PostgreSQL y crea tablas temporales vacías
+
+        Args:
+            db_name: Nombre de la base de datos
+            db_user: Usuario
+            db_password: Contraseña
+            db_host: Host
+            db_port: Puerto
+        """
+        self.conn = psycopg2.connect(dbname=db_name, user=db_user, password=db_password, host=db_host,
+                                     port=db_port)
+        self.conn.autocommit = True
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            CREATE TEMP TABLE sensor_data (
+                id BIGINT PRIMARY KEY,
+                value INTEGER NOT NULL,
+                timestamp TIMESTAMP NOT NULL,
+                server VARCHAR(100)
+            )
+        """)
+        for table in ("sensor_data_1m", "sensor_data_1h"):
+            cursor.execute(f"""
+                CREATE TEMP TABLE {table} (
+                    bucket TIMESTAMP NOT NULL,
+                    server VARCHAR(100) NOT NULL,
+                    count BIGINT NOT NULL,
+                    min INTEGER NOT NULL,
+                    max INTEGER NOT NULL,
+                    sum BIGINT NOT NULL,
+                    PRIMARY KEY (bucket, server)
+                )
+            """)
+
+    def disconnect_from_history_database(self):
+        """
+        Cierra la conexión; las tablas temporales desaparecen con ella
+        """
+        if self.conn is not None:
+            self.conn.close()
+
+    def clear_history(self):
+        """
+        Vacía las tablas temporales
+        """
+        self.conn.cursor().execute("TRUNCATE sensor_data, sensor_data_1m, sensor_data_1h")
+
+    def insert_hourly_rollups(self, hours, channel='main-server'):
+        """
+        Inserta un rollup por hora, terminando en la hora actual, con el valor 10 por muestra
+
+        Args:
+            hours: Número de horas
+            channel: Canal de los rollups
+        """
+        newest = datetime.now().replace(minute=0, second=0, microsecond=0)
+        rows = [(newest - timedelta(hours=hour), channel) for hour in range(int(hours))]
+        self.conn.cursor().executemany("""
+            INSERT INTO sensor_data_1h (bucket, server, count, min, max, sum) VALUES (%s, %s, 6, 10, 10, 60)
+        """, rows)
+
+    def insert_raw_rows(self, count, channel='main-server'):
+        """
+        Inserta filas en bruto, una por segundo hasta ahora
+
+        Args:
+            count: Número de filas
+            channel: Canal de las filas
+        """
+        now = datetime.now()
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM sensor_data")
+        first = cursor.fetchone()[0] + 1
+        rows = [(first + i, 10, now - timedelta(seconds=i), channel) for i in range(int(count))]
+        cursor.executemany("INSERT INTO sensor_data (id, value, timestamp, server) VALUES (%s, %s, %s, %s)", rows)
+
+    def read_history_window(self, channel=''):
+        """
+        Lee el inicio y el fin de timeRange=all
+
+        Args:
+            channel: Canal; vacío para todos
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(*window_query("all", None, channel))
+        self.window = cursor.fetchone()
+
+    def history_window_should_cover_hours(self, hours):
+        """
+        Comprueba que el rango cubre exactamente las horas indicadas, del inicio del primer rollup al fin del último
+
+        Args:
+            hours: Horas esperadas
+        """
+        start, end = self.window
+        if start is None or end is None:
+            raise AssertionError(f"History window is {self.window}")
+        if end - start != timedelta(hours=int(hours)):
+            raise AssertionError(f"History window spans {end - start}, expected {hours} hours")
+
+    def history_window_should_be_empty(self):
+        """
+        Comprueba que el rango no tiene inicio ni fin
+        """
+        if self.window != (None, None):
+            raise AssertionError(f"History window is {self.window}, expected no data")
+
+    def downsampled_history_should_come_from(self, resolution, max_points, aggregation='avg', channel=''):
+        """
+        Reduce el rango leído y comprueba de qué tabla salen los puntos
+
+        Args:
+            resolution: Resolución esperada (1h, 1m o raw)
+            max_points: Presupuesto de puntos
+            aggregation: minmax, avg o lttb
+            channel: Canal; vacío para todos
+        """
+        start, end = self.window
+        reduced = downsample(self.conn.cursor(), start, end, int(max_points), aggregation, channel)
+        if reduced is None:
+            raise AssertionError("History was not downsampled")
+        points, used = reduced
+        if used != resolution:
+            raise AssertionError(f"History came from {used}, expected {resolution}")
+        if not points or len(points) > int(max_points):
+            raise AssertionError(f"Downsampling returned {len(points)} points for a budget of {max_points}")
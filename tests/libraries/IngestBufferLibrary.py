@@ -0,0 +1,133 @@
+import os
+import sys
+import threading
+
+# Añadir los módulos del servidor gRPC al path; se prueban sin servidor ni base de datos
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'control', 'grpc'))
+
+from ingest_buffer import IngestBuffer
+
+
+class IngestBufferLibrary:
+    """
+    Biblioteca para Robot Framework que prueba los commits en grupo del buffer de escritura (ingest_buffer.py)
+
+    El flush de prueba guarda cada grupo en memoria y asigna ids consecutivos
+    desde 1, como la secuencia de sensor_data.
+    """
+
+    def __init__(self):
+        self.buffer = None
+        self.groups = []
+        self.futures = []
+        self.fail = False
+        self.release = threading.Event()
+
+    def _flush(self, values):
+        self.release.wait(10)
+        if self.fail:
+            raise RuntimeError("database unavailable")
+        first = sum(len(group) for group in self.groups) + 1
+        self.groups.append(list(values))
+        return list(range(first, first + len(values)))
+
+    def create_ingest_buffer(self, max_rows, max_delay_ms, capacity=10000):
+        """
+        Crea un buffer cuyo flush guarda los grupos en memoria
+
+        Args:
+            max_rows: Filas máximas por grupo
+            max_delay_ms: Espera máxima de la fila más antigua
+            capacity: Filas que caben antes de que submit() se bloquee
+        """
+        self.groups = []
+        self.futures = []
+        self.fail = False
+        self.release.set()
+        self.buffer = IngestBuffer(self._flush, max_rows=int(max_rows), max_delay_ms=int(max_delay_ms),
+                                   capacity=int(capacity))
+
+    def hold_flushes(self):
+        """
+        Bloquea el flush en curso y los siguientes, como una base de datos lenta
+        """
+        self.release.clear()
+
+    def release_flushes(self):
+        """
+        Deja continuar los flushes bloqueados
+        """
+        self.release.set()
+
+    def fail_flushes(self):
+        """
+        Hace que los siguientes flushes fallen
+        """
+        self.fail = True
+
+    def submit_values(self, count, wait_for_commit=True, timeout=30):
+        """
+        Encola los valores 1..count en orden
+
+        Args:
+            count: Número de valores
+            wait_for_commit: Si se guarda un Future del id de cada fila
+            timeout: Segundos que submit() espera con el buffer lleno
+        """
+        for value in range(1, int(count) + 1):
+            future = self.buffer.submit(value, wait_for_commit=wait_for_commit, timeout=float(timeout))
+            if future is not None:
+                self.futures.append(future)
+
+    def committed_ids_should_be_in_order(self):
+        """
+        Espera a los commits y comprueba que cada fila recibió su id, en el orden de envío
+        """
+        ids = [future.result(timeout=10) for future in self.futures]
+        expected = list(range(1, len(ids) + 1))
+        if ids != expected:
+            raise AssertionError(f"Rows got ids {ids}, expected {expected}")
+
+    def commits_should_fail(self, message):
+        """
+        Espera a los commits y comprueba que todos fallaron con el error del flush
+
+        Args:
+            message: Mensaje de error esperado
+        """
+        for future in self.futures:
+            error = future.exception(timeout=10)
+            if error is None or str(error) != message:
+                raise AssertionError(f"Commit ended with {error!r}, expected the error '{message}'")
+
+    def close_ingest_buffer(self):
+        """
+        Cierra el buffer y espera a que se guarde lo encolado
+        """
+        self.release.set()
+        if self.buffer is not None:
+            self.buffer.close(timeout=10)
+
+    def group_sizes_should_be(self, *expected):
+        """
+        Comprueba el tamaño de cada grupo guardado, en orden
+
+        Args:
+            *expected: Tamaños esperados
+        """
+        sizes = [len(group) for group in self.groups]
+        expected = [int(size) for size in expected]
+        if sizes != expected:
+            raise AssertionError(f"Groups of {sizes}, expected {expected}")
+
+    def ingest_stat_should_be(self, name, expected):
+        """
+        Comprueba un valor de stats() del buffer
+
+        Args:
+            name: Nombre del valor (flushes, rows_flushed, rows_failed, buffer_depth...)
+            expected: Valor esperado
+        """
+        value = self.buffer.stats()[name]
+        if value != int(expected):
+            raise AssertionError(f"Ingest buffer {name} is {value}, expected {expected}")
@@ -0,0 +1,82 @@
+import os
+import sys
+
+# Añadir los módulos del servidor gRPC al path; se prueban sin servidor ni base de datos
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'control', 'grpc'))
+
+from latest_buffer import LatestValuesBuffer
+
+
+class LatestBufferLibrary:
+    """
+    Biblioteca para Robot Framework que prueba el buffer de últimos valores (latest_buffer.py)
+    """
+
+    def __init__(self):
+        self.buffer = None
+
+    def create_latest_buffer(self, depth):
+        """
+        Crea un buffer vacío
+
+        Args:
+            depth: Número de muestras que guarda el buffer
+        """
+        self.buffer = LatestValuesBuffer(int(depth))
+
+    def extend_latest_buffer(self, *ids, channel='main-server'):
+        """
+        Añade filas al buffer, una llamada a extend() por id y en el orden dado.
+        El valor de cada fila es su id multiplicado por 10.
+
+        Args:
+            *ids: Ids de las filas, en el orden en que se confirman
+            channel: Canal de las filas
+        """
+        for record_id in ids:
+            record_id = int(record_id)
+            self.buffer.extend([(record_id, record_id * 10, channel)])
+
+    def latest_buffer_ids(self, channel=None):
+        """
+        Ids guardados en el buffer, del más antiguo al más reciente
+
+        Args:
+            channel: Canal de las filas; todos si no se indica
+
+        Returns:
+            list: Ids, comprobando además que cada valor corresponde a su id
+        """
+        rows = self.buffer.latest_rows(self.buffer.stats()['size'], channel) or []
+        for record_id, value in rows:
+            if value != record_id * 10:
+                raise AssertionError(f"Row {record_id} holds value {value}")
+        return [record_id for record_id, _ in rows]
+
+    def latest_buffer_ids_should_be(self, *expected):
+        """
+        Comprueba los ids guardados en el buffer, del más antiguo al más reciente
+
+        Args:
+            *expected: Ids esperados
+        """
+        ids = self.latest_buffer_ids()
+        expected = [int(record_id) for record_id in expected]
+        if ids != expected:
+            raise AssertionError(f"Buffer holds ids {ids}, expected {expected}")
+
+    def latest_buffer_ids_since(self, sequence, limit=100, until=None):
+        """
+        Ids posteriores a una secuencia, como los recibe un stream incremental
+
+        Args:
+            sequence: Última secuencia recibida
+            limit: Número máximo de filas
+            until: Id máximo, la marca de agua de commits; sin límite si no se indica
+
+        Returns:
+            list: Ids, o None si el buffer ya no puede responder
+        """
+        until = None if until is None else int(until)
+        rows = self.buffer.since(int(sequence), int(limit), until=until)
+        return None if rows is None else [record_id for record_id, _ in rows]
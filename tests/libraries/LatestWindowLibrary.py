@@ -0,0 +1,104 @@
+import asyncio
+import os
+import sys
+
+# Añadir los módulos del backend al path; se prueban sin servidor ni base de datos
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'control', 'backend'))
+
+from latest_window import LatestWindow
+
+
+class FakeDatabase:
+    """Base de datos en memoria: fetchall() devuelve las filas dadas, como (id, value) de más nueva a más antigua"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def fetchall(self, query, params=None):
+        return self.rows
+
+
+def _pairs(items):
+    """Pares (secuencia, valor) de argumentos "secuencia:valor" """
+    pairs = []
+    for item in items:
+        sequence, value = str(item).split(":")
+        pairs.append((int(sequence), int(value)))
+    return pairs
+
+
+class LatestWindowLibrary:
+    """
+    Biblioteca para Robot Framework que prueba la ventana de últimos valores de los WebSocket (latest_window.py)
+    """
+
+    def __init__(self):
+        self.window = None
+
+    def create_latest_window(self, size):
+        """
+        Crea una ventana vacía
+
+        Args:
+            size: Número de valores que guarda
+        """
+        self.window = LatestWindow(int(size))
+
+    def add_from_send(self, sequence, value):
+        """
+        Añade un valor como lo hace /send, con el id que devolvió SendData
+
+        Args:
+            sequence: Secuencia del valor
+            value: Valor
+
+        Returns:
+            bool: Si la ventana cambió, es decir, si hay algo que difundir
+        """
+        return self.window.add([(int(sequence), int(value))])
+
+    def add_from_stream(self, *items):
+        """
+        Añade una actualización incremental del stream gRPC
+
+        Args:
+            *items: Valores como "secuencia:valor", del más antiguo al más nuevo
+
+        Returns:
+            bool: Si la ventana cambió
+        """
+        return self.window.add(_pairs(items))
+
+    def refresh_from_database(self, *items):
+        """
+        Mezcla las filas más nuevas de la base de datos, como tras una carga que no pasó por add()
+
+        Args:
+            *items: Filas como "secuencia:valor", de la más nueva a la más antigua
+
+        Returns:
+            bool: Si la ventana cambió
+        """
+        return asyncio.run(self.window.refresh(FakeDatabase(_pairs(items))))
+
+    def window_values_should_be(self, *expected):
+        """
+        Comprueba los valores de la ventana, del más nuevo al más antiguo
+
+        Args:
+            *expected: Valores esperados
+        """
+        values = self.window.values()
+        expected = [int(value) for value in expected]
+        if values != expected:
+            raise AssertionError(f"Window holds {values}, expected {expected}")
+
+    def window_sequence_should_be(self, expected):
+        """
+        Comprueba la secuencia del valor más nuevo
+
+        Args:
+            expected: Secuencia esperada
+        """
+        if self.window.sequence != int(expected):
+            raise AssertionError(f"Window sequence is {self.window.sequence}, expected {expected}")
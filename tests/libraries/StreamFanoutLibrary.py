@@ -0,0 +1,149 @@
+import os
+import queue
+import sys
+
+# Añadir los módulos del servidor gRPC al path; se prueban sin servidor ni base de datos
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'control', 'grpc'))
+
+from stream_fanout import StreamFanout, Subscriber
+
+
+class FailingSubscriber(Subscriber):
+    """Suscriptor cuyo put() falla las primeras veces, como un error inesperado en el hilo de fan-out"""
+
+    failures = 0
+
+    def put(self, update):
+        if FailingSubscriber.failures > 0:
+            FailingSubscriber.failures -= 1
+            raise RuntimeError("unexpected error")
+        return super().put(update)
+
+
+class StreamFanoutLibrary:
+    """
+    Biblioteca para Robot Framework que prueba las colas acotadas de StreamData y el hilo de fan-out (stream_fanout.py)
+    """
+
+    def __init__(self):
+        self.subscriber = None
+        self.next_update = 1
+        self.fanout = None
+
+    def create_subscriber(self, max_queued, overflow, incremental=False):
+        """
+        Crea un suscriptor con una cola vacía
+
+        Args:
+            max_queued: Número máximo de actualizaciones en cola
+            overflow: Política cuando la cola está llena (drop_oldest, coalesce o disconnect)
+            incremental: Si el suscriptor recibe filas por secuencia en lugar de la ventana
+        """
+        self.subscriber = Subscriber("robot-client", 1000, max_queued=int(max_queued), overflow=overflow)
+        if incremental:
+            self.subscriber.sequence = 0
+        self.next_update = 1
+
+    def put_updates(self, count):
+        """
+        Encola actualizaciones numeradas desde 1, como hace el hilo de fan-out
+
+        Args:
+            count: Número de actualizaciones
+
+        Returns:
+            int: Cuántas se encolaron
+        """
+        queued = 0
+        for _ in range(int(count)):
+            if self.subscriber.put(self.next_update):
+                queued += 1
+            self.next_update += 1
+        return queued
+
+    def take_queued_updates(self):
+        """
+        Vacía la cola como lo haría la RPC
+
+        Returns:
+            list: Actualizaciones en orden; END marca el fin del stream
+        """
+        updates = []
+        while True:
+            try:
+                update = self.subscriber.get(timeout=0)
+            except queue.Empty:
+                return updates
+            updates.append("END" if update is None else update)
+
+    def queued_updates_should_be(self, *expected):
+        """
+        Vacía la cola y comprueba su contenido
+
+        Args:
+            *expected: Actualizaciones esperadas en orden; END para el fin del stream
+        """
+        updates = self.take_queued_updates()
+        expected = [item if item == "END" else int(item) for item in expected]
+        if updates != expected:
+            raise AssertionError(f"Subscriber queued {updates}, expected {expected}")
+
+    def subscriber_counter_should_be(self, name, expected):
+        """
+        Comprueba un contador de stats() del suscriptor
+
+        Args:
+            name: Nombre del contador (queued, sent, dropped, coalesced, deferred)
+            expected: Valor esperado
+        """
+        value = self.subscriber.stats()[name]
+        if value != int(expected):
+            raise AssertionError(f"Subscriber {name} is {value}, expected {expected}")
+
+    def subscriber_should_be_disconnected(self):
+        """
+        Comprueba que el suscriptor se desconectó por quedarse atrás
+        """
+        if self.subscriber.active or not self.subscriber.overflowed:
+            raise AssertionError("Subscriber is still connected")
+
+    def start_fanout(self, failing_puts=0):
+        """
+        Crea un fan-out que lee siempre la misma ventana, sin base de datos
+
+        Args:
+            failing_puts: Número de put() que fallan antes de funcionar
+        """
+        FailingSubscriber.failures = int(failing_puts)
+        self.fanout = StreamFanout(lambda limit, channel: list(range(limit, 0, -1)),
+                                   subscriber_class=FailingSubscriber)
+
+    def subscribe_to_fanout(self, interval_ms):
+        """
+        Suscribe un cliente al fan-out
+
+        Args:
+            interval_ms: Intervalo de actualización del cliente
+        """
+        self.subscriber = self.fanout.subscribe("robot-client", int(interval_ms))
+
+    def subscriber_should_receive_a_window(self, timeout=5):
+        """
+        Espera la siguiente ventana del fan-out
+
+        Args:
+            timeout: Segundos de espera
+        """
+        try:
+            update = self.subscriber.get(timeout=float(timeout))
+        except queue.Empty:
+            raise AssertionError(f"No update in {timeout}s")
+        if update is None or not update.valores:
+            raise AssertionError(f"Unexpected update {update!r}")
+
+    def stop_fanout(self):
+        """
+        Da de baja al cliente del fan-out
+        """
+        if self.fanout is not None and self.subscriber is not None:
+            self.fanout.unsubscribe(self.subscriber)
@@ -0,0 +1,50 @@
+import os
+import sys
+
+# Añadir los módulos del servidor gRPC al path; se prueban sin servidor ni base de datos
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'control', 'grpc'))
+
+from watermark import CommitWatermark
+
+
+class WatermarkLibrary:
+    """
+    Biblioteca para Robot Framework que prueba la marca de agua de commits (watermark.py)
+    """
+
+    def __init__(self):
+        self.watermark = None
+
+    def create_commit_watermark(self, timeout=30):
+        """
+        Crea una marca de agua en 0
+
+        Args:
+            timeout: Segundos tras los que se deja de esperar a una transacción abierta
+        """
+        self.watermark = CommitWatermark(float(timeout))
+
+    def observe_snapshot(self, xmin, xmax, sequence=None):
+        """
+        Informa de un snapshot y del id más reciente leído en él
+
+        Args:
+            xmin: Transacción más antigua en curso en el snapshot
+            xmax: Primera transacción aún no asignada en el snapshot
+            sequence: Id más reciente leído; None si no se leyó ninguna fila
+
+        Returns:
+            int: La marca de agua resultante
+        """
+        sequence = None if sequence is None else int(sequence)
+        return self.watermark.observe(int(xmin), int(xmax), sequence)
+
+    def commit_watermark_should_be(self, expected):
+        """
+        Comprueba el valor de la marca de agua
+
+        Args:
+            expected: Valor esperado
+        """
+        if self.watermark.value != int(expected):
+            raise AssertionError(f"Watermark is {self.watermark.value}, expected {expected}")
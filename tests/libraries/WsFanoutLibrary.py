@@ -0,0 +1,162 @@
+import asyncio
+import json
+import os
+import sys
+
+# Añadir los módulos del backend al path; se prueban sin servidor ni navegador
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'control', 'backend'))
+
+from ws_fanout import ConnectionManager
+
+
+class FakeWebSocket:
+    """WebSocket en memoria: guarda lo enviado y el código de cierre"""
+
+    def __init__(self, stalled=False, broken=False):
+        self.received = []
+        self.close_code = None
+        self.broken = broken
+        self.released = asyncio.Event()
+        if not stalled:
+            self.released.set()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        if self.broken:
+            raise ConnectionResetError("connection reset")
+        await self.released.wait()
+        self.received.append(json.loads(text)["n"])
+
+    async def close(self, code=1000):
+        self.close_code = code
+
+
+class WsFanoutLibrary:
+    """
+    Biblioteca para Robot Framework que prueba las colas por cliente de los WebSocket del backend (ws_fanout.py)
+
+    Las tareas de envío avanzan solo dentro de las palabras clave que dejan
+    correr el bucle de eventos, así que los mensajes difundidos se acumulan
+    en las colas hasta Let Clients Send.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.manager = None
+        self.sockets = {}
+        self.next_update = 1
+
+    def create_connection_manager(self, max_queued, overflow, send_timeout=10):
+        """
+        Crea un gestor sin clientes y un bucle de eventos para sus tareas
+
+        Args:
+            max_queued: Mensajes máximos en la cola de cada cliente
+            overflow: Política cuando la cola está llena (drop_oldest, coalesce o disconnect)
+            send_timeout: Segundos que puede tardar un envío antes de expulsar al cliente
+        """
+        self.close_loop()
+        self.loop = asyncio.new_event_loop()
+        self.manager = ConnectionManager(int(max_queued), overflow, float(send_timeout))
+        self.sockets = {}
+        self.next_update = 1
+
+    def close_loop(self):
+        """
+        Cancela las tareas de envío pendientes y cierra el bucle de eventos
+        """
+        if self.loop is None:
+            return
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            self.loop.run_until_complete(asyncio.wait(tasks))
+        self.loop.close()
+        self.loop = None
+
+    def connect_client(self, name, stalled=False, broken=False):
+        """
+        Conecta un cliente con un WebSocket en memoria
+
+        Args:
+            name: Nombre del cliente en las demás palabras clave
+            stalled: Si sus envíos se bloquean, como un navegador que no lee
+            broken: Si sus envíos fallan como una conexión cortada
+        """
+        websocket = FakeWebSocket(stalled=stalled, broken=broken)
+        self.sockets[name] = websocket
+        self.loop.run_until_complete(self.manager.connect(websocket))
+
+    def broadcast_updates(self, count):
+        """
+        Difunde actualizaciones numeradas desde 1 sin dejar correr las tareas de envío entre ellas
+
+        Args:
+            count: Número de actualizaciones
+        """
+        async def broadcast():
+            for _ in range(int(count)):
+                await self.manager.broadcast({"n": self.next_update})
+                self.next_update += 1
+
+        self.loop.run_until_complete(broadcast())
+
+    def let_clients_send(self, seconds=0.05):
+        """
+        Deja correr las tareas de envío
+
+        Args:
+            seconds: Tiempo que corre el bucle de eventos
+        """
+        self.loop.run_until_complete(asyncio.sleep(float(seconds)))
+
+    def client_should_have_received(self, name, *expected):
+        """
+        Comprueba las actualizaciones que llegaron a un cliente, en orden
+
+        Args:
+            name: Nombre del cliente
+            *expected: Números de actualización esperados
+        """
+        received = self.sockets[name].received
+        expected = [int(update) for update in expected]
+        if received != expected:
+            raise AssertionError(f"Client {name} received {received}, expected {expected}")
+
+    def client_should_be_evicted(self, name):
+        """
+        Comprueba que un cliente se expulsó: cerrado con el código 1013 y fuera del gestor
+
+        Args:
+            name: Nombre del cliente
+        """
+        websocket = self.sockets[name]
+        if websocket in self.manager.active_connections:
+            raise AssertionError(f"Client {name} is still connected")
+        if websocket.close_code != 1013:
+            raise AssertionError(f"Client {name} closed with code {websocket.close_code}, expected 1013")
+
+    def client_should_be_removed(self, name):
+        """
+        Comprueba que un cliente ya no está en el gestor
+
+        Args:
+            name: Nombre del cliente
+        """
+        if self.sockets[name] in self.manager.active_connections:
+            raise AssertionError(f"Client {name} is still connected")
+
+    def fanout_stat_should_be(self, name, expected):
+        """
+        Comprueba un valor de stats() del gestor
+
+        Args:
+            name: Nombre del valor (connections, queued, messages_sent, messages_dropped, messages_coalesced, evictions)
+            expected: Valor esperado
+        """
+        value = self.manager.stats()[name]
+        if value != int(expected):
+            raise AssertionError(f"WebSocket {name} is {value}, expected {expected}")
@@ -88,6 +88,7 @@ services:
     volumes:
       - ./tests:/app/tests # Host: project_root/tests, Container: /app/tests
       - ./tests/results:/app/tests/results # Host: project_root/tests/results, Container: /app/tests/results
+      - ./control:/app/control # Sources imported by the libraries and the unit test suites
     networks:
       gateway_network: # Make sure this network is defined in your main podman-compose.yml
         ipv4_address: 172.90.0.50